@@ -0,0 +1,84 @@
+"""
+Per-request cost of the API rate limiter for each storage backend.
+
+Every hit does what slowapi does for a limited route: build the composite
+key and increment its fixed window. `--workers` processes hit the same
+storage at once, as uvicorn workers on one host would; an in-memory storage
+is private to each of them. Keys are spread over `--clients` clients so
+windows are mostly reused, like real traffic.
+
+Usage:
+    python -m benchmarks.bench_api_limiter --hits 20000 --workers 1 4
+    RATE_LIMIT_BENCH_REDIS_URL=redis://localhost:6379 \\
+        python -m benchmarks.bench_api_limiter
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from statistics import mean
+from types import SimpleNamespace
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from ratelimit import composite_key
+
+LIMIT = parse("1000000/minute")
+KEY = composite_key(["ip", "api_key", "transaction"])
+
+
+def hit_loop(uri: str, hits: int, clients: int) -> float:
+    """Microseconds per hit in one worker process"""
+    limiter = FixedWindowRateLimiter(storage_from_string(uri))
+    requests = [
+        # Just the parts of a Request the key function reads
+        SimpleNamespace(
+            headers={"x-api-key": f"key-{i}"},
+            _json={"transaction_id": f"transaction-{i}"},
+            client=SimpleNamespace(host=f"10.0.{i // 256}.{i % 256}"),
+        )
+        for i in range(clients)
+    ]
+    start = time.perf_counter()
+    for i in range(hits):
+        limiter.hit(LIMIT, KEY(requests[i % clients]))
+    return (time.perf_counter() - start) / hits * 1e6
+
+
+def bench(uri: str, hits: int, clients: int, workers: int) -> float:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        per_hit = pool.map(
+            hit_loop, [uri] * workers, [hits] * workers, [clients] * workers
+        )
+        return mean(per_hit)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hits", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        uris = {
+            "memory": "memory://",
+            "sqlite": f"sqlite://{os.path.join(directory, 'limits.sqlite3')}",
+        }
+        if "RATE_LIMIT_BENCH_REDIS_URL" in os.environ:
+            uris["redis"] = os.environ["RATE_LIMIT_BENCH_REDIS_URL"]
+
+        print(f"{args.hits} hits per worker over {args.clients} clients")
+        print(f"{'storage':>8} {'workers':>8} {'us/hit':>8}")
+        for name, uri in uris.items():
+            for workers in args.workers:
+                per_hit = bench(uri, args.hits, args.clients, workers)
+                print(f"{name:>8} {workers:>8} {per_hit:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compare sync and async client throughput against the local fake upstream.
+
+The sync client runs on a 40 thread pool, the same size as Starlette's default
+threadpool that used to serve our sync handlers. The async client runs every
+turn on a single event loop.
+
+Keep the upstream latency realistic (hundreds of milliseconds). Against a
+near-instant upstream both clients are bound by client-side CPU, mostly the
+httpx connection pool bookkeeping, and the comparison stops saying anything
+about blocking.
+
+Usage:
+    python -m benchmarks.bench_async_client --turns 400 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_openai import run_fake_openai
+from openai_client import AsyncOpenAIClient, OpenAIClient
+
+STARLETTE_THREADPOOL_SIZE = 40
+MESSAGES = [{"role": "user", "content": "Hi, my order is broken"}]
+
+
+def bench_sync(base_url: str, turns: int) -> float:
+    client = OpenAIClient(api_key="fake", base_url=base_url)
+
+    def turn(_: int) -> None:
+        client.is_offensive_content("Hi, my order is broken")
+        client.create_chat_completion(messages=MESSAGES)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=STARLETTE_THREADPOOL_SIZE) as pool:
+        list(pool.map(turn, range(turns)))
+    return time.perf_counter() - start
+
+
+async def bench_async(base_url: str, turns: int, concurrency: int) -> float:
+    client = AsyncOpenAIClient(api_key="fake", base_url=base_url)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def turn() -> None:
+        async with semaphore:
+            await client.is_offensive_content("Hi, my order is broken")
+            await client.create_chat_completion(messages=MESSAGES)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(turn() for _ in range(turns)))
+    elapsed = time.perf_counter() - start
+    await client.client.close()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with run_fake_openai(latency=args.latency) as base_url:
+        sync_elapsed = bench_sync(base_url, args.turns)
+        async_elapsed = asyncio.run(
+            bench_async(base_url, args.turns, args.concurrency)
+        )
+
+    print(f"upstream latency: {args.latency * 1000:.0f} ms per call, {args.turns} turns")
+    print(
+        f"sync  ({STARLETTE_THREADPOOL_SIZE} threads): {sync_elapsed:6.2f} s "
+        f"{args.turns / sync_elapsed:8.1f} turns/s"
+    )
+    print(
+        f"async (concurrency {args.concurrency}): {async_elapsed:6.2f} s "
+        f"{args.turns / async_elapsed:8.1f} turns/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
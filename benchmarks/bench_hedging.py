@@ -0,0 +1,94 @@
+"""
+Completion tail latency with and without request hedging.
+
+The fake upstream answers in `--latency` seconds, except for a `--slow-rate`
+share of calls that take `--slow-latency`. Completions are sent by
+`--concurrency` callers in a loop; the benchmark reports p50/p95/p99 latency
+and how many calls were hedged.
+
+Usage:
+    python -m benchmarks.bench_hedging --requests 500 --slow-rate 0.03
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.bench_moderation_batching import percentile
+from benchmarks.fake_openai import run_fake_openai
+from llm import HedgePolicy
+from llm.hedging import hedges
+from openai_client import AsyncOpenAIClient
+
+
+async def bench(
+    base_url: str,
+    requests: int,
+    concurrency: int,
+    hedge_policy: HedgePolicy | None,
+) -> list[float]:
+    client = AsyncOpenAIClient(
+        api_key="fake", base_url=base_url, hedge_policy=hedge_policy
+    )
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def caller() -> None:
+        for i in remaining:
+            start = time.perf_counter()
+            await client.create_chat_completion(
+                [{"role": "user", "content": f"Where is my order {i}?"}]
+            )
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    await client.client.close()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--percentile", type=int, default=95)
+    args = parser.parse_args()
+
+    print(
+        f"{args.requests} completions, {args.concurrency} callers, upstream "
+        f"{args.latency * 1000:.0f} ms with {args.slow_rate:.0%} at "
+        f"{args.slow_latency * 1000:.0f} ms"
+    )
+    print(f"{'mode':>12} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'hedged':>7}")
+    with run_fake_openai(
+        latency=args.latency,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+    ) as base_url:
+        for name in ("none", f"hedge p{args.percentile}"):
+            policy = (
+                HedgePolicy(
+                    "bench_completion", percentile=args.percentile, min_delay=0.01
+                )
+                if name != "none"
+                else None
+            )
+            latencies = asyncio.run(
+                bench(base_url, args.requests, args.concurrency, policy)
+            )
+            hedged = (
+                f"{hedges.get(name=policy.name):.0f}" if policy is not None else "-"
+            )
+            print(
+                f"{name:>12} "
+                + " ".join(
+                    f"{percentile(latencies, q) * 1000:>8.1f}" for q in (50, 95, 99)
+                )
+                + f" {hedged:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
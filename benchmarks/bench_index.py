@@ -0,0 +1,132 @@
+"""
+Latency of conversation queries against the secondary index, compared with
+the same table without its query indexes.
+
+Fills a ConversationIndex with `--conversations` synthetic conversations
+(order numbers, categories, urgency levels and update times drawn with a
+seeded generator), then runs each query `--repeat` times: the first page,
+and a page `--depth` pages deep reached with cursors. "scan" runs the same
+queries after dropping the indexes, as a query over the JSON files or an
+unindexed table would.
+
+Usage:
+    python -m benchmarks.bench_index --conversations 1000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from statistics import quantiles
+
+from storage import (CollectedData, Conversation, ConversationIndex,
+                     ConversationQuery)
+from storage.index import INDEXED_FIELDS
+
+CATEGORIES = ["delivery", "broken item", "refund", "warranty", "billing"]
+URGENCY_LEVELS = ["low", "medium", "high"]
+
+QUERIES = {
+    "recent": {},
+    "order_number": {"order_number": 4242},
+    "category": {"problem_category": "warranty"},
+    "urgency + after": {
+        "urgency_level": "high",
+        "updated_after": datetime.now(timezone.utc) - timedelta(days=7),
+    },
+}
+
+
+def conversations(count: int, rng: random.Random):
+    now = datetime.now(timezone.utc)
+    for index in range(count):
+        updated_at = now - timedelta(seconds=rng.randrange(90 * 86400))
+        yield Conversation.model_construct(
+            session_id=f"session-{index:08d}",
+            version=1,
+            messages=[],
+            collected_data=CollectedData(
+                order_number=rng.randrange(count // 10 or 1),
+                problem_category=rng.choice(CATEGORIES),
+                urgency_level=rng.choice(URGENCY_LEVELS),
+            ),
+            created_at=updated_at,
+            updated_at=updated_at,
+        )
+
+
+def fill(index: ConversationIndex, count: int) -> None:
+    rows = conversations(count, random.Random(count))
+    while chunk := list(islice(rows, 10_000)):
+        index.update(chunk)
+
+
+def page_latencies(
+    index: ConversationIndex, filters: dict, depth: int, repeat: int
+) -> tuple[list[float], list[float]]:
+    first, deep = [], []
+    for _ in range(repeat):
+        cursor = None
+        for page_number in range(depth):
+            start = time.perf_counter()
+            page = index.query(ConversationQuery(**filters, cursor=cursor))
+            elapsed = time.perf_counter() - start
+            if page_number == 0:
+                first.append(elapsed)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        deep.append(elapsed)
+    return first, deep
+
+
+def ms(latencies: list[float], cut: int) -> float:
+    if len(latencies) == 1:
+        return latencies[0] * 1000
+    return quantiles(latencies, n=100)[cut - 1] * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--conversations", type=int, default=200_000)
+    parser.add_argument("--depth", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--scan-repeat", type=int, default=3, help="Repeats of the slow scans"
+    )
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "index.sqlite3")
+    index = ConversationIndex(path)
+    start = time.perf_counter()
+    fill(index, args.conversations)
+    print(
+        f"Indexed {args.conversations} conversations in "
+        f"{time.perf_counter() - start:.1f} s"
+    )
+
+    print(
+        f"{'query':>16} {'setup':>8} {'first p50 ms':>13} {'first p99 ms':>13} "
+        f"{f'page {args.depth} ms':>11}"
+    )
+    for setup in ("index", "scan"):
+        if setup == "scan":
+            for name in ["recent", *(f"{field}_recent" for field in INDEXED_FIELDS)]:
+                index._connection().execute(f"DROP INDEX conversations_{name}")
+        repeat = args.repeat if setup == "index" else args.scan_repeat
+        for name, filters in QUERIES.items():
+            first, deep = page_latencies(index, filters, args.depth, repeat)
+            print(
+                f"{name:>16} {setup:>8} {ms(first, 50):>13.2f} "
+                f"{ms(first, 99):>13.2f} {ms(deep, 50):>11.2f}"
+            )
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Cost of the flat and sharded record layouts as a store grows, and of reading
+conversations back from the archive.
+
+For each layout, `--conversations` small binary records are written, then
+`--reads` random sessions are read with get_conversation and the whole store
+is listed with session_ids(), as backups and the retention command do.
+Finally every conversation is archived and the same sessions are read again
+through the archive's lookup index.
+
+Usage:
+    python -m benchmarks.bench_layout --conversations 200000
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from storage import (CollectedData, Conversation, Message, MessageRole,
+                     SimpleStorage)
+
+
+def conversation(session_id: str) -> Conversation:
+    return Conversation(
+        session_id=session_id,
+        version=1,
+        messages=[
+            Message(role=MessageRole.USER, content="Where is my order 12345678?"),
+            Message(role=MessageRole.ASSISTANT, content="Let me check that for you."),
+        ],
+        collected_data=CollectedData(order_number=12345678),
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc),
+    )
+
+
+def time_reads(storage: SimpleStorage, session_ids: list[str]) -> float:
+    start = time.perf_counter()
+    for session_id in session_ids:
+        assert storage.get_conversation(session_id) is not None
+    return (time.perf_counter() - start) / len(session_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--conversations", type=int, default=200_000)
+    parser.add_argument("--reads", type=int, default=5000)
+    args = parser.parse_args()
+
+    session_ids = [f"session-{index:08d}" for index in range(args.conversations)]
+    sample = random.Random(0).sample(session_ids, min(args.reads, len(session_ids)))
+
+    print(f"{args.conversations} conversations")
+    print(f"{'store':>16} {'write µs':>9} {'read µs':>8} {'list s':>7}")
+    for layout in ("flat", "sharded"):
+        db_path = tempfile.mkdtemp()
+        try:
+            storage = SimpleStorage(db_path, record_format="binary", layout=layout)
+            start = time.perf_counter()
+            for session_id in session_ids:
+                storage._write(session_id, conversation(session_id))
+            write = (time.perf_counter() - start) / len(session_ids)
+            read = time_reads(storage, sample)
+            start = time.perf_counter()
+            assert len(storage.session_ids()) == len(session_ids)
+            listing = time.perf_counter() - start
+            print(
+                f"{layout:>16} {write * 1e6:>9.1f} {read * 1e6:>8.1f} {listing:>7.2f}"
+            )
+
+            if layout == "sharded":
+                start = time.perf_counter()
+                storage.archive_idle(datetime.now(timezone.utc) + timedelta(days=1))
+                archive = (time.perf_counter() - start) / len(session_ids)
+                read = time_reads(storage, sample)
+                print(
+                    f"{'sharded, archived':>16} {archive * 1e6:>9.1f} "
+                    f"{read * 1e6:>8.1f} {'':>7}"
+                )
+            storage.close()
+        finally:
+            shutil.rmtree(db_path)
+
+
+if __name__ == "__main__":
+    main()
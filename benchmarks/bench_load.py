@@ -0,0 +1,292 @@
+"""
+Throughput, latency percentiles and error rates of the API under concurrent
+multi-turn sessions.
+
+The app (`main:create_app`) is served by uvicorn in its own process and calls
+the local fake upstream, configured through the environment; any other
+setting (STORAGE_BACKEND, COMPLETION_CACHE_ENTRIES, ...) is passed through
+from the caller's environment. Conversations are stored in a temporary
+directory and the per-IP rate limit is disabled.
+
+Each simulated session sends the scripted user messages to /chat (or
+/chat/stream with --stream, timed up to the `done` event) and then asks for
+/chat/summary; `--concurrency` sessions run at a time. Turns rejected by
+moderation (see --flag-rate) are counted apart from errors. Every session
+sends the same script, so with the moderation cache on (the default) a
+message's verdict is drawn once per run.
+
+With --output the results are saved as JSON together with the commit they
+were measured on. --compare prints the change against such a file, so
+regressions show up as numbers.
+
+Usage:
+    python -m benchmarks.bench_load --sessions 200 --concurrency 50 \\
+        --output load.json
+    STORAGE_BACKEND=sqlite python -m benchmarks.bench_load --compare load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from statistics import mean, quantiles
+from typing import Iterator, Optional
+
+import httpx
+
+from benchmarks.fake_openai import (LATENCY_DISTRIBUTIONS, free_port,
+                                    run_fake_openai, wait_for_port)
+
+SCRIPT = [
+    "Hi, I have a problem with my order",
+    "My order number is 12345678",
+    "The blender I received stopped working after two days",
+    "It is quite urgent, I need it for a party this weekend",
+]
+
+# Metrics compared between runs, and whether higher is better
+COMPARED_METRICS = {
+    "throughput": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "error_rate": False,
+}
+
+
+class Endpoint:
+    """Latencies and outcomes of the requests sent to one endpoint"""
+
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.rejected = 0
+
+    def record(self, latency: float, status: Optional[int]) -> None:
+        if status is not None and status < 400:
+            self.latencies.append(latency)
+        elif status == 400:
+            self.rejected += 1
+        else:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> dict:
+        requests = len(self.latencies) + self.errors + self.rejected
+        # quantiles() needs two samples
+        samples = self.latencies * 2 if len(self.latencies) == 1 else self.latencies
+        cuts = quantiles(samples, n=100, method="inclusive") if samples else [0.0] * 99
+        return {
+            "requests": requests,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "error_rate": self.errors / requests if requests else 0.0,
+            "throughput": len(self.latencies) / elapsed,
+            "mean_ms": mean(self.latencies) * 1000 if self.latencies else 0.0,
+            "p50_ms": cuts[49] * 1000,
+            "p95_ms": cuts[94] * 1000,
+            "p99_ms": cuts[98] * 1000,
+        }
+
+
+@contextmanager
+def run_app(upstream_url: str) -> Iterator[str]:
+    """Serve the app from a separate process against the upstream"""
+    port = free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "fake",
+            "OPENAI_BASE_URL": upstream_url,
+            "RATELIMIT_ENABLED": "false",
+            "STORAGE_PATH": os.path.join(directory, "conversations"),
+        }
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "main:create_app",
+                "--factory",
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+                "--backlog",
+                "4096",
+            ],
+            env=env,
+        )
+        try:
+            wait_for_port(port)
+            yield f"http://127.0.0.1:{port}"
+        finally:
+            process.terminate()
+            process.wait()
+
+
+async def send_turn(
+    client: httpx.AsyncClient, transaction_id: str, message: str, stream: bool
+) -> int:
+    """Send one turn and return its status; in-band stream errors count as 500"""
+    body = {"user_message": message, "transaction_id": transaction_id}
+    if not stream:
+        return (await client.post("/chat", json=body)).status_code
+
+    async with client.stream("POST", "/chat/stream", json=body) as response:
+        if response.status_code != 200:
+            return response.status_code
+        async for line in response.aiter_lines():
+            if line == "event: done":
+                return 200
+            if line == "event: error":
+                return 500
+    return 500
+
+
+async def run_sessions(
+    app_url: str, sessions: int, concurrency: int, stream: bool
+) -> tuple[dict[str, Endpoint], float]:
+    chat_path = "/chat/stream" if stream else "/chat"
+    endpoints = {chat_path: Endpoint(), "/chat/summary": Endpoint()}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(path: str, request) -> None:
+        start = time.perf_counter()
+        try:
+            status = await request
+        except httpx.HTTPError:
+            status = None
+        endpoints[path].record(time.perf_counter() - start, status)
+
+    async def summarize(client: httpx.AsyncClient, transaction_id: str) -> int:
+        response = await client.post(
+            "/chat/summary", json={"transaction_id": transaction_id}
+        )
+        return response.status_code
+
+    async def session(client: httpx.AsyncClient) -> None:
+        transaction_id = str(uuid.uuid4())
+        async with semaphore:
+            for message in SCRIPT:
+                await timed(
+                    chat_path, send_turn(client, transaction_id, message, stream)
+                )
+            await timed("/chat/summary", summarize(client, transaction_id))
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=app_url, limits=limits, timeout=60.0
+    ) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(session(client) for _ in range(sessions)))
+        elapsed = time.perf_counter() - start
+    return endpoints, elapsed
+
+
+def git_revision() -> dict:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True
+        ).stdout.strip()
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "-s"))}
+
+
+def print_results(results: dict) -> None:
+    print(
+        f"{'endpoint':>14} {'requests':>9} {'errors':>7} {'rejected':>9} "
+        f"{'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for path, result in results["endpoints"].items():
+        print(
+            f"{path:>14} {result['requests']:>9} {result['errors']:>7} "
+            f"{result['rejected']:>9} {result['throughput']:>8.1f} "
+            f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+            f"{result['p99_ms']:>8.1f}"
+        )
+
+
+def print_comparison(baseline: dict, results: dict) -> None:
+    print(f"\nchange against {baseline['revision']['commit'][:12]}:")
+    if baseline["settings"] != results["settings"]:
+        print("(measured with different settings)")
+    for path, result in results["endpoints"].items():
+        previous = baseline["endpoints"].get(path)
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous[metric], result[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            worse = change < 0 if higher_is_better else change > 0
+            print(
+                f"{path:>14} {metric:>10} {old:>10.2f} -> {new:>10.2f} "
+                f"{change:+7.1f}%{'  worse' if worse and abs(change) >= 5 else ''}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument(
+        "--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal"
+    )
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--flag-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results to compare against")
+    args = parser.parse_args()
+
+    settings = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("output", "compare")
+    }
+    print(
+        f"{args.sessions} sessions of {len(SCRIPT)} turns, {args.concurrency} "
+        f"at a time, upstream {args.latency_distribution} "
+        f"{args.latency * 1000:.0f} ms"
+    )
+    with run_fake_openai(
+        latency=args.latency,
+        latency_distribution=args.latency_distribution,
+        token_latency=args.token_latency,
+        throttle_rate=args.throttle_rate,
+        flag_rate=args.flag_rate,
+    ) as upstream_url, run_app(upstream_url) as app_url:
+        endpoints, elapsed = asyncio.run(
+            run_sessions(app_url, args.sessions, args.concurrency, args.stream)
+        )
+
+    results = {
+        "revision": git_revision(),
+        "measured_at": datetime.now(timezone.utc).isoformat(),
+        "settings": settings,
+        "elapsed": elapsed,
+        "endpoints": {
+            path: endpoint.summary(elapsed) for path, endpoint in endpoints.items()
+        },
+    }
+    print_results(results)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
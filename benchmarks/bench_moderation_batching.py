@@ -0,0 +1,95 @@
+"""
+Trade-off of moderation micro-batching: added latency versus upstream calls.
+
+Requests arrive as a Poisson process at `--rate` per second and each one
+moderates a distinct message, so the moderation cache plays no part. For
+every batching window the benchmark reports how many moderation calls
+reached the fake upstream and the p50/p95 latency seen by the callers.
+
+Usage:
+    python -m benchmarks.bench_moderation_batching --requests 500 --rate 200
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from benchmarks.fake_openai import run_fake_openai
+from openai_client import AsyncOpenAIClient
+
+WINDOWS_MS = [0, 2, 5, 10, 20]
+
+
+async def bench_window(
+    base_url: str, window_ms: float, requests: int, rate: float, batch_size: int
+) -> tuple[int, list[float]]:
+    client = AsyncOpenAIClient(
+        api_key="fake",
+        base_url=base_url,
+        moderation_batch_window=window_ms / 1000,
+        moderation_batch_size=batch_size,
+    )
+    calls = 0
+    moderate = client._moderate
+
+    async def counting_moderate(input):
+        nonlocal calls
+        calls += 1
+        return await moderate(input)
+
+    client._moderate = counting_moderate
+    if client.moderation_batcher is not None:
+        client.moderation_batcher.moderate = counting_moderate
+
+    latencies = []
+
+    async def request(i: int) -> None:
+        start = time.perf_counter()
+        await client.is_offensive_content(f"My order {i} arrived broken")
+        latencies.append(time.perf_counter() - start)
+
+    rng = random.Random(42)
+    tasks = []
+    for i in range(requests):
+        tasks.append(asyncio.create_task(request(i)))
+        await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+    await client.client.close()
+    return calls, latencies
+
+
+def percentile(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=200, help="requests per second")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(
+        f"{args.requests} requests at {args.rate:.0f}/s, "
+        f"upstream latency {args.latency * 1000:.0f} ms, max batch {args.batch_size}"
+    )
+    print(f"{'window':>8} {'calls':>7} {'inputs/call':>12} {'p50 ms':>8} {'p95 ms':>8}")
+    with run_fake_openai(latency=args.latency) as base_url:
+        for window_ms in WINDOWS_MS:
+            calls, latencies = asyncio.run(
+                bench_window(
+                    base_url, window_ms, args.requests, args.rate, args.batch_size
+                )
+            )
+            print(
+                f"{window_ms:>6} ms {calls:>7} {args.requests / calls:>12.1f} "
+                f"{percentile(latencies, 50) * 1000:>8.1f} "
+                f"{percentile(latencies, 95) * 1000:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
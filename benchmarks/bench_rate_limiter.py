@@ -0,0 +1,86 @@
+"""
+Goodput of chat completions against a throttling upstream, with and without
+the client-side rate limiter.
+
+The fake upstream admits `--capacity` concurrent calls and answers the rest
+with a 429 and a Retry-After. `--callers` completions are sent at once; the
+benchmark reports successful completions per second, failed calls and how
+many 429s reached the upstream.
+
+Usage:
+    python -m benchmarks.bench_rate_limiter --callers 200 --capacity 16
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+
+from benchmarks.fake_openai import run_fake_openai
+from llm import RateLimiter
+from openai_client import AsyncOpenAIClient
+
+
+async def bench(
+    base_url: str, callers: int, limited: bool, max_retries: int
+) -> tuple[int, float]:
+    limiter = RateLimiter("bench") if limited else None
+    client = AsyncOpenAIClient(
+        api_key="fake",
+        base_url=base_url,
+        max_retries=max_retries,
+        base_delay=0.05,
+        completion_limiter=limiter,
+    )
+
+    async def request(i: int) -> None:
+        await client.create_chat_completion(
+            [{"role": "user", "content": f"Where is my order {i}?"}]
+        )
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(request(i) for i in range(callers)), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    await client.client.close()
+    return sum(result is None for result in results), elapsed
+
+
+def throttled_count(base_url: str) -> int:
+    return httpx.get(base_url.removesuffix("/v1") + "/stats").json()["throttled"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--callers", type=int, default=200)
+    parser.add_argument("--capacity", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--max-retries", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger("openai_client").setLevel(logging.ERROR)
+
+    print(
+        f"{args.callers} concurrent completions, upstream admits {args.capacity} "
+        f"at {args.latency * 1000:.0f} ms, {args.max_retries} retries"
+    )
+    print(f"{'mode':>10} {'ok':>6} {'failed':>7} {'429s':>7} {'goodput/s':>10}")
+    with run_fake_openai(
+        latency=args.latency, concurrency_limit=args.capacity
+    ) as base_url:
+        for limited in (False, True):
+            before = throttled_count(base_url)
+            ok, elapsed = asyncio.run(
+                bench(base_url, args.callers, limited, args.max_retries)
+            )
+            throttled = throttled_count(base_url) - before
+            print(
+                f"{'limiter' if limited else 'none':>10} {ok:>6} "
+                f"{args.callers - ok:>7} {throttled:>7} {ok / elapsed:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Disk footprint and load time of the conversation record formats.
+
+For conversations of each length, the same conversation is stored as pretty
+JSON (like the sample records), as the compact JSON the `json` backend
+writes, and as a binary record of the `binary` backend. Reported per message:
+bytes on disk and the time get_conversation takes. "check µs" is the version
+check every update makes before writing.
+
+Messages are drawn from a fixed vocabulary with a seeded generator, so the
+text compresses about as well as real support chats rather than perfectly.
+
+Usage:
+    python -m benchmarks.bench_records --turns 10 100 500
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from storage import (CollectedData, Conversation, Message, MessageRole,
+                     SimpleStorage)
+
+VOCABULARY = (
+    "order blender broken refund delivery package arrived late damaged box "
+    "please help thanks number customer support replacement warranty week "
+    "days working stopped urgent party weekend address tracking status the "
+    "a my it is was to and for with not"
+).split()
+
+
+def build_conversation(turns: int, rng: random.Random) -> Conversation:
+    def text(words: int) -> str:
+        return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize()
+
+    messages = []
+    for _ in range(turns):
+        messages += [
+            Message(role=MessageRole.USER, content=text(15), token_count=20),
+            Message(role=MessageRole.ASSISTANT, content=text(30), token_count=40),
+        ]
+    return Conversation(
+        session_id="bench-session",
+        version=turns,
+        messages=messages,
+        collected_data=CollectedData(order_number=12345678, urgency_level="high"),
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc),
+    )
+
+
+def write(storage: SimpleStorage, conversation: Conversation, pretty: bool) -> str:
+    """Store the conversation in the storage's format and return its path"""
+    storage._write(conversation.session_id, conversation)
+    path = storage._path(conversation.session_id)
+    if pretty:
+        with open(path, "w") as f:
+            json.dump(json.loads(conversation.model_dump_json()), f, indent=4)
+    return path
+
+
+def time_per_call(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(
+        f"{'turns':>6} {'format':>13} {'bytes/msg':>10} {'load µs/msg':>12} "
+        f"{'check µs':>9}"
+    )
+    for turns in args.turns:
+        conversation = build_conversation(turns, random.Random(turns))
+        message_count = len(conversation.messages)
+        for name, record_format, pretty in (
+            ("json (pretty)", "json", True),
+            ("json", "json", False),
+            ("binary", "binary", False),
+        ):
+            db_path = tempfile.mkdtemp()
+            try:
+                storage = SimpleStorage(db_path=db_path, record_format=record_format)
+                path = write(storage, conversation, pretty)
+                assert storage.get_conversation("bench-session") == conversation
+
+                load = time_per_call(
+                    lambda: storage.get_conversation("bench-session"), args.repeat
+                )
+                check = time_per_call(
+                    lambda: storage._check_version("bench-session", turns),
+                    args.repeat,
+                )
+                print(
+                    f"{turns:>6} {name:>13} "
+                    f"{os.path.getsize(path) / message_count:>10.1f} "
+                    f"{load / message_count * 1e6:>12.2f} {check * 1e6:>9.1f}"
+                )
+            finally:
+                shutil.rmtree(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Write amplification and latency of the conversation storage backends.
+
+Each simulated turn does what /chat does: load the conversation, append a
+user/assistant message pair and write it back. Write amplification is the
+number of bytes written to disk over the lifetime of the conversation divided
+by the size of the final conversation. For SQLite it is measured as the growth
+of the database and WAL files, so it also includes page and index overhead.
+
+Usage:
+    python -m benchmarks.bench_storage --turns 10 50 100 250 500
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from statistics import mean
+from typing import Callable
+
+from storage import (LogStorage, Message, MessageRole, SimpleStorage,
+                     SQLiteStorage)
+
+USER_MESSAGE = "My blender stopped working after two days, order 12345678. " * 2
+ASSISTANT_MESSAGE = "I'm sorry to hear that! Could you describe the problem? " * 2
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def run_conversation(storage, db_path: str, turns: int) -> dict:
+    session_id = "bench-session"
+    bytes_written = 0
+    read_latencies, write_latencies = [], []
+
+    for _ in range(turns):
+        start = time.perf_counter()
+        conversation = storage.get_or_create_conversation(session_id)
+        read_latencies.append(time.perf_counter() - start)
+
+        conversation.messages.extend(
+            [
+                Message(role=MessageRole.USER, content=USER_MESSAGE),
+                Message(role=MessageRole.ASSISTANT, content=ASSISTANT_MESSAGE),
+            ]
+        )
+        size_before = directory_size(db_path)
+        start = time.perf_counter()
+        storage.update_conversation(session_id, conversation)
+        write_latencies.append(time.perf_counter() - start)
+        # SimpleStorage truncates and rewrites, so count the whole new file
+        size_after = directory_size(db_path)
+        bytes_written += (
+            size_after if isinstance(storage, SimpleStorage) else size_after - size_before
+        )
+
+    final_size = len(conversation.model_dump_json())
+    return {
+        "bytes_written": bytes_written,
+        "write_amplification": bytes_written / final_size,
+        "read_us": mean(read_latencies) * 1e6,
+        "write_us": mean(write_latencies) * 1e6,
+    }
+
+
+BACKENDS: dict[str, Callable[[str], object]] = {
+    "SimpleStorage": lambda path: SimpleStorage(db_path=path),
+    "LogStorage": lambda path: LogStorage(db_path=path, compaction_interval=None),
+    "SQLiteStorage": lambda path: SQLiteStorage(db_path=f"{path}/bench.sqlite3"),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 100, 250, 500])
+    args = parser.parse_args()
+
+    print(
+        f"{'backend':<14} {'turns':>6} {'written':>12} {'amplif.':>8} "
+        f"{'read us':>9} {'write us':>9}"
+    )
+    for turns in args.turns:
+        for name, factory in BACKENDS.items():
+            db_path = tempfile.mkdtemp(prefix="bench-storage-")
+            try:
+                storage = factory(db_path)
+                result = run_conversation(storage, db_path, turns)
+                if hasattr(storage, "close"):
+                    storage.close()
+            finally:
+                shutil.rmtree(db_path)
+            print(
+                f"{name:<14} {turns:>6} {result['bytes_written']:>12,} "
+                f"{result['write_amplification']:>8.1f} "
+                f"{result['read_us']:>9.0f} {result['write_us']:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Wall-clock time to summarize many conversations: serial /chat/summary calls,
+as the back office makes them today, against one /chat/summary/batch call.
+
+The app is served as in bench_load. Each conversation gets one /chat turn
+first; the two approaches summarize separate sets of conversations, so
+neither reuses a summary stored by the other. SUMMARY_BATCH_CONCURRENCY is
+passed through from the caller's environment.
+
+Usage:
+    python -m benchmarks.bench_summary_batch --conversations 500
+    SUMMARY_BATCH_CONCURRENCY=64 python -m benchmarks.bench_summary_batch
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+from benchmarks.bench_load import run_app
+from benchmarks.fake_openai import run_fake_openai
+
+
+async def seed(client: httpx.AsyncClient, count: int) -> list[str]:
+    """Create `count` one-turn conversations and return their transaction ids"""
+    transaction_ids = [str(uuid.uuid4()) for _ in range(count)]
+    semaphore = asyncio.Semaphore(50)
+
+    async def turn(transaction_id: str) -> None:
+        async with semaphore:
+            response = await client.post(
+                "/chat",
+                json={
+                    "user_message": "My blender stopped working",
+                    "transaction_id": transaction_id,
+                },
+            )
+            response.raise_for_status()
+
+    await asyncio.gather(*(turn(transaction_id) for transaction_id in transaction_ids))
+    return transaction_ids
+
+
+async def serial(client: httpx.AsyncClient, transaction_ids: list[str]) -> int:
+    ok = 0
+    for transaction_id in transaction_ids:
+        response = await client.post(
+            "/chat/summary", json={"transaction_id": transaction_id}
+        )
+        ok += response.status_code == 200
+    return ok
+
+
+async def batch(client: httpx.AsyncClient, transaction_ids: list[str]) -> int:
+    ok = 0
+    async with client.stream(
+        "POST", "/chat/summary/batch", json={"transaction_ids": transaction_ids}
+    ) as response:
+        async for line in response.aiter_lines():
+            if line:
+                ok += json.loads(line)["status"] == "ok"
+    return ok
+
+
+async def run(app_url: str, conversations: int) -> None:
+    limits = httpx.Limits(max_connections=50)
+    async with httpx.AsyncClient(
+        base_url=app_url, limits=limits, timeout=600.0
+    ) as client:
+        serial_ids = await seed(client, conversations)
+        batch_ids = await seed(client, conversations)
+
+        for name, summarize, transaction_ids in (
+            ("serial", serial, serial_ids),
+            ("batch", batch, batch_ids),
+        ):
+            start = time.perf_counter()
+            ok = await summarize(client, transaction_ids)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>8} {ok:>6} {elapsed:>10.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(
+        f"{args.conversations} conversations, upstream {args.latency * 1000:.0f} ms"
+    )
+    print(f"{'mode':>8} {'ok':>6} {'seconds':>10}")
+    with run_fake_openai(latency=args.latency) as upstream_url, run_app(
+        upstream_url
+    ) as app_url:
+        asyncio.run(run(app_url, args.conversations))
+
+
+if __name__ == "__main__":
+    main()
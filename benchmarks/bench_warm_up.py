@@ -0,0 +1,70 @@
+"""
+First-request latency of a fresh client, cold versus after `warm_up`.
+
+Every trial builds a new AsyncOpenAIClient (and so a new connection pool),
+optionally warms it up, then sends `--concurrency` completions at once, as
+the first requests after a deploy would. The fake upstream is plain HTTP on
+localhost, so the gain shown here is the TCP connection setup only; against
+the real API every cold connection also pays a TLS handshake.
+
+Usage:
+    python -m benchmarks.bench_warm_up --trials 20 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.fake_openai import run_fake_openai
+from openai_client import AsyncOpenAIClient
+
+
+async def first_requests(base_url: str, concurrency: int, warm: bool) -> float:
+    """Mean latency of the first `concurrency` completions of a new client"""
+    client = AsyncOpenAIClient(api_key="fake", base_url=base_url)
+    if warm:
+        await client.warm_up(concurrency)
+
+    async def request(i: int) -> float:
+        start = time.perf_counter()
+        await client.create_chat_completion(
+            [{"role": "user", "content": f"Where is my order {i}?"}]
+        )
+        return time.perf_counter() - start
+
+    latencies = await asyncio.gather(*(request(i) for i in range(concurrency)))
+    await client.close()
+    return statistics.mean(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(
+        f"{args.trials} fresh clients, {args.concurrency} concurrent first "
+        f"requests, upstream latency {args.latency * 1000:.0f} ms"
+    )
+    print(f"{'mode':>6} {'mean ms':>8} {'median ms':>10} {'max ms':>8}")
+    with run_fake_openai(latency=args.latency) as base_url:
+        # One throwaway client so imports and lazy SDK setup are not counted
+        asyncio.run(first_requests(base_url, 1, warm=False))
+        for warm in (False, True):
+            results = [
+                asyncio.run(first_requests(base_url, args.concurrency, warm))
+                for _ in range(args.trials)
+            ]
+            print(
+                f"{'warm' if warm else 'cold':>6} "
+                f"{statistics.mean(results) * 1000:>8.1f} "
+                f"{statistics.median(results) * 1000:>10.1f} "
+                f"{max(results) * 1000:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Latency of storing a turn and time to make a burst of turns durable, with
+synchronous writes and with the write-behind queue.
+
+`--sessions` threads each store `--turns` turns of their own conversation,
+as concurrent /chat requests do. Durable setups are compared: LogStorage
+with an fsync per write against write-behind batches with one fsync each,
+and SQLite with synchronous=NORMAL against write-behind batches committed
+with synchronous=FULL. "total s" includes flushing the queue.
+
+Usage:
+    python -m benchmarks.bench_write_behind --sessions 32 --turns 20
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from typing import Callable
+
+from storage import (LogStorage, Message, MessageRole, SQLiteStorage,
+                     WriteBehindStorage)
+
+USER_MESSAGE = "My blender stopped working after two days, order 12345678."
+ASSISTANT_MESSAGE = "I'm sorry to hear that! Could you describe the problem?"
+
+SETUPS: dict[str, Callable[[str], object]] = {
+    "log, fsync per write": lambda path: LogStorage(
+        db_path=path, compaction_interval=None, fsync=True
+    ),
+    "log, write-behind": lambda path: WriteBehindStorage(
+        LogStorage(db_path=path, compaction_interval=None)
+    ),
+    "sqlite": lambda path: SQLiteStorage(db_path=f"{path}/db.sqlite3"),
+    "sqlite, write-behind": lambda path: WriteBehindStorage(
+        SQLiteStorage(db_path=f"{path}/db.sqlite3")
+    ),
+}
+
+
+def run(storage, sessions: int, turns: int) -> tuple[list[float], float]:
+    def session(index: int) -> list[float]:
+        latencies = []
+        for _ in range(turns):
+            conversation = storage.get_or_create_conversation(f"session-{index}")
+            conversation.messages.extend(
+                [
+                    Message(role=MessageRole.USER, content=USER_MESSAGE),
+                    Message(role=MessageRole.ASSISTANT, content=ASSISTANT_MESSAGE),
+                ]
+            )
+            start = time.perf_counter()
+            storage.update_conversation(f"session-{index}", conversation)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        latencies = [
+            latency
+            for session_latencies in pool.map(session, range(sessions))
+            for latency in session_latencies
+        ]
+    if hasattr(storage, "flush"):
+        storage.flush()
+    return latencies, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions x {args.turns} turns")
+    print(f"{'setup':>22} {'p50 ms':>8} {'p99 ms':>8} {'total s':>8}")
+    for name, open_storage in SETUPS.items():
+        path = tempfile.mkdtemp()
+        storage = open_storage(path)
+        try:
+            latencies, total = run(storage, args.sessions, args.turns)
+        finally:
+            storage.close()
+            if isinstance(storage, WriteBehindStorage):
+                storage.storage.close()
+            shutil.rmtree(path)
+        cuts = quantiles(latencies, n=100)
+        print(
+            f"{name:>22} {cuts[49] * 1000:>8.2f} {cuts[98] * 1000:>8.2f} "
+            f"{total:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Local OpenAI-compatible stand-in used by the benchmarks. It implements just
+enough of the moderation and chat completion endpoints for the openai SDK to
+parse the responses, with a configurable artificial latency. With a
+`concurrency_limit`, calls beyond that many in flight are throttled with a
+429 carrying a `retry-after-ms` header. A `slow_rate` share of the calls
+takes `slow_latency` seconds instead, to model a long latency tail.
+
+Latencies are fixed by default, or drawn from an exponential or lognormal
+distribution around `latency`. A `throttle_rate` share of the calls gets a
+429 regardless of load, and a `flag_rate` share of the moderated inputs is
+flagged. Streamed completions send one word per chunk, `token_latency`
+seconds apart.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_REPLY = (
+    "Thanks for reaching out! Could you share your order number?"
+    '<COLLECTED_DATA>{"order_number": null, "problem_category": null, '
+    '"problem_description": null, "urgency_level": null}</COLLECTED_DATA>'
+)
+FAKE_STRUCTURED_REPLY = json.dumps(
+    {
+        "reply": "Thanks for reaching out! Could you share your order number?",
+        "collected_data": {
+            "order_number": None,
+            "problem_category": None,
+            "problem_description": None,
+            "urgency_level": None,
+        },
+    }
+)
+
+LATENCY_DISTRIBUTIONS = ("fixed", "exponential", "lognormal")
+
+# Spread of the lognormal latencies; `latency` is their median
+LOGNORMAL_SIGMA = 0.5
+
+
+def sample_latency(latency: float, distribution: str) -> float:
+    if latency <= 0 or distribution == "fixed":
+        return latency
+    if distribution == "exponential":
+        return random.expovariate(1 / latency)
+    return random.lognormvariate(math.log(latency), LOGNORMAL_SIGMA)
+
+
+def _completion_chunk(
+    body: dict, completion_id: str, delta: dict, finish_reason: Optional[str] = None
+) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def create_fake_openai_app(
+    latency: float = 0.05,
+    concurrency_limit: int = 0,
+    retry_after: float = 0.05,
+    slow_rate: float = 0.0,
+    slow_latency: float = 1.0,
+    latency_distribution: str = "fixed",
+    throttle_rate: float = 0.0,
+    flag_rate: float = 0.0,
+    token_latency: float = 0.0,
+) -> FastAPI:
+    """
+    Build the stand-in app; every endpoint sleeps `latency` seconds (drawn
+    from `latency_distribution`), or `slow_latency` for a `slow_rate` share
+    of the calls. A positive `concurrency_limit` throttles calls beyond it
+    with a 429 that asks the client to wait `retry_after` seconds, and a
+    `throttle_rate` share of the calls is throttled at random.
+    """
+    if latency_distribution not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution: {latency_distribution!r}")
+    app = FastAPI()
+    app.state.in_flight = 0
+    app.state.throttled = 0
+
+    async def upstream_call() -> Optional[JSONResponse]:
+        """Sleep `latency` seconds as an admitted call, or return the 429"""
+        if (
+            concurrency_limit and app.state.in_flight >= concurrency_limit
+        ) or random.random() < throttle_rate:
+            app.state.throttled += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                status_code=429,
+                headers={"retry-after-ms": str(int(retry_after * 1000))},
+            )
+        app.state.in_flight += 1
+        try:
+            if random.random() < slow_rate:
+                await asyncio.sleep(slow_latency)
+            else:
+                await asyncio.sleep(sample_latency(latency, latency_distribution))
+        finally:
+            app.state.in_flight -= 1
+        return None
+
+    @app.get("/stats")
+    async def stats() -> dict:
+        return {"throttled": app.state.throttled}
+
+    @app.post("/v1/moderations", response_model=None)
+    async def moderations(body: dict):
+        if (throttled := await upstream_call()) is not None:
+            return throttled
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return {
+            "id": f"modr-{uuid.uuid4().hex}",
+            "model": "omni-moderation-latest",
+            "results": [
+                {
+                    "flagged": random.random() < flag_rate,
+                    "categories": {},
+                    "category_scores": {},
+                }
+                for _ in inputs
+            ],
+        }
+
+    @app.post("/v1/chat/completions", response_model=None)
+    async def chat_completions(body: dict):
+        if (throttled := await upstream_call()) is not None:
+            return throttled
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            content = FAKE_STRUCTURED_REPLY
+        else:
+            content = FAKE_REPLY
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_completion(body, content), media_type="text/event-stream"
+            )
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        }
+
+    async def stream_completion(body: dict, content: str) -> AsyncIterator[str]:
+        """Send the reply one word per chunk, `token_latency` seconds apart"""
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        yield _completion_chunk(body, completion_id, {"role": "assistant"})
+        words = content.split(" ")
+        for index, word in enumerate(words):
+            if token_latency:
+                await asyncio.sleep(token_latency)
+            text = word if index == len(words) - 1 else word + " "
+            yield _completion_chunk(body, completion_id, {"content": text})
+        yield _completion_chunk(body, completion_id, {}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+@contextmanager
+def run_fake_openai(
+    latency: float = 0.05,
+    concurrency_limit: int = 0,
+    retry_after: float = 0.05,
+    slow_rate: float = 0.0,
+    slow_latency: float = 1.0,
+    latency_distribution: str = "fixed",
+    throttle_rate: float = 0.0,
+    flag_rate: float = 0.0,
+    token_latency: float = 0.0,
+) -> Iterator[str]:
+    """
+    Serve the stand-in from a separate process and yield its base URL. A
+    separate process keeps the server from competing with the client under
+    test for the GIL.
+    """
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.fake_openai",
+            "--port",
+            str(port),
+            "--latency",
+            str(latency),
+            "--concurrency-limit",
+            str(concurrency_limit),
+            "--retry-after",
+            str(retry_after),
+            "--slow-rate",
+            str(slow_rate),
+            "--slow-latency",
+            str(slow_latency),
+            "--latency-distribution",
+            latency_distribution,
+            "--throttle-rate",
+            str(throttle_rate),
+            "--flag-rate",
+            str(flag_rate),
+            "--token-latency",
+            str(token_latency),
+        ]
+    )
+    try:
+        wait_for_port(port)
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI upstream")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency-limit", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument(
+        "--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="fixed"
+    )
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--flag-rate", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_fake_openai_app(
+            args.latency,
+            args.concurrency_limit,
+            args.retry_after,
+            args.slow_rate,
+            args.slow_latency,
+            args.latency_distribution,
+            args.throttle_rate,
+            args.flag_rate,
+            args.token_latency,
+        ),
+        host="127.0.0.1",
+        port=args.port,
+        log_level="warning",
+        backlog=4096,
+    )
+
+
+if __name__ == "__main__":
+    main()
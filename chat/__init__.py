@@ -1,10 +1,10 @@
+from .api import create_router as create_chat_router
 from .api import parse_response
-from .api import router as chat_router
 from .models import ChatRequest, ChatResponse, OpenAIResponse
 from .prompts import CHAT_SYSTEM_MESSAGE
 
 __all__ = [
-    "chat_router",
+    "create_chat_router",
     "parse_response",
     "ChatRequest",
     "ChatResponse",
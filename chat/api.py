@@ -1,25 +1,259 @@
+import asyncio
+import json
 import logging
 import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import TYPE_CHECKING, AsyncIterator, Iterator, Optional
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from slowapi import Limiter
 
-from chat.models import (ChatRequest, ChatResponse, ChatSummaryRequest,
-                         ChatSummaryResponse)
-from chat.prompts import CHAT_SUMMARY_SYSTEM_MESSAGE, CHAT_SYSTEM_MESSAGE
-from chat.utils import parse_message, parse_response, update_collected_data
-from config import limiter, openai_client, storage
-from storage.models import CollectedData, Message, MessageRole
+import metrics
+from chat.context import build_context
+from chat.models import (ChatRequest, ChatResponse, ChatSummaryBatchItem,
+                         ChatSummaryBatchRequest, ChatSummaryRequest,
+                         ChatSummaryResponse, ConversationListItem,
+                         ConversationListResponse, OpenAIResponse)
+from chat.prompts import (CHAT_STRUCTURED_SYSTEM_MESSAGE,
+                          CHAT_SUMMARY_SYSTEM_MESSAGE,
+                          CHAT_SUMMARY_UPDATE_SYSTEM_MESSAGE,
+                          CHAT_SYSTEM_MESSAGE, previous_summary_message)
+from chat.structured import (CHAT_RESPONSE_FORMAT, StructuredStreamParser,
+                             parse_structured_response)
+from chat.utils import (CollectedDataStreamParser, is_complete, parse_message,
+                        parse_response, update_collected_data)
+from config import (CHAT_RATE_LIMIT, CONFLICT_POLICY, CONTEXT_TOKEN_BUDGET,
+                    QUERY_RATE_LIMIT, SESSION_LOCKS, SPECULATIVE_MODERATION,
+                    STRUCTURED_OUTPUT, SUMMARY_BATCH_CONCURRENCY,
+                    SUMMARY_BATCH_RATE_LIMIT, SUMMARY_PRECOMPUTE,
+                    SUMMARY_RATE_LIMIT)
+from llm.tokens import count_tokens
+from services import Services, get_services
+from storage import (ConversationConflictError, ConversationQuery,
+                     InvalidCursorError)
+from storage.models import (CollectedData, Conversation, ConversationSummary,
+                            Message, MessageRole, UrgencyLevel)
+
+if TYPE_CHECKING:
+    from openai.types.chat import \
+        ChatCompletionSystemMessageParam as OpenAISystemMessage
+
+    from openai_client import AsyncOpenAIClient
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
-# Initialize router
-router = APIRouter()
+MAX_REBASE_ATTEMPTS = 3
+
+conversation_conflicts = metrics.counter(
+    "conversation_conflicts_total",
+    "Turns that found their conversation updated by a concurrent request",
+)
+wasted_completions = metrics.counter(
+    "speculative_completions_wasted_total",
+    "Speculative completions cancelled or discarded because moderation flagged "
+    "the message",
+)
+summary_hits = metrics.counter(
+    "chat_summary_hits_total", "Summaries served from storage without an LLM call"
+)
+incremental_summaries = metrics.counter(
+    "chat_summary_incremental_total",
+    "Summaries updated from the previous summary and the new messages only",
+)
+
+stage_seconds = metrics.histogram(
+    "chat_stage_seconds", "Seconds spent in each stage of the chat endpoints"
+)
+stage_errors = metrics.counter(
+    "chat_stage_errors_total", "Chat requests that failed, by the stage that failed"
+)
+
+
+@contextmanager
+def stage(endpoint: str, name: str) -> Iterator[None]:
+    """Time a stage of an endpoint and count its failures"""
+    try:
+        with stage_seconds.time(endpoint=endpoint, stage=name):
+            yield
+    except Exception:
+        stage_errors.inc(endpoint=endpoint, stage=name)
+        raise
+
+
+async def save_turn(
+    services: Services,
+    transaction_id: str,
+    conversation: Conversation,
+    user_message: str,
+    openai_response: OpenAIResponse,
+) -> Conversation:
+    """
+    Append the user/assistant pair and the collected data to the conversation
+    and store it. If a concurrent request stored a turn first, the turn is
+    rebased onto the latest version (CONFLICT_POLICY=rebase) or rejected with
+    a 409. A rebased reply was generated without the concurrent turn in its
+    context, but no turn is ever lost. With SUMMARY_PRECOMPUTE, the turn that
+    completes the collected data also starts a background summary.
+    """
+    new_messages = [
+        Message(
+            role=MessageRole.USER,
+            content=user_message,
+            token_count=count_tokens(user_message),
+        ),
+        Message(
+            role=MessageRole.ASSISTANT,
+            content=openai_response.reply,
+            token_count=count_tokens(openai_response.reply),
+        ),
+    ]
+    was_complete = is_complete(conversation.collected_data)
+    for attempt in range(MAX_REBASE_ATTEMPTS + 1):
+        conversation.collected_data = update_collected_data(
+            conversation.collected_data or CollectedData(),
+            openai_response.collected_data,
+        )
+        conversation.messages.extend(new_messages)
+        try:
+            await services.storage.update_conversation(transaction_id, conversation)
+        except ConversationConflictError as e:
+            conversation_conflicts.inc()
+            logger.warning(f"Concurrent update of conversation: {e}")
+            if CONFLICT_POLICY != "rebase" or attempt == MAX_REBASE_ATTEMPTS:
+                raise HTTPException(
+                    409, "Conversation was updated by another request. Please retry."
+                )
+            # Rebase onto the stored conversation as a whole: its history_summary
+            # covers the concurrent turn, the fold made for this turn does not
+            conversation = await services.storage.get_or_create_conversation(
+                transaction_id
+            )
+            was_complete = is_complete(conversation.collected_data)
+            continue
+
+        if (
+            SUMMARY_PRECOMPUTE
+            and not was_complete
+            and is_complete(conversation.collected_data)
+        ):
+            schedule_summary(services, transaction_id)
+        return conversation
 
 
-@router.post("/chat")
-@limiter.limit("10/minute")  # Max 10 requests per minute per IP
-def chat(request: Request, chat_request: ChatRequest) -> ChatResponse:
+async def summarize_conversation(
+    services: Services, conversation: Conversation
+) -> str:
+    """
+    Return the conversation summary, reusing the stored one. A summary that
+    is up to date is returned as is; one that misses the latest turns is
+    updated from the new messages only. New summaries are stored with the
+    number of messages they cover, without changing the conversation's
+    version or updated_at.
+    """
+    summary = conversation.summary
+    message_count = len(conversation.messages)
+    if summary is not None and summary.message_count == message_count:
+        summary_hits.inc()
+        return summary.text
+
+    if summary is not None and summary.message_count < message_count:
+        incremental_summaries.inc()
+        messages = [
+            CHAT_SUMMARY_UPDATE_SYSTEM_MESSAGE,
+            previous_summary_message(summary.text),
+            *[
+                parse_message(message)
+                for message in conversation.messages[summary.message_count :]
+            ],
+        ]
+    else:
+        messages = [
+            CHAT_SUMMARY_SYSTEM_MESSAGE,
+            *[parse_message(message) for message in conversation.messages],
+        ]
+    text = await services.openai_client.create_chat_completion(messages=messages)
+
+    conversation.summary = ConversationSummary(text=text, message_count=message_count)
+    # Not a turn: stored apart so the version and updated_at stay as they are
+    await services.storage.save_summary(conversation.session_id, conversation.summary)
+    return text
+
+
+async def precompute_summary(services: Services, transaction_id: str) -> None:
+    try:
+        conversation = await services.storage.get_conversation(transaction_id)
+        if conversation is not None:
+            await summarize_conversation(services, conversation)
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(f"Failed to precompute summary: {detail}")
+
+
+def schedule_summary(services: Services, transaction_id: str) -> None:
+    """Summarize the conversation in the background"""
+    task = asyncio.create_task(precompute_summary(services, transaction_id))
+    services.background_summaries.add(task)
+    task.add_done_callback(services.background_summaries.discard)
+
+
+def chat_system_message() -> "OpenAISystemMessage":
+    """System prompt of the output mode"""
+    return CHAT_STRUCTURED_SYSTEM_MESSAGE if STRUCTURED_OUTPUT else CHAT_SYSTEM_MESSAGE
+
+
+def chat_completion_options(request: Request) -> dict:
+    """
+    Completion arguments of the output mode. A `Cache-Control: no-cache`
+    request header bypasses the completion cache.
+    """
+    options = {"response_format": CHAT_RESPONSE_FORMAT} if STRUCTURED_OUTPUT else {}
+    if "no-cache" in request.headers.get("cache-control", "").lower():
+        options["cache"] = False
+    return options
+
+
+def parse_chat_response(response_content: str) -> OpenAIResponse:
+    """Parse a completion according to the output mode"""
+    if STRUCTURED_OUTPUT:
+        return parse_structured_response(response_content)
+    return parse_response(response_content)
+
+
+async def moderated_chat_completion(
+    openai_client: "AsyncOpenAIClient", user_message: str, messages: list, options: dict
+) -> str:
+    """
+    Run moderation and the chat completion concurrently. If moderation flags
+    the message the completion is cancelled, or its result discarded when it
+    already finished, and a 400 is raised before anything is stored.
+    """
+    completion = asyncio.create_task(
+        openai_client.create_chat_completion(messages=messages, **options)
+    )
+    try:
+        is_offensive = await openai_client.is_offensive_content(user_message)
+    except BaseException:
+        completion.cancel()
+        raise
+
+    if is_offensive:
+        if not completion.cancel() and not completion.cancelled():
+            # Finished already: retrieve any exception so it is not reported as unhandled
+            completion.exception()
+        wasted_completions.inc()
+        raise HTTPException(400, "Message contains offensive content.")
+
+    return await completion
+
+
+async def chat(
+    request: Request,
+    chat_request: ChatRequest,
+    services: Services = Depends(get_services),
+) -> ChatResponse:
     """
     POST endpoint to generate a response from the LLM for the given user message.
     """
@@ -28,53 +262,195 @@ def chat(request: Request, chat_request: ChatRequest) -> ChatResponse:
     if not user_message:
         raise HTTPException(400, "Message cannot be empty.")
 
-    # 2. Avoid offensive content
-    if openai_client.is_offensive_content(user_message):
-        raise HTTPException(400, "Message contains offensive content.")
+    # 2. Avoid offensive content (checked alongside the completion in speculative mode)
+    if not SPECULATIVE_MODERATION:
+        with stage("/chat", "moderation"):
+            is_offensive = await services.openai_client.is_offensive_content(
+                user_message
+            )
+        if is_offensive:
+            raise HTTPException(400, "Message contains offensive content.")
 
     # 3. Get transaction ID from request or generate a new one
     transaction_id = chat_request.transaction_id or str(uuid.uuid4())
 
     try:
-        # 4. Get conversation history
-        conversation = storage.get_or_create_conversation(transaction_id)
+        lock = (
+            services.session_locks.hold(transaction_id)
+            if SESSION_LOCKS
+            else nullcontext()
+        )
+        async with lock:
+            # 4. Get conversation history
+            with stage("/chat", "load"):
+                conversation = await services.storage.get_or_create_conversation(
+                    transaction_id
+                )
 
-        # 5. Generate response from LLM
-        messages = [
-            CHAT_SYSTEM_MESSAGE,
-            *[parse_message(message) for message in conversation.messages],
-            parse_message(Message(role=MessageRole.USER, content=user_message)),
-        ]
-        response_content = openai_client.create_chat_completion(messages=messages)
+            # 5. Generate response from LLM, within the context token budget
+            with stage("/chat", "context"):
+                messages = await build_context(
+                    services.openai_client,
+                    conversation,
+                    Message(role=MessageRole.USER, content=user_message),
+                    CONTEXT_TOKEN_BUDGET,
+                    chat_system_message(),
+                )
+            with stage("/chat", "completion"):
+                if SPECULATIVE_MODERATION:
+                    response_content = await moderated_chat_completion(
+                        services.openai_client,
+                        user_message,
+                        messages,
+                        chat_completion_options(request),
+                    )
+                else:
+                    response_content = (
+                        await services.openai_client.create_chat_completion(
+                            messages=messages, **chat_completion_options(request)
+                        )
+                    )
 
-        # 6. Extract order data from response
-        openai_response = parse_response(response_content)
-        conversation.collected_data = update_collected_data(
-            conversation.collected_data, openai_response.collected_data
+            # 6. Extract order data from response
+            with stage("/chat", "parse"):
+                openai_response = parse_chat_response(response_content)
+
+            # 7. Append the user-assistant pair and store the conversation
+            with stage("/chat", "store"):
+                conversation = await save_turn(
+                    services,
+                    transaction_id,
+                    conversation,
+                    user_message,
+                    openai_response,
+                )
+
+        return ChatResponse(
+            transaction_id=transaction_id,
+            response=openai_response.reply,
+            collected_data=conversation.collected_data,
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Failed to generate response: {str(e)}")
 
-        # 7. Append new pair user-assistant messages to conversation
-        new_messages = [
-            Message(role=MessageRole.USER, content=user_message),
-            Message(role=MessageRole.ASSISTANT, content=openai_response.reply),
-        ]
-        conversation.messages.extend(new_messages)
 
-        # 8. Update conversation in storage
-        storage.update_conversation(transaction_id, conversation)
+def format_sse_event(event: str, data: dict) -> str:
+    """Format a server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        return ChatResponse(
+
+async def stream_chat_events(
+    services: Services,
+    transaction_id: str,
+    conversation: Conversation,
+    user_message: str,
+    messages: list,
+    options: dict,
+) -> AsyncIterator[str]:
+    """
+    Forward reply tokens as `token` events while holding back the
+    <COLLECTED_DATA> block, then persist the turn and finish with a `done`
+    event carrying the full ChatResponse.
+    """
+    parser = (
+        StructuredStreamParser() if STRUCTURED_OUTPUT else CollectedDataStreamParser()
+    )
+    try:
+        with stage("/chat/stream", "completion"):
+            async for chunk in services.openai_client.stream_chat_completion(
+                messages=messages, **options
+            ):
+                text = parser.feed(chunk)
+                if text:
+                    yield format_sse_event("token", {"content": text})
+            text = parser.finish()
+            if text:
+                yield format_sse_event("token", {"content": text})
+
+        with stage("/chat/stream", "parse"):
+            openai_response = parser.to_response()
+        with stage("/chat/stream", "store"):
+            conversation = await save_turn(
+                services, transaction_id, conversation, user_message, openai_response
+            )
+
+        chat_response = ChatResponse(
             transaction_id=transaction_id,
             response=openai_response.reply,
             collected_data=conversation.collected_data,
         )
+        yield format_sse_event("done", chat_response.model_dump(mode="json"))
+    except Exception as e:
+        # Headers are already sent, so failures are reported in-band
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(f"Failed to stream response: {detail}")
+        yield format_sse_event("error", {"detail": detail})
+
+
+async def chat_stream(
+    request: Request,
+    chat_request: ChatRequest,
+    services: Services = Depends(get_services),
+) -> StreamingResponse:
+    """
+    POST endpoint that streams the LLM response as server-sent events.
+    """
+    # 1. Clean message input
+    user_message = chat_request.user_message.strip()
+    if not user_message:
+        raise HTTPException(400, "Message cannot be empty.")
+
+    # 2. Avoid offensive content. Streamed tokens cannot be taken back, so
+    # moderation always completes before the completion starts.
+    with stage("/chat/stream", "moderation"):
+        is_offensive = await services.openai_client.is_offensive_content(user_message)
+    if is_offensive:
+        raise HTTPException(400, "Message contains offensive content.")
+
+    # 3. Get transaction ID from request or generate a new one
+    transaction_id = chat_request.transaction_id or str(uuid.uuid4())
+
+    # 4. Get conversation history and build the context within the budget
+    try:
+        with stage("/chat/stream", "load"):
+            conversation = await services.storage.get_or_create_conversation(
+                transaction_id
+            )
+        with stage("/chat/stream", "context"):
+            messages = await build_context(
+                services.openai_client,
+                conversation,
+                Message(role=MessageRole.USER, content=user_message),
+                CONTEXT_TOKEN_BUDGET,
+                chat_system_message(),
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Failed to generate response: {str(e)}")
 
+    # 5. Stream response from LLM. Streams are not covered by SESSION_LOCKS:
+    # concurrent turns are rebased or rejected when the turn is stored
+    return StreamingResponse(
+        stream_chat_events(
+            services,
+            transaction_id,
+            conversation,
+            user_message,
+            messages,
+            chat_completion_options(request),
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
-@router.post("/chat/summary")
-def chat_summary(
-    request: Request, chat_summary_request: ChatSummaryRequest
+async def chat_summary(
+    request: Request,
+    chat_summary_request: ChatSummaryRequest,
+    services: Services = Depends(get_services),
 ) -> ChatSummaryResponse:
     """
     POST endpoint to get a summary of the conversation history.
@@ -85,20 +461,159 @@ def chat_summary(
         raise HTTPException(400, "Transaction ID cannot be empty.")
 
     # 2. Retrieve conversation if it exists
-    conversation = storage.get_conversation(transaction_id)
+    with stage("/chat/summary", "load"):
+        conversation = await services.storage.get_conversation(transaction_id)
     if not conversation:
         raise HTTPException(404, "Conversation not found.")
 
     try:
-        # 3. Generate summary from LLM
-        history_messages = [parse_message(message) for message in conversation.messages]
-        response_content = openai_client.create_chat_completion(
-            messages=[CHAT_SUMMARY_SYSTEM_MESSAGE, *history_messages]
-        )
+        # 3. Reuse the stored summary, or generate it from LLM
+        with stage("/chat/summary", "summary"):
+            summary = await summarize_conversation(services, conversation)
 
         return ChatSummaryResponse(
-            summary=response_content,
+            summary=summary,
             collected_data=conversation.collected_data or CollectedData(),
         )
     except Exception as e:
         raise HTTPException(500, f"Failed to generate summary: {str(e)}")
+
+
+async def summary_batch_lines(
+    services: Services,
+    transaction_ids: list[str],
+    conversations: dict[str, Conversation],
+) -> AsyncIterator[str]:
+    """
+    Summarize the conversations with at most SUMMARY_BATCH_CONCURRENCY
+    summaries in flight and yield one NDJSON line per transaction as soon as
+    it is ready. Missing and failed conversations get their own line.
+    """
+    semaphore = asyncio.Semaphore(SUMMARY_BATCH_CONCURRENCY)
+
+    async def summarize(transaction_id: str) -> ChatSummaryBatchItem:
+        conversation = conversations.get(transaction_id)
+        if conversation is None:
+            return ChatSummaryBatchItem(
+                transaction_id=transaction_id, status="not_found"
+            )
+        try:
+            async with semaphore:
+                with stage("/chat/summary/batch", "summary"):
+                    summary = await summarize_conversation(services, conversation)
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Failed to summarize {transaction_id}: {detail}")
+            return ChatSummaryBatchItem(
+                transaction_id=transaction_id, status="error", error=detail
+            )
+        return ChatSummaryBatchItem(
+            transaction_id=transaction_id,
+            status="ok",
+            summary=summary,
+            collected_data=conversation.collected_data or CollectedData(),
+        )
+
+    tasks = [
+        asyncio.create_task(summarize(transaction_id))
+        for transaction_id in transaction_ids
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            item = await task
+            yield item.model_dump_json(exclude_none=True) + "\n"
+    finally:
+        # The client went away: stop the summaries still queued or running
+        for task in tasks:
+            task.cancel()
+
+
+async def chat_summary_batch(
+    request: Request,
+    batch_request: ChatSummaryBatchRequest,
+    services: Services = Depends(get_services),
+) -> StreamingResponse:
+    """
+    POST endpoint that summarizes many conversations at once, streaming one
+    ChatSummaryBatchItem per line (NDJSON) in completion order.
+    """
+    # 1. Deduplicate the transaction IDs, keeping their order
+    transaction_ids = list(
+        dict.fromkeys(
+            transaction_id.strip() for transaction_id in batch_request.transaction_ids
+        )
+    )
+
+    # 2. Load every conversation in one storage call
+    try:
+        with stage("/chat/summary/batch", "load"):
+            conversations = await services.storage.get_conversations(transaction_ids)
+    except Exception as e:
+        raise HTTPException(500, f"Failed to load conversations: {str(e)}")
+
+    # 3. Stream the summaries as they complete
+    return StreamingResponse(
+        summary_batch_lines(services, transaction_ids, conversations),
+        media_type="application/x-ndjson",
+    )
+
+
+async def list_conversations(
+    request: Request,
+    order_number: Optional[int] = None,
+    problem_category: Optional[str] = None,
+    urgency_level: Optional[UrgencyLevel] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    services: Services = Depends(get_services),
+) -> ConversationListResponse:
+    """
+    GET endpoint that finds conversations by their collected data and last
+    update, most recently updated first. Pass `next_cursor` back as `cursor`
+    to get the next page.
+    """
+    query = ConversationQuery(
+        order_number=order_number,
+        problem_category=problem_category,
+        urgency_level=urgency_level,
+        updated_after=updated_after,
+        updated_before=updated_before,
+        limit=limit,
+        cursor=cursor,
+    )
+    try:
+        with stage("/chat/conversations", "query"):
+            page = await services.storage.query_conversations(query)
+    except InvalidCursorError as e:
+        raise HTTPException(400, str(e))
+    except NotImplementedError as e:
+        raise HTTPException(503, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Failed to query conversations: {str(e)}")
+
+    return ConversationListResponse(
+        conversations=[
+            ConversationListItem(
+                transaction_id=item.session_id,
+                **item.model_dump(exclude={"session_id"}),
+            )
+            for item in page.items
+        ],
+        next_cursor=page.next_cursor,
+    )
+
+
+def create_router(limiter: Limiter) -> APIRouter:
+    """The chat endpoints, each with its own budget per client in `limiter`"""
+    router = APIRouter()
+    for method, path, endpoint, limit in [
+        ("POST", "/chat", chat, CHAT_RATE_LIMIT),
+        ("POST", "/chat/stream", chat_stream, CHAT_RATE_LIMIT),
+        ("POST", "/chat/summary", chat_summary, SUMMARY_RATE_LIMIT),
+        ("POST", "/chat/summary/batch", chat_summary_batch, SUMMARY_BATCH_RATE_LIMIT),
+        ("GET", "/chat/conversations", list_conversations, QUERY_RATE_LIMIT),
+    ]:
+        router.add_api_route(path, limiter.limit(limit)(endpoint), methods=[method])
+    return router
@@ -0,0 +1,162 @@
+"""
+Token-budgeted prompt construction for /chat.
+
+The system prompt and the user's new message are always sent. Older turns are
+sent verbatim while they fit the budget; beyond that the oldest turns are
+folded into a rolling summary stored on the conversation, and the collected
+data state is sent alongside it so no field is lost with the folded turns.
+"""
+
+import logging
+from typing import TYPE_CHECKING, Optional
+
+import metrics
+from chat.prompts import (CHAT_SYSTEM_MESSAGE, CONTEXT_SUMMARY_SYSTEM_MESSAGE,
+                          collected_data_message, history_summary_message,
+                          previous_summary_message)
+from chat.utils import parse_message
+from llm.tokens import MESSAGE_OVERHEAD_TOKENS, count_tokens
+from storage.models import (CollectedData, Conversation, ConversationSummary,
+                            Message, MessageRole)
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessageParam as OpenAIMessage
+    from openai.types.chat import \
+        ChatCompletionSystemMessageParam as OpenAISystemMessage
+
+    from openai_client import AsyncOpenAIClient
+
+logger = logging.getLogger(__name__)
+
+# Tokens kept free for the rolling summary when deciding what to fold
+SUMMARY_RESERVE_TOKENS = 200
+
+# A fold shrinks the verbatim history to this share of its budget, so the
+# next turns fit again without folding every time
+FOLD_TARGET_RATIO = 0.5
+
+context_tokens = metrics.counter(
+    "chat_context_tokens_total", "Estimated prompt tokens sent for chat turns"
+)
+history_tokens = metrics.counter(
+    "chat_context_history_tokens_total",
+    "Estimated tokens of stored history sent verbatim in chat prompts",
+)
+folded_tokens = metrics.counter(
+    "chat_context_folded_tokens_total",
+    "Estimated history tokens replaced by the rolling summary in chat prompts",
+)
+context_folds = metrics.counter(
+    "chat_context_folds_total", "LLM calls that folded older turns into the summary"
+)
+
+
+def message_tokens(message: Message) -> int:
+    """Prompt tokens of a stored message, counting it only once"""
+    if message.token_count is None:
+        message.token_count = count_tokens(message.content)
+    return message.token_count + MESSAGE_OVERHEAD_TOKENS
+
+
+def _prompt_tokens(messages: list["OpenAIMessage"]) -> int:
+    return sum(
+        count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    )
+
+
+def window_start(messages: list[Message], budget: float) -> int:
+    """
+    Index of the first message of the longest run of latest turns that fits
+    in `budget` tokens. The run always starts at a user message.
+    """
+    start = len(messages)
+    used = 0
+    for index in range(len(messages) - 1, -1, -1):
+        used += message_tokens(messages[index])
+        if used > budget:
+            break
+        if messages[index].role == MessageRole.USER:
+            start = index
+    return start
+
+
+async def fold_history(
+    openai_client: "AsyncOpenAIClient",
+    previous: Optional[ConversationSummary],
+    messages: list[Message],
+    message_count: int,
+) -> ConversationSummary:
+    """Fold `messages` into the previous rolling summary"""
+    context_folds.inc()
+    text = await openai_client.create_chat_completion(
+        messages=[
+            CONTEXT_SUMMARY_SYSTEM_MESSAGE,
+            *([previous_summary_message(previous.text)] if previous else []),
+            *[parse_message(message) for message in messages],
+        ]
+    )
+    return ConversationSummary(text=text, message_count=message_count)
+
+
+async def build_context(
+    openai_client: "AsyncOpenAIClient",
+    conversation: Conversation,
+    user_message: Message,
+    budget: int,
+    system_message: "OpenAISystemMessage" = CHAT_SYSTEM_MESSAGE,
+) -> list["OpenAIMessage"]:
+    """
+    Messages for the chat completion within `budget` tokens (0 disables the
+    budget). May fold older turns into conversation.history_summary, which is
+    stored with the turn. A turn rebased by save_turn keeps the summary of
+    the conversation it is rebased onto instead.
+    """
+    history = conversation.messages
+    history_size = sum(message_tokens(message) for message in history)
+    fixed_size = _prompt_tokens([system_message]) + message_tokens(user_message)
+
+    if not budget or fixed_size + history_size <= budget:
+        messages = [
+            system_message,
+            *[parse_message(message) for message in history],
+            parse_message(user_message),
+        ]
+        history_tokens.inc(history_size)
+        context_tokens.inc(fixed_size + history_size)
+        return messages
+
+    collected_data = conversation.collected_data or CollectedData()
+    state = collected_data_message(collected_data.model_dump_json())
+    history_budget = (
+        budget - fixed_size - _prompt_tokens([state]) - SUMMARY_RESERVE_TOKENS
+    )
+    start = window_start(history, history_budget)
+
+    summary = conversation.history_summary
+    if summary is not None and summary.message_count > len(history):
+        # History was rewritten since the summary was made
+        summary = None
+    covered = summary.message_count if summary is not None else 0
+    if covered < start:
+        target = max(start, window_start(history, history_budget * FOLD_TARGET_RATIO))
+        summary = await fold_history(
+            openai_client, summary, history[covered:target], target
+        )
+        conversation.history_summary = summary
+        covered = target
+        logger.info(f"Folded {target} messages of {conversation.session_id}")
+
+    verbatim = history[covered:]
+    messages = [
+        system_message,
+        *([history_summary_message(summary.text)] if summary is not None else []),
+        state,
+        *[parse_message(message) for message in verbatim],
+        parse_message(user_message),
+    ]
+    verbatim_size = sum(message_tokens(message) for message in verbatim)
+    history_tokens.inc(verbatim_size)
+    folded_tokens.inc(history_size - verbatim_size)
+    context_tokens.inc(_prompt_tokens(messages))
+    return messages
@@ -1,8 +1,9 @@
-from typing import Optional
+from datetime import datetime
+from typing import Literal, Optional
 
 from pydantic import BaseModel, Field
 
-from storage.models import CollectedData
+from storage.models import CollectedData, UrgencyLevel
 
 
 class OpenAIResponse(BaseModel):
@@ -36,3 +37,40 @@ class ChatSummaryRequest(BaseModel):
 class ChatSummaryResponse(BaseModel):
     summary: str
     collected_data: CollectedData
+
+
+class ChatSummaryBatchRequest(BaseModel):
+    transaction_ids: list[str] = Field(
+        ...,
+        min_length=1,
+        max_length=1000,
+        description="Transaction identifiers of the conversations to summarize",
+    )
+
+
+class ChatSummaryBatchItem(BaseModel):
+    """One line of the /chat/summary/batch stream"""
+
+    transaction_id: str
+    status: Literal["ok", "not_found", "error"]
+    summary: Optional[str] = None
+    collected_data: Optional[CollectedData] = None
+    error: Optional[str] = None
+
+
+class ConversationListItem(BaseModel):
+    """One conversation found by GET /chat/conversations"""
+
+    transaction_id: str
+    order_number: Optional[int] = None
+    problem_category: Optional[str] = None
+    urgency_level: Optional[UrgencyLevel] = None
+    message_count: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class ConversationListResponse(BaseModel):
+    conversations: list[ConversationListItem]
+    # Pass back as `cursor` to get the next page, None on the last page
+    next_cursor: Optional[str] = None
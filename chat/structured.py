@@ -0,0 +1,202 @@
+"""
+Native structured output for /chat.
+
+Instead of asking the model to append a <COLLECTED_DATA> block, the
+completion is constrained to a JSON schema generated from OpenAIResponse,
+so the reply and the collected data arrive as one JSON object. It is parsed
+with jiter, whose partial mode also recovers the fields of an object cut off
+by `max_tokens` and lets streamed replies be forwarded as they grow. Content
+that is not JSON at all falls back to the <COLLECTED_DATA> parser.
+"""
+
+import logging
+import re
+from typing import Any, Optional
+
+import jiter
+from pydantic import ValidationError
+
+from chat.models import OpenAIResponse
+from chat.utils import parse_failures, parse_tagged_response, parsed_responses
+from storage.models import CollectedData
+
+logger = logging.getLogger(__name__)
+
+# A number value at the very end of the content, which may have been cut off
+TRAILING_NUMBER = re.compile(rb"[:,\[]\s*-?[0-9][0-9.eE+-]*$")
+# Escaped characters, skipped when counting the quotes of cut off content
+ESCAPE = re.compile(rb"\\.")
+
+# Keywords structured outputs accept; length limits and defaults are dropped
+# and left to pydantic validation
+SCHEMA_KEYWORDS = {
+    "type",
+    "properties",
+    "required",
+    "enum",
+    "anyOf",
+    "items",
+    "$ref",
+    "$defs",
+}
+
+
+def strict_schema(schema: Any) -> Any:
+    """
+    JSON schema in the strict dialect of structured outputs: every property
+    required, no additional properties, unsupported keywords removed.
+    """
+    if isinstance(schema, list):
+        return [strict_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    strict = {}
+    for key, value in schema.items():
+        if key not in SCHEMA_KEYWORDS:
+            continue
+        if key in ("properties", "$defs"):
+            strict[key] = {name: strict_schema(sub) for name, sub in value.items()}
+        else:
+            strict[key] = strict_schema(value)
+    if "properties" in strict:
+        strict["required"] = list(strict["properties"])
+        strict["additionalProperties"] = False
+    return strict
+
+
+CHAT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "support_reply",
+        "strict": True,
+        "schema": strict_schema(OpenAIResponse.model_json_schema()),
+    },
+}
+
+
+def _ends_in_number(content: bytes) -> bool:
+    """Whether cut off JSON content stops inside a number value"""
+    in_string = ESCAPE.sub(b"", content).count(b'"') % 2 == 1
+    return not in_string and TRAILING_NUMBER.search(content) is not None
+
+
+def _drop_truncated_number(data: dict) -> None:
+    """
+    Remove the last value of an object cut off inside a number, since "1234"
+    cut after "12" still parses. Cut off strings are already dropped by jiter.
+    """
+    while data:
+        key = next(reversed(data))
+        value = data[key]
+        if isinstance(value, dict):
+            data = value
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            del data[key]
+        return
+
+
+def _collected_data(data: Any) -> Optional[CollectedData]:
+    """Validate the collected data field by field, keeping the valid ones"""
+    if not isinstance(data, dict):
+        return None
+    try:
+        return CollectedData.model_validate(data)
+    except ValidationError as e:
+        logger.warning(f"Invalid fields in structured collected data: {e}")
+    valid = {}
+    for field, value in data.items():
+        if field in CollectedData.model_fields:
+            try:
+                CollectedData.model_validate({field: value})
+            except ValidationError:
+                continue
+            valid[field] = value
+    return CollectedData.model_validate(valid)
+
+
+def parse_structured_response(response_content: str) -> OpenAIResponse:
+    """
+    Parse a structured output completion. A JSON object cut off by
+    `max_tokens` keeps its complete fields. Content that is not JSON goes
+    through the <COLLECTED_DATA> parser. Failures to recover the collected
+    data are counted in `chat_parse_failures_structured_total`.
+    """
+    parsed_responses["structured"].inc()
+    content = response_content.strip().encode()
+    truncated = False
+    try:
+        data = jiter.from_json(content)
+    except ValueError:
+        try:
+            # Cut off strings are dropped, except for the reply: its start is
+            # still worth showing
+            data = jiter.from_json(content, partial_mode="on")
+            partial = jiter.from_json(content, partial_mode="trailing-strings")
+            if isinstance(data, dict) and isinstance(partial, dict):
+                data.setdefault("reply", partial.get("reply"))
+            truncated = True
+        except ValueError:
+            data = None
+
+    if not isinstance(data, dict) or not isinstance(data.get("reply"), str):
+        logger.warning("Structured response is not a JSON reply, parsing it as text.")
+        openai_response, ok = parse_tagged_response(response_content)
+        if not ok:
+            parse_failures["structured"].inc()
+        return openai_response
+
+    if truncated:
+        logger.warning("Structured response was cut off, keeping its complete fields.")
+        if _ends_in_number(content):
+            _drop_truncated_number(data)
+    collected_data = _collected_data(data.get("collected_data"))
+    if collected_data is None:
+        parse_failures["structured"].inc()
+    return OpenAIResponse(
+        reply=data["reply"].strip(), collected_data=collected_data or CollectedData()
+    )
+
+
+class StructuredStreamParser:
+    """
+    Counterpart of CollectedDataStreamParser for structured output streams.
+    The JSON received so far is parsed partially after every chunk, and the
+    growth of its `reply` field is released to the user.
+    """
+
+    def __init__(self):
+        self._content: list[str] = []
+        self._released = 0
+        self._response: Optional[OpenAIResponse] = None
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk and return the reply text it releases."""
+        self._content.append(chunk)
+        try:
+            data = jiter.from_json(
+                "".join(self._content).encode(), partial_mode="trailing-strings"
+            )
+        except ValueError:
+            return ""
+        reply = data.get("reply") if isinstance(data, dict) else None
+        if not isinstance(reply, str) or len(reply) <= self._released:
+            return ""
+        text = reply[self._released :]
+        self._released = len(reply)
+        return text
+
+    def finish(self) -> str:
+        """
+        Signal the end of the stream. The reply was released as it arrived,
+        unless the model answered with plain text instead of JSON.
+        """
+        if self._released:
+            return ""
+        return self.to_response().reply
+
+    def to_response(self) -> OpenAIResponse:
+        """Build the OpenAIResponse for everything consumed so far."""
+        if self._response is None:
+            self._response = parse_structured_response("".join(self._content))
+        return self._response
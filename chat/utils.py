@@ -1,37 +1,92 @@
+import asyncio
 import logging
 import re
+import weakref
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Optional
 
-from openai.types.chat import \
-    ChatCompletionAssistantMessageParam as OpenAIAssistantMessage
-from openai.types.chat import ChatCompletionMessageParam as OpenAIMessage
-from openai.types.chat import \
-    ChatCompletionUserMessageParam as OpenAIUserMessage
 from pydantic import ValidationError
 
+import metrics
 from chat.models import OpenAIResponse
 from storage.models import CollectedData, Message, MessageRole
 
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessageParam as OpenAIMessage
+
 # Initialize logger
 logger = logging.getLogger(__name__)
 
+# Per output mode: completions parsed, and those whose collected data was lost
+# (the turn then has to ask for it again)
+OUTPUT_MODES = ("regex", "structured")
+parsed_responses = {
+    mode: metrics.counter(
+        f"chat_parsed_responses_{mode}_total",
+        f"Chat completions parsed in {mode} output mode",
+    )
+    for mode in OUTPUT_MODES
+}
+parse_failures = {
+    mode: metrics.counter(
+        f"chat_parse_failures_{mode}_total",
+        f"Chat completions in {mode} output mode whose collected data was lost",
+    )
+    for mode in OUTPUT_MODES
+}
+
 
-def parse_message(message: Message) -> OpenAIMessage:
+def parse_message(message: Message) -> "OpenAIMessage":
     """
     Parse a Message object into an OpenAI message.
     """
     if message.role == MessageRole.USER:
-        return OpenAIUserMessage(role="user", content=message.content)
+        return {"role": "user", "content": message.content}
     elif message.role == MessageRole.ASSISTANT:
-        return OpenAIAssistantMessage(role="assistant", content=message.content)
+        return {"role": "assistant", "content": message.content}
     else:
         raise ValueError(f"Invalid message role: {message.role}")
 
 
+COLLECTED_DATA_OPEN_TAG = "<COLLECTED_DATA>"
+COLLECTED_DATA_CLOSE_TAG = "</COLLECTED_DATA>"
+
+
+def _validate_collected_data(collected_json: str) -> Optional[CollectedData]:
+    try:
+        return CollectedData.model_validate_json(collected_json)
+    except ValidationError as e:
+        logger.error(f"Invalid JSON in <COLLECTED_DATA>: {collected_json} | Error: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error parsing <COLLECTED_DATA>: {e}")
+    return None
+
+
+def parse_collected_data(collected_json: str) -> CollectedData:
+    """
+    Validate the JSON payload of a <COLLECTED_DATA> block, falling back to an
+    empty CollectedData when it is invalid.
+    """
+    return _validate_collected_data(collected_json) or CollectedData()
+
+
 def parse_response(response_content: str) -> OpenAIResponse:
     """
     Extract <COLLECTED_DATA> block from assistant response and parse it into
     an OpenAIResponse object.
     """
+    parsed_responses["regex"].inc()
+    openai_response, ok = parse_tagged_response(response_content)
+    if not ok:
+        parse_failures["regex"].inc()
+    return openai_response
+
+
+def parse_tagged_response(response_content: str) -> tuple[OpenAIResponse, bool]:
+    """
+    parse_response without the metrics. The flag tells whether the
+    <COLLECTED_DATA> block was found and valid.
+    """
 
     match = re.search(
         r"<COLLECTED_DATA>(.*?)</COLLECTED_DATA>", response_content, re.DOTALL
@@ -48,18 +103,100 @@ def parse_response(response_content: str) -> OpenAIResponse:
 
     if not collected_json:
         logger.warning("No <COLLECTED_DATA> block found in response.")
-        return openai_response
+        return openai_response, False
 
-    try:
-        openai_response.collected_data = CollectedData.model_validate_json(
-            collected_json
-        )
-    except ValidationError as e:
-        logger.error(f"Invalid JSON in <COLLECTED_DATA>: {collected_json} | Error: {e}")
-    except Exception as e:
-        logger.error(f"Unexpected error parsing <COLLECTED_DATA>: {e}")
+    collected_data = _validate_collected_data(collected_json)
+    openai_response.collected_data = collected_data or CollectedData()
+    return openai_response, collected_data is not None
 
-    return openai_response
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """Length of the longest suffix of text that is a proper prefix of tag."""
+    for length in range(min(len(text), len(tag) - 1), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class CollectedDataStreamParser:
+    """
+    Incremental counterpart of parse_response for streamed completions.
+
+    feed() returns the reply text that is safe to forward to the user. The
+    <COLLECTED_DATA> block is held back, including a tag split across chunks,
+    and parsed once the stream is over.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._in_block = False
+        self._reply: list[str] = []
+        self._block: list[str] = []
+        self._collected_json: Optional[str] = None
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk and return the reply text it releases."""
+        self._pending += chunk
+        released = []
+
+        while self._pending:
+            if self._in_block:
+                end = self._pending.find(COLLECTED_DATA_CLOSE_TAG)
+                if end == -1:
+                    # Keep a possible partial closing tag out of the block body
+                    keep = _partial_tag_length(
+                        self._pending, COLLECTED_DATA_CLOSE_TAG
+                    )
+                    self._block.append(self._pending[: len(self._pending) - keep])
+                    self._pending = self._pending[len(self._pending) - keep :]
+                    break
+                self._block.append(self._pending[:end])
+                if self._collected_json is None:
+                    self._collected_json = "".join(self._block).strip()
+                self._block = []
+                self._pending = self._pending[end + len(COLLECTED_DATA_CLOSE_TAG) :]
+                self._in_block = False
+            else:
+                start = self._pending.find(COLLECTED_DATA_OPEN_TAG)
+                if start == -1:
+                    keep = _partial_tag_length(self._pending, COLLECTED_DATA_OPEN_TAG)
+                    released.append(self._pending[: len(self._pending) - keep])
+                    self._pending = self._pending[len(self._pending) - keep :]
+                    break
+                released.append(self._pending[:start])
+                self._pending = self._pending[start + len(COLLECTED_DATA_OPEN_TAG) :]
+                self._in_block = True
+
+        text = "".join(released)
+        self._reply.append(text)
+        return text
+
+    def finish(self) -> str:
+        """Signal the end of the stream and return any reply text still held back."""
+        if self._in_block:
+            logger.warning("Unterminated <COLLECTED_DATA> block in streamed response.")
+            text = ""
+        else:
+            # A trailing partial tag that never completed is ordinary text
+            text = self._pending
+        self._pending = ""
+        self._reply.append(text)
+        return text
+
+    def to_response(self) -> OpenAIResponse:
+        """Build the OpenAIResponse for everything consumed so far."""
+        parsed_responses["regex"].inc()
+        reply = "".join(self._reply).strip()
+        collected_data = None
+        if not self._collected_json:
+            logger.warning("No <COLLECTED_DATA> block found in response.")
+        else:
+            collected_data = _validate_collected_data(self._collected_json)
+        if collected_data is None:
+            parse_failures["regex"].inc()
+        return OpenAIResponse(
+            reply=reply, collected_data=collected_data or CollectedData()
+        )
 
 
 def update_collected_data(
@@ -73,3 +210,30 @@ def update_collected_data(
     return collected_data.model_copy(
         update=new_collected_data.model_dump(exclude_none=True)
     )
+
+
+def is_complete(collected_data: Optional[CollectedData]) -> bool:
+    """Whether every collected data field has been filled in"""
+    return collected_data is not None and all(
+        value is not None for value in collected_data.model_dump().values()
+    )
+
+
+class SessionLocks:
+    """
+    Per-session asyncio locks for single-process deployments. A lock only
+    lives while some request holds or waits for it.
+    """
+
+    def __init__(self):
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = (
+            weakref.WeakValueDictionary()
+        )
+
+    @asynccontextmanager
+    async def hold(self, session_id: str) -> AsyncIterator[None]:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        async with lock:
+            yield
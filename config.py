@@ -1,18 +1,138 @@
-from dotenv import load_dotenv
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+"""
+Settings read from the environment or `.env`. The objects built from them
+are created by services.py when an app needs them.
+"""
+
+import os
 
-from openai_client import OpenAIClient
-from storage import Storage
+from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Initialize IP limiter
-limiter = Limiter(key_func=get_remote_address)
+# API rate limits per client and endpoint. RATE_LIMIT_STORAGE_URI is a
+# `limits` storage URI: memory:// counts per worker, sqlite://<path> is shared
+# by the workers on the host and redis://<host>:<port> by every host.
+# RATE_LIMIT_KEY lists what identifies a client: ip, api_key, transaction
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+RATE_LIMIT_KEY = os.getenv("RATE_LIMIT_KEY", "ip")
+CHAT_RATE_LIMIT = os.getenv("CHAT_RATE_LIMIT", "10/minute")
+SUMMARY_RATE_LIMIT = os.getenv("SUMMARY_RATE_LIMIT", "30/minute")
+QUERY_RATE_LIMIT = os.getenv("QUERY_RATE_LIMIT", "60/minute")
+
+# Start the completion while moderation is still running. Faster, but flagged
+# messages still cost (part of) a completion.
+SPECULATIVE_MODERATION = os.getenv("SPECULATIVE_MODERATION", "false").lower() == "true"
+
+# What /chat does when another request stored a turn for the same conversation
+# in the meantime: "rebase" re-applies the turn on the latest version, "reject"
+# returns a 409
+CONFLICT_POLICY = os.getenv("CONFLICT_POLICY", "rebase")
+
+# Serialize requests per conversation within this process
+SESSION_LOCKS = os.getenv("SESSION_LOCKS", "false").lower() == "true"
+
+# Storage backend: "json" (one file per conversation), "log" or "sqlite".
+# STORAGE_PATH defaults to a backend specific location under storage/
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+STORAGE_PATH = os.getenv("STORAGE_PATH")
+
+# In-process conversation cache in front of storage (0 entries disables it)
+STORAGE_CACHE_ENTRIES = int(os.getenv("STORAGE_CACHE_ENTRIES", "1024"))
+STORAGE_CACHE_TTL = float(os.getenv("STORAGE_CACHE_TTL", "300"))
+
+# When /chat stores a turn. "sync" writes it before responding. "write_behind"
+# queues it and responds at once; a background writer stores the queue in
+# batches of STORAGE_FLUSH_BATCH, each synced to disk once. Responses no
+# longer wait on the disk, but turns queued in the last
+# STORAGE_FLUSH_INTERVAL_MS are lost if the process crashes
+STORAGE_WRITE_MODE = os.getenv("STORAGE_WRITE_MODE", "sync")
+STORAGE_WRITE_QUEUE_SIZE = int(os.getenv("STORAGE_WRITE_QUEUE_SIZE", "1000"))
+STORAGE_FLUSH_INTERVAL_MS = float(os.getenv("STORAGE_FLUSH_INTERVAL_MS", "50"))
+STORAGE_FLUSH_BATCH = int(os.getenv("STORAGE_FLUSH_BATCH", "100"))
+
+# Index of order_number, problem_category, urgency_level and updated_at behind
+# GET /chat/conversations. The sqlite backend indexes its own table; other
+# backends keep the index in an SQLite file at STORAGE_INDEX_PATH (unset
+# disables queries). Index an existing store with
+# `python -m storage rebuild-index`
+STORAGE_INDEX_PATH = os.getenv("STORAGE_INDEX_PATH")
+
+# Prompt token budget for /chat. Older turns beyond it are folded into a
+# rolling summary (0 sends the whole history)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+
+# Ask the model for a JSON object matching the response schema instead of a
+# <COLLECTED_DATA> block appended to the reply
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "false").lower() == "true"
+
+# Summaries generated at once by one /chat/summary/batch request
+SUMMARY_BATCH_CONCURRENCY = int(os.getenv("SUMMARY_BATCH_CONCURRENCY", "16"))
+SUMMARY_BATCH_RATE_LIMIT = os.getenv("SUMMARY_BATCH_RATE_LIMIT", "10/minute")
+
+# Summarize a conversation in the background as soon as all collected data
+# fields are filled in, so the first summary view is instant
+SUMMARY_PRECOMPUTE = os.getenv("SUMMARY_PRECOMPUTE", "false").lower() == "true"
+
+# Moderation verdict cache (0 entries disables it). MODERATION_CACHE_PATH adds
+# an SQLite tier that survives restarts and is shared by workers on the host
+MODERATION_CACHE_ENTRIES = int(os.getenv("MODERATION_CACHE_ENTRIES", "10000"))
+MODERATION_CACHE_TTL = float(os.getenv("MODERATION_CACHE_TTL", "86400"))
+MODERATION_CACHE_PATH = os.getenv("MODERATION_CACHE_PATH")
+
+# Completion cache for prompts with at most COMPLETION_CACHE_MAX_DEPTH user
+# messages, such as common opening turns (0 entries disables it)
+COMPLETION_CACHE_ENTRIES = int(os.getenv("COMPLETION_CACHE_ENTRIES", "0"))
+COMPLETION_CACHE_TTL = float(os.getenv("COMPLETION_CACHE_TTL", "3600"))
+COMPLETION_CACHE_MAX_DEPTH = int(os.getenv("COMPLETION_CACHE_MAX_DEPTH", "1"))
+
+# Coalesce concurrent moderation calls arriving within this many milliseconds
+# into one list-input call of at most MODERATION_BATCH_SIZE inputs (0 disables)
+MODERATION_BATCH_WINDOW_MS = float(os.getenv("MODERATION_BATCH_WINDOW_MS", "0"))
+MODERATION_BATCH_SIZE = int(os.getenv("MODERATION_BATCH_SIZE", "32"))
+
+# Client-side admission control for upstream calls: callers queue locally
+# under an adaptive (AIMD) concurrency limit and request/token buckets learned
+# from the rate limit headers. The per-minute budgets seed the buckets before
+# the first response arrives (0 leaves them to the headers)
+OPENAI_RATE_LIMITER = os.getenv("OPENAI_RATE_LIMITER", "false").lower() == "true"
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "64"))
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "0"))
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "0"))
+
+# Hedge completions that have not answered after this percentile of recent
+# latencies (0 disables), never before HEDGE_MIN_DELAY_MS, and for at most a
+# HEDGE_BUDGET share of calls
+HEDGE_PERCENTILE = int(os.getenv("HEDGE_PERCENTILE", "0"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "1000"))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+
+# Stop sending completions to a failing upstream: once CIRCUIT_ERROR_RATE of
+# the last CIRCUIT_WINDOW calls failed or took longer than
+# CIRCUIT_LATENCY_THRESHOLD_MS, fail fast (or use FALLBACK_MODEL) for
+# CIRCUIT_RESET_TIMEOUT seconds before probing again
+CIRCUIT_BREAKER = os.getenv("CIRCUIT_BREAKER", "false").lower() == "true"
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_LATENCY_THRESHOLD_MS = float(os.getenv("CIRCUIT_LATENCY_THRESHOLD_MS", "0"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+FALLBACK_MODEL = os.getenv("FALLBACK_MODEL")
+
+# Connection pool shared by all upstream calls. HTTP/2 is used when requested
+# and the optional h2 package is installed
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "1000"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "100")
+)
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true").lower() == "true"
 
-# Initialize OpenAI client
-openai_client = OpenAIClient()
+# Connect and read timeouts in seconds, per kind of upstream call
+MODERATION_CONNECT_TIMEOUT = float(os.getenv("MODERATION_CONNECT_TIMEOUT", "5"))
+MODERATION_READ_TIMEOUT = float(os.getenv("MODERATION_READ_TIMEOUT", "15"))
+COMPLETION_CONNECT_TIMEOUT = float(os.getenv("COMPLETION_CONNECT_TIMEOUT", "5"))
+COMPLETION_READ_TIMEOUT = float(os.getenv("COMPLETION_READ_TIMEOUT", "60"))
 
-# Initialize conversation "database"
-storage = Storage(db_path="storage/records")
+# Connections opened to the upstream on startup, before the app reports
+# ready (0 skips the warm-up)
+OPENAI_WARM_UP_CONNECTIONS = int(os.getenv("OPENAI_WARM_UP_CONNECTIONS", "0"))
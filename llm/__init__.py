@@ -0,0 +1,19 @@
+from .cache import LRUCache
+from .circuit_breaker import CircuitBreaker
+from .completion_cache import CompletionCache
+from .hedging import HedgePolicy
+from .moderation_batcher import ModerationBatcher
+from .moderation_cache import ModerationCache
+from .rate_limiter import RateLimiter
+from .tokens import count_tokens
+
+__all__ = [
+    "CircuitBreaker",
+    "CompletionCache",
+    "HedgePolicy",
+    "LRUCache",
+    "ModerationBatcher",
+    "ModerationCache",
+    "RateLimiter",
+    "count_tokens",
+]
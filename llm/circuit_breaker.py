@@ -0,0 +1,120 @@
+"""
+Circuit breaker for upstream calls.
+
+The breaker watches the outcome of the last `window` calls. Once the share of
+failures reaches `error_rate`, it opens and calls fail fast (or are routed to
+a fallback) for `reset_timeout` seconds. It then lets a probe call through
+(half-open): a success closes it again, a failure reopens it. Calls slower
+than `latency_threshold` count as failures, so a degraded upstream trips the
+breaker before its calls start erroring.
+"""
+
+import enum
+import logging
+import time
+from collections import deque
+from typing import Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 20
+DEFAULT_ERROR_RATE = 0.5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+# Calls a window must hold before the error rate can open the breaker
+MIN_CALLS = 5
+
+circuit_states = metrics.gauge(
+    "circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open, by breaker"
+)
+circuit_transitions = metrics.counter(
+    "circuit_transitions_total", "Circuit breaker transitions, by breaker and state"
+)
+circuit_rejections = metrics.counter(
+    "circuit_rejected_total", "Calls refused while the circuit was open, by breaker"
+)
+
+
+class CircuitState(enum.IntEnum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker over a sliding window of call outcomes.
+    Transitions are logged and counted in `circuit_transitions_total`, and
+    the current state is the `circuit_state` gauge, both labelled with the
+    breaker's name.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = DEFAULT_WINDOW,
+        error_rate: float = DEFAULT_ERROR_RATE,
+        latency_threshold: Optional[float] = None,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+    ):
+        self.name = name
+        self.error_rate = error_rate
+        self.latency_threshold = latency_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._retry_at = 0.0
+
+        circuit_states.set_function(lambda: self.state, name=name)
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go upstream. Once the reset timeout has passed,
+        one probe is let through per timeout until a probe reports back.
+        """
+        if self.state == CircuitState.CLOSED:
+            return True
+        now = time.monotonic()
+        if now < self._retry_at:
+            circuit_rejections.inc(name=self.name)
+            return False
+        if self.state == CircuitState.OPEN:
+            self._transition(CircuitState.HALF_OPEN)
+        # Give the probe a full timeout before letting the next one through
+        self._retry_at = now + self.reset_timeout
+        return True
+
+    def record_success(self, latency: float) -> None:
+        if self.latency_threshold is not None and latency > self.latency_threshold:
+            self.record_failure()
+            return
+        if self.state == CircuitState.HALF_OPEN:
+            self._outcomes.clear()
+            self._transition(CircuitState.CLOSED)
+        self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        if self.state == CircuitState.HALF_OPEN:
+            self._open()
+            return
+        self._outcomes.append(False)
+        failures = self._outcomes.count(False)
+        if (
+            self.state == CircuitState.CLOSED
+            and len(self._outcomes) >= MIN_CALLS
+            and failures / len(self._outcomes) >= self.error_rate
+        ):
+            self._open()
+
+    def _open(self) -> None:
+        self._retry_at = time.monotonic() + self.reset_timeout
+        self._transition(CircuitState.OPEN)
+
+    def _transition(self, state: CircuitState) -> None:
+        logger.warning(
+            f"Circuit {self.name} {self.state.name.lower()} -> {state.name.lower()}"
+        )
+        self.state = state
+        circuit_transitions.inc(name=self.name, state=state.name.lower())
@@ -0,0 +1,96 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+
+import metrics
+
+from .cache import LRUCache
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_TTL = 60 * 60.0
+
+# Only prompts with at most this many user messages are cached: the first
+# turn of a conversation by default
+DEFAULT_MAX_DEPTH = 1
+
+completion_cache_hits = metrics.counter(
+    "completion_cache_hits_total", "Chat completions served from the cache"
+)
+completion_cache_misses = metrics.counter(
+    "completion_cache_misses_total", "Cacheable chat completions sent to OpenAI"
+)
+completion_cache_saved_tokens = metrics.counter(
+    "completion_cache_saved_tokens_total",
+    "Estimated prompt and completion tokens not spent thanks to the cache",
+)
+completion_cache_saved_seconds = metrics.counter(
+    "completion_cache_saved_seconds_total",
+    "Upstream latency the cached completions took when they were first made",
+)
+
+
+def completion_cache_key(model: str, messages: Iterable[dict], **params: Any) -> str:
+    """
+    Hash of the canonical JSON of the model, the request parameters and the
+    messages. Key order and formatting do not change the key.
+    """
+    request = {"model": model, "messages": list(messages), **params}
+    canonical = json.dumps(
+        request, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+@dataclass
+class CachedCompletion:
+    content: str
+    # Estimated tokens and upstream latency of the original call
+    tokens: int
+    latency: float
+
+
+class CompletionCache:
+    """
+    In-memory cache of chat completions for prompts shared by many sessions,
+    such as the opening turns. Prompts deeper than `max_depth` user messages
+    are never cached, so the cache only holds prefixes that actually repeat.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+    ):
+        self.memory: LRUCache[CachedCompletion] = LRUCache(
+            max_entries=max_entries, ttl=ttl
+        )
+        self.max_depth = max_depth
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def cacheable(self, messages: Iterable[dict]) -> bool:
+        depth = sum(message["role"] == "user" for message in messages)
+        return depth <= self.max_depth
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached completion content, or None"""
+        completion = self.memory.get(key)
+        if completion is None:
+            self.misses += 1
+            completion_cache_misses.inc()
+            return None
+        self.hits += 1
+        completion_cache_hits.inc()
+        completion_cache_saved_tokens.inc(completion.tokens)
+        completion_cache_saved_seconds.inc(completion.latency)
+        return completion.content
+
+    def set(self, key: str, content: str, tokens: int, latency: float) -> None:
+        self.memory.set(key, CachedCompletion(content, tokens, latency))
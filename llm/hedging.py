@@ -0,0 +1,113 @@
+"""
+Hedged requests: when a call has not answered within a high percentile of
+recent latencies, a duplicate is sent and whichever finishes first wins.
+"""
+
+import asyncio
+import statistics
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+DEFAULT_PERCENTILE = 95
+DEFAULT_MIN_DELAY = 1.0
+DEFAULT_BUDGET = 0.1
+DEFAULT_WINDOW = 1000
+
+# Latencies needed before the percentile replaces the minimum delay
+MIN_SAMPLES = 20
+
+# Hedges that can be saved up while traffic is calm
+MAX_BUDGET_TOKENS = 10.0
+
+hedgeable_calls = metrics.counter(
+    "hedgeable_calls_total", "Calls eligible for hedging, by policy"
+)
+hedges = metrics.counter(
+    "hedges_total", "Duplicate calls sent because the first was slow, by policy"
+)
+hedge_wins = metrics.counter(
+    "hedge_wins_total", "Hedged calls answered by the duplicate first, by policy"
+)
+
+
+class HedgePolicy:
+    """
+    Sends a hedge after the `percentile` of the last `window` latencies,
+    never earlier than `min_delay`. Every call earns `budget` hedge tokens
+    and a hedge costs one, so at most a `budget` share of calls is hedged
+    even when the upstream slows down as a whole.
+
+    Hedges and hedge wins are counted as `hedges_total` and
+    `hedge_wins_total`, against `hedgeable_calls_total`, labelled with the
+    policy's name.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        percentile: int = DEFAULT_PERCENTILE,
+        min_delay: float = DEFAULT_MIN_DELAY,
+        budget: float = DEFAULT_BUDGET,
+        window: int = DEFAULT_WINDOW,
+    ):
+        self.name = name
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget = budget
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._tokens = MAX_BUDGET_TOKENS
+
+    def delay(self) -> float:
+        """Seconds to wait for the first call before hedging it"""
+        if len(self._latencies) < MIN_SAMPLES:
+            return self.min_delay
+        cut = statistics.quantiles(self._latencies, n=100)[self.percentile - 1]
+        return max(self.min_delay, cut)
+
+    def record(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def _spend(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await `call()`, hedging it with a second `call()` when it is slow.
+        The loser is cancelled. If one attempt fails, the other one is still
+        awaited; only when both fail is the first failure raised.
+        """
+        hedgeable_calls.inc(name=self.name)
+        self._tokens = min(MAX_BUDGET_TOKENS, self._tokens + self.budget)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        primary = asyncio.ensure_future(call())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay())
+            if not done and self._spend():
+                hedges.inc(name=self.name)
+                tasks.add(asyncio.ensure_future(call()))
+
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            hedge_wins.inc(name=self.name)
+                        self.record(loop.time() - start)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,92 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+import metrics
+
+DEFAULT_WINDOW = 0.01
+DEFAULT_MAX_BATCH_SIZE = 32
+
+moderation_batches = metrics.counter(
+    "moderation_batches_total", "Moderation API calls made by the batcher"
+)
+moderation_batched_inputs = metrics.counter(
+    "moderation_batched_inputs_total", "Moderation requests sent through the batcher"
+)
+
+ModerateBatch = Callable[[list[str]], Awaitable[list[bool]]]
+
+
+class ModerationBatcher:
+    """
+    Coalesces moderation requests arriving within `window` seconds into a
+    single moderations call with a list input, then hands every waiter its
+    own verdict. A batch is sent early once it holds `max_batch_size`
+    distinct texts. Identical texts in one batch are sent once.
+
+    If the batched call fails, or returns a different number of verdicts
+    than it was sent texts, every waiter in the batch gets the exception.
+    """
+
+    def __init__(
+        self,
+        moderate: ModerateBatch,
+        window: float = DEFAULT_WINDOW,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    ):
+        self.moderate = moderate
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: dict[str, list[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batches: set[asyncio.Task] = set()
+
+    async def is_flagged(self, text: str) -> bool:
+        """Queue the text for the next batch and wait for its verdict"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(text, []).append(future)
+        moderation_batched_inputs.inc()
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        # Keep a reference so the task is not garbage collected mid-flight
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _send(self, batch: dict[str, list[asyncio.Future]]) -> None:
+        moderation_batches.inc()
+        texts = list(batch)
+        try:
+            verdicts = await self.moderate(texts)
+            if len(verdicts) != len(texts):
+                # zip() would leave the waiters of the missing verdicts hanging
+                raise ValueError(
+                    f"Moderation returned {len(verdicts)} results "
+                    f"for {len(texts)} inputs"
+                )
+        except BaseException as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        for text, flagged in zip(texts, verdicts):
+            for future in batch[text]:
+                # Waiters that were cancelled meanwhile are skipped
+                if not future.done():
+                    future.set_result(flagged)
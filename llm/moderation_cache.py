@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional
+
+import metrics
+
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_TTL = 24 * 60 * 60.0
+
+# Expired rows are purged from the disk tier every this many writes
+DISK_PURGE_INTERVAL = 1000
+
+moderation_cache_hits = metrics.counter(
+    "moderation_cache_hits_total", "Moderation verdicts served from the cache"
+)
+moderation_cache_misses = metrics.counter(
+    "moderation_cache_misses_total", "Moderation verdicts requested from OpenAI"
+)
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def moderation_cache_key(text: str) -> str:
+    """
+    Hash of the normalized text: Unicode NFKC, case folded, with whitespace
+    collapsed. Variants such as "Thanks", "thanks " and "THANKS" share a key.
+    """
+    normalized = WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+    return hashlib.sha256(normalized.casefold().encode()).hexdigest()
+
+
+class DiskVerdictStore:
+    """
+    SQLite tier of the moderation cache. It survives restarts and is shared
+    by every worker on the host. Database errors are logged and count as a
+    miss, or a verdict not stored: the cache never fails a moderation check.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, flagged INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL) WITHOUT ROWID"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[bool]:
+        try:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT flagged FROM verdicts WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Moderation cache read failed: {e}")
+            return None
+        return bool(row[0]) if row else None
+
+    def set(self, key: str, flagged: bool) -> None:
+        with self._writes_lock:
+            self._writes += 1
+            purge = self._writes % DISK_PURGE_INTERVAL == 0
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO verdicts (key, flagged, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, flagged, time.time() + self.ttl),
+            )
+            if purge:
+                connection.execute(
+                    "DELETE FROM verdicts WHERE expires_at <= ?", (time.time(),)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Moderation cache write failed: {e}")
+
+
+class ModerationCache:
+    """
+    Cache of moderation verdicts keyed by a normalized content hash.
+
+    An in-memory LRU bounded by entry count and TTL sits in front of an
+    optional on-disk SQLite tier. Disk lookups run in a worker thread.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        disk_path: Optional[str] = None,
+    ):
+        self.memory: LRUCache[bool] = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.disk = DiskVerdictStore(disk_path, ttl) if disk_path else None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    async def get(self, text: str) -> Optional[bool]:
+        """Cached verdict for the text, or None"""
+        key = moderation_cache_key(text)
+        flagged = self.memory.get(key)
+        if flagged is None and self.disk is not None:
+            flagged = await asyncio.to_thread(self.disk.get, key)
+            if flagged is not None:
+                self.memory.set(key, flagged)
+
+        if flagged is None:
+            self.misses += 1
+            moderation_cache_misses.inc()
+        else:
+            self.hits += 1
+            moderation_cache_hits.inc()
+        return flagged
+
+    async def set(self, text: str, flagged: bool) -> None:
+        """Store the verdict for the text in every tier"""
+        key = moderation_cache_key(text)
+        self.memory.set(key, flagged)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, flagged)
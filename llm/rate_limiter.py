@@ -0,0 +1,271 @@
+"""
+Client-side rate limiting for upstream OpenAI calls.
+
+`RateLimiter` queues callers locally instead of letting them hit a throttled
+upstream. It combines token buckets for requests and tokens per minute with
+an AIMD concurrency limit: the limit grows by one slot per window of
+successful calls and is cut multiplicatively when calls get a 429. The buckets learn
+the real budget from the `x-ratelimit-*` response headers, so they also
+account for other workers spending the same API key.
+"""
+
+import asyncio
+import email.utils
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Mapping, Optional
+
+import metrics
+
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_BACKOFF_INTERVAL = 1.0
+
+concurrency_limits = metrics.gauge(
+    "openai_limiter_concurrency_limit", "Current adaptive concurrency limit, by limiter"
+)
+in_flight_calls = metrics.gauge(
+    "openai_limiter_in_flight", "Calls currently admitted, by limiter"
+)
+queued_calls = metrics.gauge(
+    "openai_limiter_queued", "Calls waiting locally for admission, by limiter"
+)
+throttled_calls = metrics.counter(
+    "openai_limiter_throttled_total", "Calls rejected upstream with a 429, by limiter"
+)
+wait_seconds = metrics.counter(
+    "openai_limiter_wait_seconds_total",
+    "Seconds calls spent queued locally, by limiter",
+)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds of an `x-ratelimit-reset-*` duration such as "6m0s" or "20ms\""""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Seconds to wait according to `retry-after-ms` or `retry-after` (seconds
+    or an HTTP date), or None when the response does not say.
+    """
+    if headers is None:
+        return None
+    try:
+        return float(headers.get("retry-after-ms")) / 1000
+    except (TypeError, ValueError):
+        pass
+
+    retry_after = headers.get("retry-after")
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        pass
+    if not isinstance(retry_after, str):
+        return None
+    date = email.utils.parsedate_tz(retry_after)
+    if date is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(date) - time.time())
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Bucket holding at most one minute's budget and refilling continuously.
+    A bucket without a budget is unlimited until headers report one.
+    """
+
+    def __init__(self, per_minute: float = 0):
+        self.capacity = per_minute or None
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity is not None:
+            elapsed = now - self._updated
+            self.level = min(self.capacity, self.level + elapsed * self.capacity / 60)
+        self._updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken, 0 if it can be taken now"""
+        self._refill(now)
+        if self.capacity is None:
+            return 0.0
+        # Requests larger than the whole budget are let through once it is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.capacity is not None:
+            self.level -= amount
+
+    def sync(
+        self, limit: Optional[float], remaining: Optional[float], reset: Optional[float]
+    ) -> None:
+        """Adopt the budget reported by the upstream rate limit headers"""
+        if limit:
+            self.capacity = limit
+        if self.capacity is None or remaining is None:
+            return
+        # Headers also count other workers' calls, so only ever lower the level
+        self._refill(time.monotonic())
+        self.level = min(self.level, remaining)
+        if reset is not None and remaining <= 0:
+            self.level = -reset * self.capacity / 60
+
+
+class RateLimiter:
+    """
+    Admission control for one upstream endpoint. `slot()` waits until the
+    concurrency limit, the request bucket and the token bucket all admit the
+    call, and while the upstream asked for a pause after a 429.
+
+    Callers report the outcome with `record_success` and `record_throttle`,
+    and feed response headers to `observe_headers`. The state is exposed as
+    `openai_limiter_*` metrics, labelled with the limiter's name.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        min_concurrency: int = 1,
+        initial_concurrency: Optional[int] = None,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        backoff_interval: float = DEFAULT_BACKOFF_INTERVAL,
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(initial_concurrency or max_concurrency)
+        self.backoff_factor = backoff_factor
+        self.backoff_interval = backoff_interval
+        self._last_backoff = float("-inf")
+        self.in_flight = 0
+        self.queued = 0
+        self._paused_until = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+        concurrency_limits.set_function(lambda: int(self.concurrency_limit), name=name)
+        in_flight_calls.set_function(lambda: self.in_flight, name=name)
+        queued_calls.set_function(lambda: self.queued, name=name)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0) -> AsyncIterator[None]:
+        """Hold an admission slot for one call costing about `tokens` tokens"""
+        await self.acquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, tokens: int = 0) -> None:
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        self.queued += 1
+        admitted = False
+        try:
+            while True:
+                if self.in_flight >= int(self.concurrency_limit):
+                    future = loop.create_future()
+                    self._waiters.append(future)
+                    try:
+                        await future
+                    finally:
+                        if future in self._waiters:
+                            self._waiters.remove(future)
+                    continue
+
+                now = time.monotonic()
+                delay = max(
+                    self._paused_until - now,
+                    self.requests.delay(1, now),
+                    self.tokens.delay(tokens, now),
+                )
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                self.in_flight += 1
+                admitted = True
+                return
+        finally:
+            self.queued -= 1
+            wait_seconds.inc(time.monotonic() - start, name=self.name)
+            if not admitted:
+                # Cancelled after a wakeup meant for this call: pass it on, or
+                # the free slot is never handed to the next waiter
+                self._wake()
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        free = int(self.concurrency_limit) - self.in_flight
+        for future in list(self._waiters):
+            if free <= 0:
+                break
+            if not future.done():
+                future.set_result(None)
+                free -= 1
+            self._waiters.remove(future)
+
+    def record_success(self) -> None:
+        """Additive increase: one more slot per window of successful calls"""
+        if self.concurrency_limit < self.max_concurrency:
+            self.concurrency_limit = min(
+                self.max_concurrency,
+                self.concurrency_limit + 1 / self.concurrency_limit,
+            )
+            self._wake()
+
+    def record_throttle(self, retry_after: Optional[float] = None) -> None:
+        """
+        Multiplicative decrease after a 429. The 429s of one overloaded burst
+        cut the limit only once per `backoff_interval`. A Retry-After pauses
+        every caller, so they do not all retry in lockstep.
+        """
+        throttled_calls.inc(name=self.name)
+        now = time.monotonic()
+        if now - self._last_backoff >= self.backoff_interval:
+            self._last_backoff = now
+            self.concurrency_limit = max(
+                self.min_concurrency, self.concurrency_limit * self.backoff_factor
+            )
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        """Learn the request and token budgets from `x-ratelimit-*` headers"""
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            bucket.sync(
+                _header_float(headers, f"x-ratelimit-limit-{kind}"),
+                _header_float(headers, f"x-ratelimit-remaining-{kind}"),
+                parse_duration(headers.get(f"x-ratelimit-reset-{kind}")),
+            )
@@ -0,0 +1,37 @@
+"""
+Token counting for prompt budgeting. Uses tiktoken when it is installed and
+falls back to a characters-per-token estimate otherwise.
+"""
+
+from functools import lru_cache
+from typing import Iterable
+
+try:
+    import tiktoken
+except ImportError:  # Optional dependency
+    tiktoken = None
+
+DEFAULT_ENCODING = "o200k_base"
+
+# Average characters per token of English text, used without tiktoken
+CHARS_PER_TOKEN = 4
+
+# Tokens the chat format adds around every message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(name: str):
+    return tiktoken.get_encoding(name)
+
+
+def count_tokens(text: str, encoding: str = DEFAULT_ENCODING) -> int:
+    """Number of tokens in `text`, estimated when tiktoken is missing"""
+    if tiktoken is not None:
+        return len(_encoding(encoding).encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def count_message_tokens(contents: Iterable[str]) -> int:
+    """Tokens of chat messages with the given contents, framing included"""
+    return sum(count_tokens(content) + MESSAGE_OVERHEAD_TOKENS for content in contents)
@@ -0,0 +1,51 @@
+"""
+Shared HTTP transport for the OpenAI clients: connection pool limits,
+keep-alive, HTTP/2 when the optional `h2` package is installed, and
+separate connect and read timeouts.
+"""
+
+import importlib.util
+from typing import Optional
+
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+# Same pool as the openai SDK uses by default
+DEFAULT_MAX_CONNECTIONS = 1000
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 100
+DEFAULT_KEEPALIVE_EXPIRY = 5.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 600.0
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def timeout(connect: float, read: float) -> httpx.Timeout:
+    """Timeout with its own connect and read limits; writes and pool waits use `read`"""
+    return httpx.Timeout(read, connect=connect)
+
+
+def create_http_client(
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: Optional[float] = DEFAULT_KEEPALIVE_EXPIRY,
+    http2: bool = False,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+) -> httpx.AsyncClient:
+    """
+    Build the async HTTP client shared by all upstream calls. HTTP/2 is only
+    enabled when requested and `h2` is installed. The timeouts are defaults;
+    calls can override them.
+    """
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        http2=http2 and http2_available(),
+        timeout=timeout(connect_timeout, read_timeout),
+    )
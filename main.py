@@ -1,17 +1,60 @@
+"""
+SupportGPT app factory. Serve it with `uvicorn main:create_app --factory`.
+
+Importing this module builds nothing. Each app gets its own limiter and
+services (services.py); the lifespan opens storage at startup and the
+upstream client is created by the first request that calls it, unless
+OPENAI_WARM_UP_CONNECTIONS asks for connections before serving.
+"""
+
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
-from chat import chat_router
-from config import limiter
+import metrics
+from chat import create_chat_router
+from config import OPENAI_WARM_UP_CONNECTIONS
+from services import Services, create_limiter
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Open storage and warm up upstream connections before serving. On
+    shutdown, close them and flush any conversations still queued for
+    storage.
+    """
+    services: Services = app.state.services
+    # Opened now so that a misconfigured store fails startup, not a request
+    services.storage
+    if OPENAI_WARM_UP_CONNECTIONS > 0:
+        opened = await services.openai_client.warm_up(OPENAI_WARM_UP_CONNECTIONS)
+        logger.info(f"Opened {opened} upstream connections")
+    yield
+    await services.close()
+
+
+def get_metrics() -> PlainTextResponse:
+    """Expose process metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-# Initialize FastAPI app
-app = FastAPI(title="SupportGPT")
 
-# Configure limiter from chat module
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+def create_app() -> FastAPI:
+    """Build a SupportGPT app with its own limiter and services"""
+    app = FastAPI(title="SupportGPT", lifespan=lifespan)
+    app.state.services = Services()
 
+    # Rate limit the chat endpoints
+    app.state.limiter = limiter = create_limiter()
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    app.include_router(create_chat_router(limiter))
 
-# Include chat router
-app.include_router(chat_router)
+    app.add_api_route("/metrics", get_metrics, include_in_schema=False)
+    return app
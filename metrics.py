@@ -0,0 +1,216 @@
+"""
+Lightweight in-process metrics rendered in the Prometheus text format.
+
+Counters, gauges and histograms take optional labels on every update, e.g.
+`stage_seconds.observe(0.2, stage="moderation")`, so a new stage or backend
+shows up as a new series without registering anything.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Upper bounds in seconds, from a fast cache hit to a slow completion
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Labels, float] = {(): 0.0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: object) -> float:
+        """Value of the series with these labels."""
+        return self._values.get(_labels(labels), 0.0)
+
+    @property
+    def value(self) -> float:
+        return self._values[()]
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}\n",
+            f"# TYPE {self.name} counter\n",
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            # A counter only ever split by labels has no unlabelled series
+            if labels or value or len(self._values) == 1:
+                lines.append(f"{self.name}{_format_labels(labels)} {value:g}\n")
+        return "".join(lines)
+
+
+class Gauge:
+    """Value that can go up and down, set directly or read from a function."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Labels, float] = {(): 0.0}
+        self._functions: Dict[Labels, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        self._values[_labels(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels: object) -> None:
+        """Read the value of the series with these labels from `function`."""
+        self._functions[_labels(labels)] = function
+
+    def get(self, **labels: object) -> float:
+        """Value of the series with these labels."""
+        key = _labels(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0.0)
+
+    @property
+    def value(self) -> float:
+        return self.get()
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}\n",
+            f"# TYPE {self.name} gauge\n",
+        ]
+        series = {**self._values, **self._functions}
+        for labels in list(series):
+            # A gauge only ever split by labels has no unlabelled series
+            if labels or len(series) == 1:
+                value = self.get(**dict(labels))
+                lines.append(f"{self.name}{_format_labels(labels)} {value:g}\n")
+        return "".join(lines)
+
+
+class Histogram:
+    """Observed values counted in fixed buckets, optionally split by labels."""
+
+    def __init__(
+        self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: observations per bucket (the last one is +Inf) and sum
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if key not in self._counts:
+                self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            self._counts[key][index] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        """Observe the seconds the block takes, whether it succeeds or not."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: object) -> int:
+        return sum(self._counts.get(_labels(labels), ()))
+
+    def sum(self, **labels: object) -> float:
+        return self._sums.get(_labels(labels), 0.0)
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}\n",
+            f"# TYPE {self.name} histogram\n",
+        ]
+        with self._lock:
+            snapshot = [
+                (labels, list(counts), self._sums[labels])
+                for labels, counts in self._counts.items()
+            ]
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels((*labels, ("le", le)))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}\n")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total:g}\n")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}\n")
+        return "".join(lines)
+
+
+REGISTRY: Dict[str, Union[Counter, Gauge, Histogram]] = {}
+
+
+def counter(name: str, description: str) -> Counter:
+    """Get or register the counter called `name`."""
+    if name not in REGISTRY:
+        REGISTRY[name] = Counter(name, description)
+    return REGISTRY[name]
+
+
+def gauge(name: str, description: str) -> Gauge:
+    """Get or register the gauge called `name`."""
+    if name not in REGISTRY:
+        REGISTRY[name] = Gauge(name, description)
+    return REGISTRY[name]
+
+
+def histogram(
+    name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+) -> Histogram:
+    """Get or register the histogram called `name`."""
+    if name not in REGISTRY:
+        REGISTRY[name] = Histogram(name, description, buckets)
+    return REGISTRY[name]
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text format."""
+    return "".join(metric.render() for metric in REGISTRY.values())
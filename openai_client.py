@@ -1,15 +1,54 @@
+import asyncio
 import logging
 import os
+import random
 import time
-from typing import List, Optional
+from contextlib import nullcontext
+from typing import AsyncIterator, Awaitable, List, Optional, Union
 
+import httpx
 from fastapi import HTTPException
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from openai import RateLimitError as OpenAIRateLimitError
+from openai.types import CompletionUsage
 from openai.types.chat import ChatCompletionMessageParam as OpenAIMessage
 
+import metrics
+from llm import (CircuitBreaker, CompletionCache, HedgePolicy,
+                 ModerationBatcher, ModerationCache, RateLimiter)
+from llm.completion_cache import completion_cache_key
+from llm.rate_limiter import parse_retry_after
+from llm.tokens import count_message_tokens, count_tokens
+from llm.transport import create_http_client
+
 logger = logging.getLogger(__name__)
 
+request_seconds = metrics.histogram(
+    "openai_request_seconds", "Seconds per OpenAI API call attempt, by operation"
+)
+request_errors = metrics.counter(
+    "openai_request_errors_total", "OpenAI API calls failed other than by rate limits"
+)
+rate_limited = metrics.counter(
+    "openai_rate_limited_total", "OpenAI API call attempts answered with a 429"
+)
+retries = metrics.counter(
+    "openai_retries_total", "OpenAI API calls retried after a rate limit"
+)
+prompt_tokens = metrics.counter(
+    "openai_prompt_tokens_total", "Prompt tokens billed for chat completions"
+)
+completion_tokens = metrics.counter(
+    "openai_completion_tokens_total", "Completion tokens billed for chat completions"
+)
+
+
+def record_usage(usage: Optional[CompletionUsage], model: str) -> None:
+    """Count the tokens a completion reports in `usage`, when it has one"""
+    if isinstance(usage, CompletionUsage):
+        prompt_tokens.inc(usage.prompt_tokens, model=model)
+        completion_tokens.inc(usage.completion_tokens, model=model)
+
 
 DEFAULT_MAX_RETRIES = 3
 DEFAULT_BASE_DELAY = 1.0
@@ -20,52 +59,88 @@ DEFAULT_TEMPERATURE = 0.2  # Lower temperature for more deterministic responses
 DEFAULT_MAX_TOKENS = 150
 
 
-class OpenAIClient:
+class BaseOpenAIClient:
     """
-    OpenAI client that handles rate limiting, retries, and error handling
-    for both moderation and chat completion API calls.
+    Shared retry configuration for the sync and async OpenAI clients.
     """
 
     def __init__(
         self,
-        api_key: Optional[str] = None,
         max_retries: int = DEFAULT_MAX_RETRIES,
         base_delay: float = DEFAULT_BASE_DELAY,
     ):
-        """Initialize the OpenAI client with retry configuration."""
-        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
         self.max_retries = max_retries
         self.base_delay = base_delay
 
-
-    def _handle_rate_limit_error(self, attempt: int) -> None:
-        """Handle rate limit errors with exponential backoff"""
+    def _get_retry_delay(
+        self, attempt: int, error: Optional[OpenAIRateLimitError] = None
+    ) -> float:
+        """
+        Compute the backoff delay for a rate limited attempt, or give up. The
+        upstream's Retry-After is honoured when the 429 carries one.
+        """
+        rate_limited.inc()
         if attempt >= self.max_retries:
             logger.error(f"Rate limit exceeded after {self.max_retries} retries")
             raise HTTPException(429, "Rate limit exceeded. Please try again later.")
 
-        # Exponential backoff: delay = base_delay * (2 ^ attempt)
-        delay = self.base_delay * (2**attempt)
+        retry_after = parse_retry_after(error.response.headers) if error else None
+        if retry_after is not None:
+            # Spread the retries of callers that were throttled together
+            delay = retry_after * random.uniform(1, 1.1)
+        else:
+            # Exponential backoff with equal jitter: base_delay * (2 ^ attempt) / 2
+            # plus a random share of the other half
+            delay = self.base_delay * (2**attempt) * random.uniform(0.5, 1)
+        retries.inc()
         logger.warning(
             f"Rate limit hit, retrying in {delay:.2f} seconds (attempt {attempt + 1}/{self.max_retries})"
         )
-        time.sleep(delay)
+        return delay
+
+
+class OpenAIClient(BaseOpenAIClient):
+    """
+    OpenAI client that handles rate limiting, retries, and error handling
+    for both moderation and chat completion API calls.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        base_url: Optional[str] = None,
+    ):
+        """Initialize the OpenAI client with retry configuration."""
+        super().__init__(max_retries=max_retries, base_delay=base_delay)
+        self.client = OpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"), base_url=base_url
+        )
+
+    def _handle_rate_limit_error(
+        self, attempt: int, error: Optional[OpenAIRateLimitError] = None
+    ) -> None:
+        """Handle rate limit errors with jittered exponential backoff"""
+        time.sleep(self._get_retry_delay(attempt, error))
 
     def is_offensive_content(self, text: str) -> bool:
         """Check if the text contains offensive content using OpenAI's moderation API"""
         for attempt in range(self.max_retries + 1):
             try:
-                moderation = self.client.moderations.create(input=text)
+                with request_seconds.time(operation="moderation"):
+                    moderation = self.client.moderations.create(input=text)
                 return moderation.results[0].flagged
 
-            except OpenAIRateLimitError:
-                self._handle_rate_limit_error(attempt)
+            except OpenAIRateLimitError as e:
+                self._handle_rate_limit_error(attempt, e)
 
             except Exception as e:
+                request_errors.inc(operation="moderation")
                 logger.error(f"Failed to moderate content: {str(e)}")
                 raise HTTPException(500, f"Failed to moderate conversation: {str(e)}")
 
-        # Defensive programming: This should never be reached due to the exception in _handle_rate_limit_error
+        # Defensive programming: This should never be reached due to the exception in _get_retry_delay
         raise HTTPException(429, "Rate limit exceeded. Please try again later.")
 
     def create_chat_completion(
@@ -78,20 +153,450 @@ class OpenAIClient:
         """Create a chat completion using OpenAI's chat completions API"""
         for attempt in range(self.max_retries + 1):
             try:
-                response = self.client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
+                with request_seconds.time(operation="completion"):
+                    response = self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                    )
+                record_usage(response.usage, model)
+                return response.choices[0].message.content
+
+            except OpenAIRateLimitError as e:
+                self._handle_rate_limit_error(attempt, e)
+
+            except Exception as e:
+                request_errors.inc(operation="completion")
+                logger.error(f"Failed to create chat completion: {str(e)}")
+                raise HTTPException(500, f"Failed to generate response: {str(e)}")
+
+        # Defensive programming: This should never be reached due to the exception in _get_retry_delay
+        raise HTTPException(429, "Rate limit exceeded. Please try again later.")
+
+
+class AsyncOpenAIClient(BaseOpenAIClient):
+    """
+    Async counterpart of OpenAIClient built on AsyncOpenAI. Backoff uses
+    asyncio.sleep so a rate limited call never blocks the event loop.
+
+    With rate limiters set, moderation and completion calls queue locally
+    for admission, and the limiters learn from every response's rate limit
+    headers. The SDK's own retries are then disabled so every retry goes
+    through the limiter.
+
+    `create_chat_completion` can also hedge slow completions with a
+    duplicate call (`hedge_policy`). It and `stream_chat_completion` fail
+    fast, or fall back to `fallback_model`, while `circuit_breaker` is open.
+
+    All calls share one pooled `http_client`. Moderation and completion
+    calls can each have their own connect and read timeouts.
+
+    With a `completion_cache`, completions of shallow prompts (such as the
+    first turn of a conversation) are served from memory.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        base_url: Optional[str] = None,
+        moderation_cache: Optional[ModerationCache] = None,
+        moderation_batch_window: float = 0.0,
+        moderation_batch_size: int = 32,
+        moderation_limiter: Optional[RateLimiter] = None,
+        completion_limiter: Optional[RateLimiter] = None,
+        hedge_policy: Optional[HedgePolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        fallback_model: Optional[str] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        moderation_timeout: Optional[httpx.Timeout] = None,
+        completion_timeout: Optional[httpx.Timeout] = None,
+        completion_cache: Optional[CompletionCache] = None,
+    ):
+        """
+        Initialize the async OpenAI client with retry configuration. A
+        positive `moderation_batch_window` coalesces concurrent moderation
+        calls into batches of up to `moderation_batch_size` inputs. Without
+        an `http_client`, one with the SDK's default pool is created.
+        """
+        super().__init__(max_retries=max_retries, base_delay=base_delay)
+        self.moderation_limiter = moderation_limiter
+        self.completion_limiter = completion_limiter
+        self.hedge_policy = hedge_policy
+        self.circuit_breaker = circuit_breaker
+        self.fallback_model = fallback_model
+        self._moderation_options = (
+            {"timeout": moderation_timeout} if moderation_timeout else {}
+        )
+        self._completion_options = (
+            {"timeout": completion_timeout} if completion_timeout else {}
+        )
+        self.http_client = http_client or create_http_client()
+        limited = moderation_limiter is not None or completion_limiter is not None
+        if limited:
+            hooks = self.http_client.event_hooks
+            self.http_client.event_hooks = {
+                **hooks,
+                "response": [*hooks["response"], self._observe_response],
+            }
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=base_url,
+            http_client=self.http_client,
+            **({"max_retries": 0} if limited else {}),
+        )
+        self.moderation_cache = moderation_cache
+        self.completion_cache = completion_cache
+        self.moderation_batcher = (
+            ModerationBatcher(
+                self._moderate,
+                window=moderation_batch_window,
+                max_batch_size=moderation_batch_size,
+            )
+            if moderation_batch_window > 0
+            else None
+        )
+
+    async def warm_up(self, connections: int) -> int:
+        """
+        Open up to `connections` pooled connections to the upstream, TLS
+        handshakes included, so the first real calls do not pay for them.
+        Requests go to the API root and their responses are ignored. Returns
+        the number of connections that were opened.
+        """
+
+        async def connect() -> bool:
+            try:
+                await self.http_client.head(str(self.client.base_url))
+                return True
+            except httpx.HTTPError as e:
+                logger.warning(f"Failed to warm up upstream connection: {str(e)}")
+                return False
+
+        opened = await asyncio.gather(*(connect() for _ in range(connections)))
+        return sum(opened)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    async def _observe_response(self, response: httpx.Response) -> None:
+        """Feed the rate limit headers of every upstream response to its limiter"""
+        if response.request.url.path.endswith("/moderations"):
+            limiter = self.moderation_limiter
+        else:
+            limiter = self.completion_limiter
+        if limiter is not None:
+            limiter.observe_headers(response.headers)
+
+    @staticmethod
+    def _slot(limiter: Optional[RateLimiter], tokens: int = 0):
+        return limiter.slot(tokens) if limiter is not None else nullcontext()
+
+    async def _handle_rate_limit_error(
+        self,
+        attempt: int,
+        error: Optional[OpenAIRateLimitError] = None,
+        limiter: Optional[RateLimiter] = None,
+    ) -> None:
+        """Handle rate limit errors with jittered exponential backoff"""
+        if limiter is not None:
+            limiter.record_throttle(parse_retry_after(error.response.headers))
+        await asyncio.sleep(self._get_retry_delay(attempt, error))
+
+    async def is_offensive_content(self, text: str) -> bool:
+        """
+        Check if the text contains offensive content using OpenAI's moderation
+        API. Verdicts are served from the moderation cache when one is set,
+        and misses go through the batcher when batching is enabled.
+        """
+        if self.moderation_cache is not None:
+            flagged = await self.moderation_cache.get(text)
+            if flagged is not None:
+                return flagged
+
+        if self.moderation_batcher is not None:
+            flagged = await self.moderation_batcher.is_flagged(text)
+        else:
+            flagged = (await self._moderate(text))[0]
+
+        if self.moderation_cache is not None:
+            await self.moderation_cache.set(text, flagged)
+        return flagged
+
+    async def _moderate(self, input: Union[str, List[str]]) -> List[bool]:
+        """Call the moderation API with one or more inputs; one verdict each"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._slot(self.moderation_limiter):
+                    with request_seconds.time(operation="moderation"):
+                        moderation = await self.client.moderations.create(
+                            input=input, **self._moderation_options
+                        )
+                if self.moderation_limiter is not None:
+                    self.moderation_limiter.record_success()
+                return [result.flagged for result in moderation.results]
+
+            except OpenAIRateLimitError as e:
+                await self._handle_rate_limit_error(attempt, e, self.moderation_limiter)
+
+            except Exception as e:
+                request_errors.inc(operation="moderation")
+                logger.error(f"Failed to moderate content: {str(e)}")
+                raise HTTPException(500, f"Failed to moderate conversation: {str(e)}")
+
+        # Defensive programming: This should never be reached due to the exception in _get_retry_delay
+        raise HTTPException(429, "Rate limit exceeded. Please try again later.")
+
+    async def create_chat_completion(
+        self,
+        messages: List[OpenAIMessage],
+        model: str = DEFAULT_MODEL,
+        temperature: float = DEFAULT_TEMPERATURE,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        response_format: Optional[dict] = None,
+        cache: bool = True,
+    ) -> str:
+        """
+        Create a chat completion using OpenAI's chat completions API. While
+        the circuit breaker is open the call fails fast with a 503, or goes
+        to the fallback model when one is set. Slow calls are hedged when a
+        hedge policy is set. A `response_format` requests structured output.
+        Cacheable prompts are served from the completion cache unless
+        `cache` is False.
+        """
+        key = self._completion_cache_key(
+            messages, model, temperature, max_tokens, response_format, cache
+        )
+        if key is not None:
+            content = self.completion_cache.get(key)
+            if content is not None:
+                return content
+
+        breaker = self.circuit_breaker
+        if breaker is not None and not breaker.allow():
+            if self.fallback_model is None or self.fallback_model == model:
+                raise HTTPException(
+                    503, "Upstream unavailable. Please try again later."
                 )
+            model = self.fallback_model
+            breaker = None
+            # Not the completion the key asks for
+            key = None
+
+        def complete() -> Awaitable[str]:
+            return self._create_chat_completion(
+                messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                response_format=response_format,
+            )
+
+        start = time.monotonic()
+        try:
+            if self.hedge_policy is not None:
+                content = await self.hedge_policy.run(complete)
+            else:
+                content = await complete()
+        except HTTPException as e:
+            # Rate limits say nothing about the upstream's health
+            if breaker is not None and e.status_code >= 500:
+                breaker.record_failure()
+            raise
+        latency = time.monotonic() - start
+        if breaker is not None:
+            breaker.record_success(latency)
+        if key is not None:
+            self._cache_completion(key, messages, content, latency)
+        return content
+
+    async def _create_chat_completion(
+        self,
+        messages: List[OpenAIMessage],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        response_format: Optional[dict] = None,
+    ) -> str:
+        limiter = self.completion_limiter
+        options = self._completion_request_options(response_format)
+        tokens = 0 if limiter is None else self._estimate_tokens(messages, max_tokens)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._slot(limiter, tokens):
+                    with request_seconds.time(operation="completion"):
+                        response = await self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            **options,
+                        )
+                if limiter is not None:
+                    limiter.record_success()
+                record_usage(response.usage, model)
                 return response.choices[0].message.content
 
-            except OpenAIRateLimitError:
-                self._handle_rate_limit_error(attempt)
+            except OpenAIRateLimitError as e:
+                await self._handle_rate_limit_error(attempt, e, limiter)
 
             except Exception as e:
+                request_errors.inc(operation="completion")
                 logger.error(f"Failed to create chat completion: {str(e)}")
                 raise HTTPException(500, f"Failed to generate response: {str(e)}")
 
-        # Defensive programming: This should never be reached due to the exception in _handle_rate_limit_error
+        # Defensive programming: This should never be reached due to the exception in _get_retry_delay
         raise HTTPException(429, "Rate limit exceeded. Please try again later.")
+
+    async def stream_chat_completion(
+        self,
+        messages: List[OpenAIMessage],
+        model: str = DEFAULT_MODEL,
+        temperature: float = DEFAULT_TEMPERATURE,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        response_format: Optional[dict] = None,
+        cache: bool = True,
+    ) -> AsyncIterator[str]:
+        """
+        Stream the content deltas of a chat completion as they arrive. The
+        limiter slot and the connection are held until the stream ends or the
+        caller stops reading. Opening the stream goes through the circuit
+        breaker like `create_chat_completion`. A cached completion is yielded
+        as a single delta, and a complete stream of a cacheable prompt is
+        stored.
+        """
+        key = self._completion_cache_key(
+            messages, model, temperature, max_tokens, response_format, cache
+        )
+        if key is not None:
+            content = self.completion_cache.get(key)
+            if content is not None:
+                yield content
+                return
+
+        breaker = self.circuit_breaker
+        if breaker is not None and not breaker.allow():
+            if self.fallback_model is None or self.fallback_model == model:
+                raise HTTPException(
+                    503, "Upstream unavailable. Please try again later."
+                )
+            model = self.fallback_model
+            breaker = None
+            # Not the completion the key asks for
+            key = None
+
+        start = time.monotonic()
+        limiter = self.completion_limiter
+        options = self._completion_request_options(response_format)
+        tokens = 0 if limiter is None else self._estimate_tokens(messages, max_tokens)
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                await limiter.acquire(tokens)
+            try:
+                # Time to the response headers; the stream itself is not timed
+                with request_seconds.time(operation="stream"):
+                    stream = await self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **options,
+                    )
+                break
+
+            except OpenAIRateLimitError as e:
+                if limiter is not None:
+                    limiter.release()
+                await self._handle_rate_limit_error(attempt, e, limiter)
+
+            except BaseException as e:
+                if limiter is not None:
+                    limiter.release()
+                if not isinstance(e, Exception):
+                    raise
+                if breaker is not None:
+                    breaker.record_failure()
+                request_errors.inc(operation="stream")
+                logger.error(f"Failed to create chat completion: {str(e)}")
+                raise HTTPException(500, f"Failed to generate response: {str(e)}")
+
+        # The breaker judges the time to the response headers
+        if breaker is not None:
+            breaker.record_success(time.monotonic() - start)
+
+        # Rate limits can only be retried before the first token, not mid-stream
+        deltas = []
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    deltas.append(chunk.choices[0].delta.content)
+                    yield deltas[-1]
+                # Sent in a last chunk without choices
+                record_usage(chunk.usage, model)
+            if limiter is not None:
+                limiter.record_success()
+        except Exception as e:
+            request_errors.inc(operation="stream")
+            logger.error(f"Chat completion stream failed: {str(e)}")
+            raise HTTPException(500, f"Failed to generate response: {str(e)}")
+        finally:
+            try:
+                # Also reached when the caller stops reading early
+                await stream.close()
+            finally:
+                if limiter is not None:
+                    limiter.release()
+        if key is not None:
+            self._cache_completion(
+                key, messages, "".join(deltas), time.monotonic() - start
+            )
+
+    def _completion_cache_key(
+        self,
+        messages: List[OpenAIMessage],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        response_format: Optional[dict],
+        cache: bool,
+    ) -> Optional[str]:
+        """Cache key of the completion, or None when it is not cacheable"""
+        if (
+            not cache
+            or self.completion_cache is None
+            or not self.completion_cache.cacheable(messages)
+        ):
+            return None
+        return completion_cache_key(
+            model,
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format=response_format,
+        )
+
+    def _cache_completion(
+        self,
+        key: str,
+        messages: List[OpenAIMessage],
+        content: str,
+        latency: float,
+    ) -> None:
+        if not content:
+            return
+        tokens = count_message_tokens(m["content"] for m in messages)
+        self.completion_cache.set(key, content, tokens + count_tokens(content), latency)
+
+    def _completion_request_options(self, response_format: Optional[dict]) -> dict:
+        if response_format is None:
+            return self._completion_options
+        return {**self._completion_options, "response_format": response_format}
+
+    @staticmethod
+    def _estimate_tokens(messages: List[OpenAIMessage], max_tokens: int) -> int:
+        """Tokens a completion counts against the tokens per minute budget"""
+        return count_message_tokens(m["content"] for m in messages) + max_tokens
@@ -0,0 +1,162 @@
+"""
+API rate limiting helpers for the slowapi limiter.
+
+`SQLiteLimitStorage` is a `limits` storage registered for `sqlite://` URIs:
+fixed-window counters in an SQLite file, shared by every worker on the host.
+Other `limits` URIs (`memory://`, `redis://host:6379`, ...) work as they are.
+
+`composite_key` builds the limiter key from the client IP, API key and
+transaction id, so the budget can follow the customer rather than the NAT
+they sit behind.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable
+
+from fastapi import Request
+from limits.storage import Storage
+from slowapi.util import get_remote_address
+
+KEY_COMPONENTS = ("ip", "api_key", "transaction")
+
+# Expired windows are purged every this many increments
+PURGE_INTERVAL = 1000
+
+
+class SQLiteLimitStorage(Storage):
+    """
+    Fixed-window counters in SQLite. The path follows the scheme:
+    `sqlite://storage/ratelimits.sqlite3` is relative, `sqlite:///tmp/limits`
+    absolute. Every increment is one atomic upsert, so concurrent workers
+    never lose a hit.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        self.path = uri.split("://", 1)[1]
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._increments = 0
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS limits ("
+            "key TEXT PRIMARY KEY, count INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self) -> type[Exception]:
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        """Add `amount` to the window of `key`, starting a new one if it expired"""
+        now = time.time()
+        connection = self._connection()
+        (count,) = connection.execute(
+            "INSERT INTO limits (key, count, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "count = CASE WHEN expires_at <= ? THEN excluded.count "
+            "ELSE count + excluded.count END, "
+            "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at "
+            "ELSE expires_at END "
+            "RETURNING count",
+            (key, amount, now + expiry, now, now),
+        ).fetchone()
+        self._increments += 1
+        if self._increments % PURGE_INTERVAL == 0:
+            connection.execute("DELETE FROM limits WHERE expires_at <= ?", (now,))
+        return count
+
+    def get(self, key: str) -> int:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT count FROM limits WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT expires_at FROM limits WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int:
+        return self._connection().execute("DELETE FROM limits").rowcount
+
+    def clear(self, key: str) -> None:
+        self._connection().execute("DELETE FROM limits WHERE key = ?", (key,))
+
+
+def _api_key(request: Request) -> str:
+    """Short hash of the caller's API key, so raw keys never reach the storage"""
+    api_key = request.headers.get("x-api-key")
+    if api_key is None:
+        scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+        api_key = credentials if scheme.lower() == "bearer" else ""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else ""
+
+
+def _transaction_id(request: Request) -> str:
+    # FastAPI has parsed and cached the JSON body by the time slowapi checks
+    # the route's limits
+    body = getattr(request, "_json", None)
+    if isinstance(body, dict) and isinstance(body.get("transaction_id"), str):
+        return body["transaction_id"]
+    return ""
+
+
+KEY_FUNCTIONS: dict[str, Callable[[Request], str]] = {
+    "ip": get_remote_address,
+    "api_key": _api_key,
+    "transaction": _transaction_id,
+}
+
+
+def composite_key(components: Iterable[str]) -> Callable[[Request], str]:
+    """Limiter key function joining the given KEY_COMPONENTS of a request"""
+    components = list(components)
+    unknown = set(components) - set(KEY_COMPONENTS)
+    if unknown or not components:
+        raise ValueError(
+            f"Invalid rate limit key components: {', '.join(components)} "
+            f"(expected some of {', '.join(KEY_COMPONENTS)})"
+        )
+
+    def key(request: Request) -> str:
+        return "|".join(
+            f"{component}={KEY_FUNCTIONS[component](request)}"
+            for component in components
+        )
+
+    return key
@@ -0,0 +1,206 @@
+"""
+Objects an app shares between requests, built from the settings in config.py.
+
+Nothing here is created at import. `create_app` gives every app its own
+limiter and `Services`, and routes receive the services through
+`Depends(get_services)`. The upstream client and the conversation store are
+created on first use: the openai SDK alone takes about a second to import,
+which worker spawn and cold starts no longer pay.
+"""
+
+import asyncio
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+from fastapi import Request
+from slowapi import Limiter
+
+from config import (CIRCUIT_BREAKER, CIRCUIT_ERROR_RATE,
+                    CIRCUIT_LATENCY_THRESHOLD_MS, CIRCUIT_RESET_TIMEOUT,
+                    CIRCUIT_WINDOW, COMPLETION_CACHE_ENTRIES,
+                    COMPLETION_CACHE_MAX_DEPTH, COMPLETION_CACHE_TTL,
+                    COMPLETION_CONNECT_TIMEOUT, COMPLETION_READ_TIMEOUT,
+                    FALLBACK_MODEL, HEDGE_BUDGET, HEDGE_MIN_DELAY_MS,
+                    HEDGE_PERCENTILE, MODERATION_BATCH_SIZE,
+                    MODERATION_BATCH_WINDOW_MS, MODERATION_CACHE_ENTRIES,
+                    MODERATION_CACHE_PATH, MODERATION_CACHE_TTL,
+                    MODERATION_CONNECT_TIMEOUT, MODERATION_READ_TIMEOUT,
+                    OPENAI_HTTP2, OPENAI_KEEPALIVE_EXPIRY,
+                    OPENAI_MAX_CONCURRENCY, OPENAI_MAX_CONNECTIONS,
+                    OPENAI_MAX_KEEPALIVE_CONNECTIONS, OPENAI_RATE_LIMITER,
+                    OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE,
+                    RATE_LIMIT_KEY, RATE_LIMIT_STORAGE_URI, STORAGE_BACKEND,
+                    STORAGE_CACHE_ENTRIES, STORAGE_CACHE_TTL,
+                    STORAGE_FLUSH_BATCH, STORAGE_FLUSH_INTERVAL_MS,
+                    STORAGE_INDEX_PATH, STORAGE_PATH, STORAGE_WRITE_MODE,
+                    STORAGE_WRITE_QUEUE_SIZE)
+from llm import (CircuitBreaker, CompletionCache, HedgePolicy, ModerationCache,
+                 RateLimiter)
+from ratelimit import composite_key
+from storage import (AsyncStorage, CachedStorage, ConversationIndex,
+                     IndexedStorage, WriteBehindStorage, create_storage)
+
+if TYPE_CHECKING:
+    from chat.utils import SessionLocks
+    from openai_client import AsyncOpenAIClient
+
+
+def create_limiter() -> Limiter:
+    """API limiter keyed and stored as configured"""
+    return Limiter(
+        key_func=composite_key(RATE_LIMIT_KEY.split(",")),
+        storage_uri=RATE_LIMIT_STORAGE_URI,
+    )
+
+
+def create_openai_client() -> "AsyncOpenAIClient":
+    """Upstream client with the configured caches, limits and transport"""
+    # Imported here so that only the first use pays for the openai SDK
+    from llm.transport import create_http_client, timeout
+    from openai_client import AsyncOpenAIClient
+
+    moderation_cache = (
+        ModerationCache(
+            max_entries=MODERATION_CACHE_ENTRIES,
+            ttl=MODERATION_CACHE_TTL,
+            disk_path=MODERATION_CACHE_PATH,
+        )
+        if MODERATION_CACHE_ENTRIES > 0
+        else None
+    )
+    completion_cache = (
+        CompletionCache(
+            max_entries=COMPLETION_CACHE_ENTRIES,
+            ttl=COMPLETION_CACHE_TTL,
+            max_depth=COMPLETION_CACHE_MAX_DEPTH,
+        )
+        if COMPLETION_CACHE_ENTRIES > 0
+        else None
+    )
+    moderation_limiter, completion_limiter = (
+        (
+            RateLimiter("moderation", max_concurrency=OPENAI_MAX_CONCURRENCY),
+            RateLimiter(
+                "completion",
+                requests_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+                tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+                max_concurrency=OPENAI_MAX_CONCURRENCY,
+            ),
+        )
+        if OPENAI_RATE_LIMITER
+        else (None, None)
+    )
+    hedge_policy = (
+        HedgePolicy(
+            "openai_completion",
+            percentile=HEDGE_PERCENTILE,
+            min_delay=HEDGE_MIN_DELAY_MS / 1000,
+            budget=HEDGE_BUDGET,
+        )
+        if HEDGE_PERCENTILE > 0
+        else None
+    )
+    circuit_breaker = (
+        CircuitBreaker(
+            "openai_completion",
+            window=CIRCUIT_WINDOW,
+            error_rate=CIRCUIT_ERROR_RATE,
+            latency_threshold=CIRCUIT_LATENCY_THRESHOLD_MS / 1000 or None,
+            reset_timeout=CIRCUIT_RESET_TIMEOUT,
+        )
+        if CIRCUIT_BREAKER
+        else None
+    )
+    http_client = create_http_client(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        http2=OPENAI_HTTP2,
+        connect_timeout=COMPLETION_CONNECT_TIMEOUT,
+        read_timeout=COMPLETION_READ_TIMEOUT,
+    )
+    return AsyncOpenAIClient(
+        moderation_cache=moderation_cache,
+        moderation_batch_window=MODERATION_BATCH_WINDOW_MS / 1000,
+        moderation_batch_size=MODERATION_BATCH_SIZE,
+        moderation_limiter=moderation_limiter,
+        completion_limiter=completion_limiter,
+        hedge_policy=hedge_policy,
+        circuit_breaker=circuit_breaker,
+        fallback_model=FALLBACK_MODEL,
+        http_client=http_client,
+        moderation_timeout=timeout(MODERATION_CONNECT_TIMEOUT, MODERATION_READ_TIMEOUT),
+        completion_timeout=timeout(COMPLETION_CONNECT_TIMEOUT, COMPLETION_READ_TIMEOUT),
+        completion_cache=completion_cache,
+    )
+
+
+def create_conversation_storage() -> AsyncStorage:
+    """Conversation "database": the backend and the configured layers"""
+    backend = create_storage(STORAGE_BACKEND, STORAGE_PATH)
+    queryable = hasattr(backend, "query_conversations")
+    if STORAGE_CACHE_ENTRIES > 0:
+        backend = CachedStorage(
+            backend, max_entries=STORAGE_CACHE_ENTRIES, ttl=STORAGE_CACHE_TTL
+        )
+    if STORAGE_INDEX_PATH and not queryable:
+        backend = IndexedStorage(backend, ConversationIndex(STORAGE_INDEX_PATH))
+    if STORAGE_WRITE_MODE == "write_behind":
+        backend = WriteBehindStorage(
+            backend,
+            max_pending=STORAGE_WRITE_QUEUE_SIZE,
+            flush_interval=STORAGE_FLUSH_INTERVAL_MS / 1000,
+            max_batch=STORAGE_FLUSH_BATCH,
+        )
+    elif STORAGE_WRITE_MODE != "sync":
+        raise ValueError(
+            f"Unknown storage write mode: {STORAGE_WRITE_MODE!r} "
+            "(expected sync or write_behind)"
+        )
+    return AsyncStorage(backend)
+
+
+class Services:
+    """
+    The upstream client and conversation store of one app, each created the
+    first time it is used. Tests may assign either attribute to replace it.
+    The per-session locks and background summary tasks of the app's requests
+    live here too.
+    """
+
+    def __init__(self):
+        # Referenced so the tasks are not garbage collected while they run
+        self.background_summaries: set[asyncio.Task] = set()
+
+    @cached_property
+    def session_locks(self) -> "SessionLocks":
+        # chat imports this module: import it once both are loaded
+        from chat.utils import SessionLocks
+
+        return SessionLocks()
+
+    @cached_property
+    def openai_client(self) -> "AsyncOpenAIClient":
+        return create_openai_client()
+
+    @cached_property
+    def storage(self) -> AsyncStorage:
+        return create_conversation_storage()
+
+    async def close(self) -> None:
+        """
+        Cancel the background summaries still running, then close whatever
+        was created: upstream connections, then storage
+        """
+        for task in self.background_summaries:
+            task.cancel()
+        await asyncio.gather(*self.background_summaries, return_exceptions=True)
+        if "openai_client" in self.__dict__:
+            await self.openai_client.close()
+        if "storage" in self.__dict__:
+            await self.storage.close()
+
+
+def get_services(request: Request) -> Services:
+    """Route dependency: the services of the app serving the request"""
+    return request.app.state.services
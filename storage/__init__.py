@@ -1,4 +1,51 @@
-from .models import CollectedData, Conversation, Message, MessageRole
-from .storage import SimpleStorage as Storage
+from .archive import ConversationArchive
+from .async_storage import AsyncStorage
+from .base import (BulkStorage, ConversationConflictError, GroupCommitStorage,
+                   QueryableStorage, ScannableStorage, Storage, SummaryStorage,
+                   VersionedStorage, get_conversations, query_conversations,
+                   save_summary)
+from .cache import CachedStorage
+from .factory import create_storage
+from .index import (ConversationIndex, ConversationQuery, IndexedStorage,
+                    InvalidCursorError, rebuild_index)
+from .log_storage import LogStorage
+from .models import (CollectedData, Conversation, ConversationPage,
+                     ConversationRef, ConversationSummary, Message,
+                     MessageRole)
+from .sqlite_storage import SQLiteStorage
+from .storage import SimpleStorage
+from .write_behind import WriteBehindStorage
 
-__all__ = ["Conversation", "CollectedData", "Message", "MessageRole", "Storage"]
+__all__ = [
+    "AsyncStorage",
+    "BulkStorage",
+    "CachedStorage",
+    "Conversation",
+    "ConversationArchive",
+    "ConversationConflictError",
+    "ConversationIndex",
+    "ConversationPage",
+    "ConversationQuery",
+    "ConversationRef",
+    "ConversationSummary",
+    "CollectedData",
+    "GroupCommitStorage",
+    "IndexedStorage",
+    "InvalidCursorError",
+    "LogStorage",
+    "Message",
+    "MessageRole",
+    "QueryableStorage",
+    "ScannableStorage",
+    "SimpleStorage",
+    "SQLiteStorage",
+    "Storage",
+    "SummaryStorage",
+    "VersionedStorage",
+    "WriteBehindStorage",
+    "create_storage",
+    "get_conversations",
+    "query_conversations",
+    "rebuild_index",
+    "save_summary",
+]
@@ -0,0 +1,123 @@
+"""
+Maintenance commands for conversation stores. All of them are safe to run
+while the app is serving from the same store.
+
+Usage:
+    python -m storage convert-records storage/records
+    python -m storage rebuild-index storage/index.sqlite3 --backend json
+    python -m storage retention --archive-after-days 30 --delete-after-days 365
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from .factory import STORAGE_BACKENDS, create_storage
+from .index import ConversationIndex, rebuild_index
+from .storage import LAYOUTS, RECORD_FORMATS, SimpleStorage
+
+
+def convert_records(args: argparse.Namespace) -> None:
+    storage = SimpleStorage(
+        args.db_path, record_format=args.record_format, layout=args.layout
+    )
+    converted = storage.convert_records()
+    print(f"Converted {converted} records in {args.db_path}")
+
+
+def rebuild(args: argparse.Namespace) -> None:
+    storage = create_storage(args.backend, args.path)
+    if not hasattr(storage, "session_ids"):
+        raise SystemExit(
+            f"The {args.backend} backend indexes its own records: nothing to rebuild"
+        )
+    index = ConversationIndex(args.index_path)
+    try:
+        indexed = rebuild_index(storage, index)
+    finally:
+        index.close()
+    print(f"Indexed {indexed} conversations in {args.index_path}")
+
+
+def retention(args: argparse.Namespace) -> None:
+    storage = create_storage(args.backend, args.path)
+    now = datetime.now(timezone.utc)
+    try:
+        if args.delete_after_days is not None:
+            deleted = storage.delete_expired(
+                now - timedelta(days=args.delete_after_days)
+            )
+            if args.index:
+                # An archived copy may expire while the conversation is live
+                # again, or a new turn may have recreated it meanwhile
+                index = ConversationIndex(args.index)
+                index.remove(
+                    session_id
+                    for session_id in deleted
+                    if storage.get_version(session_id) is None
+                )
+                index.close()
+            print(f"Deleted {len(deleted)} conversations")
+        if args.archive_after_days is not None:
+            archived = storage.archive_idle(
+                now - timedelta(days=args.archive_after_days)
+            )
+            print(f"Archived {archived} conversations")
+    finally:
+        storage.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m storage",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    commands = parser.add_subparsers(required=True)
+
+    convert = commands.add_parser(
+        "convert-records",
+        help="Rewrite the records of a directory in another format or layout",
+    )
+    convert.add_argument("db_path", help="Directory of the json/binary backend")
+    convert.add_argument(
+        "--format", dest="record_format", choices=RECORD_FORMATS, default="binary"
+    )
+    convert.add_argument("--layout", choices=LAYOUTS, default="sharded")
+    convert.set_defaults(command=convert_records)
+
+    index = commands.add_parser(
+        "rebuild-index",
+        help="Rebuild the conversation index (STORAGE_INDEX_PATH) from a store",
+    )
+    index.add_argument("index_path", help="Index file, as in STORAGE_INDEX_PATH")
+    index.add_argument("--backend", choices=STORAGE_BACKENDS, default="json")
+    index.add_argument("--path", help="Store location, as in STORAGE_PATH")
+    index.set_defaults(command=rebuild)
+
+    retain = commands.add_parser(
+        "retention",
+        help="Archive idle conversations and delete expired ones",
+    )
+    retain.add_argument("--backend", choices=["json", "binary"], default="json")
+    retain.add_argument("--path", help="Store location, as in STORAGE_PATH")
+    retain.add_argument(
+        "--archive-after-days",
+        type=float,
+        help="Pack conversations idle this long into the archive",
+    )
+    retain.add_argument(
+        "--delete-after-days",
+        type=float,
+        help="Delete conversations, archived or not, idle this long",
+    )
+    retain.add_argument(
+        "--index", help="Conversation index to drop deleted conversations from"
+    )
+    retain.set_defaults(command=retention)
+
+    args = parser.parse_args()
+    args.command(args)
+
+
+if __name__ == "__main__":
+    main()
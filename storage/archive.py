@@ -0,0 +1,211 @@
+"""
+Archive of idle conversations for SimpleStorage.
+
+Idle conversations are packed into segment files: binary records
+(storage/records.py) written back to back, compressed one by one, and never
+modified once written. An SQLite lookup index maps each archived session to
+its segment, offset and length, so reading one back is an index lookup and a
+single read. A segment file is deleted once none of its records is indexed.
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Iterable, Optional
+
+from .index import timestamp
+from .models import Conversation
+from .records import decode_record, encode_record
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archived (
+    session_id TEXT PRIMARY KEY,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archived_segment ON archived (segment);
+CREATE INDEX IF NOT EXISTS archived_updated_at ON archived (updated_at);
+"""
+
+SEGMENT_SUFFIX = ".arc"
+
+
+class ConversationArchive:
+    """
+    Segment files and their lookup index in one directory. Segments are named
+    randomly, so workers and the retention command may archive at once.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        os.makedirs(path, exist_ok=True)
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                os.path.join(self.path, "index.sqlite3"),
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _segment_path(self, segment: str) -> str:
+        return os.path.join(self.path, f"{segment}{SEGMENT_SUFFIX}")
+
+    def append(self, conversations: list[Conversation]) -> None:
+        """
+        Write the conversations to a new segment, sync it, then index them.
+        Replaces archived copies of the same sessions that are older.
+        """
+        if not conversations:
+            return
+        segment = f"segment-{uuid.uuid4().hex}"
+        rows = []
+        offset = 0
+        tmp_path = f"{self._segment_path(segment)}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                for conversation in conversations:
+                    record = encode_record(conversation)
+                    f.write(record)
+                    rows.append(
+                        (
+                            conversation.session_id,
+                            segment,
+                            offset,
+                            len(record),
+                            conversation.version,
+                            timestamp(conversation.updated_at),
+                        )
+                    )
+                    offset += len(record)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._segment_path(segment))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            replaced = self._segments_of(row[0] for row in rows)
+            connection.executemany(
+                "INSERT INTO archived "
+                "(session_id, segment, offset, length, version, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (session_id) DO UPDATE SET "
+                "segment = excluded.segment, offset = excluded.offset, "
+                "length = excluded.length, version = excluded.version, "
+                "updated_at = excluded.updated_at "
+                "WHERE excluded.version >= archived.version",
+                rows,
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._drop_unreferenced(replaced | {segment})
+
+    def _segments_of(self, session_ids: Iterable[str]) -> set[str]:
+        connection = self._connection()
+        return {
+            row[0]
+            for session_id in session_ids
+            for row in connection.execute(
+                "SELECT segment FROM archived WHERE session_id = ?", (session_id,)
+            )
+        }
+
+    def _drop_unreferenced(self, segments: set[str]) -> None:
+        """Delete the given segment files if no index row points into them"""
+        connection = self._connection()
+        for segment in segments:
+            referenced = connection.execute(
+                "SELECT 1 FROM archived WHERE segment = ? LIMIT 1", (segment,)
+            ).fetchone()
+            if referenced is None and os.path.exists(self._segment_path(segment)):
+                os.remove(self._segment_path(segment))
+
+    def get(self, session_id: str) -> Optional[Conversation]:
+        """Read an archived conversation, or None if it is not archived"""
+        row = self._connection().execute(
+            "SELECT segment, offset, length FROM archived WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        segment, offset, length = row
+        try:
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(offset)
+                return decode_record(f.read(length))
+        except FileNotFoundError:
+            # Expired and deleted since the lookup
+            return None
+
+    def version(self, session_id: str) -> Optional[int]:
+        """Version of the archived conversation, None if it is not archived"""
+        row = self._connection().execute(
+            "SELECT version FROM archived WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def session_ids(self) -> list[str]:
+        return [
+            row[0]
+            for row in self._connection().execute("SELECT session_id FROM archived")
+        ]
+
+    def remove(self, session_ids: Iterable[str]) -> None:
+        """Drop conversations from the archive, e.g. once they are live again"""
+        session_ids = list(session_ids)
+        segments = self._segments_of(session_ids)
+        self._connection().executemany(
+            "DELETE FROM archived WHERE session_id = ?",
+            [(session_id,) for session_id in session_ids],
+        )
+        self._drop_unreferenced(segments)
+
+    def expire(self, before: datetime) -> list[str]:
+        """Delete conversations last updated before `before`; returns their ids"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT session_id, segment FROM archived WHERE updated_at < ?",
+                (timestamp(before),),
+            ).fetchall()
+            connection.execute(
+                "DELETE FROM archived WHERE updated_at < ?", (timestamp(before),)
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._drop_unreferenced({segment for _, segment in rows})
+        return [session_id for session_id, _ in rows]
+
+    def close(self) -> None:
+        """Close every connection opened by this archive"""
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
@@ -0,0 +1,80 @@
+import asyncio
+from typing import Iterable, Optional
+
+import metrics
+
+from .base import Storage, get_conversations, query_conversations, save_summary
+from .index import ConversationQuery
+from .models import Conversation, ConversationPage, ConversationSummary
+
+storage_seconds = metrics.histogram(
+    "storage_seconds",
+    "Seconds per storage call, worker thread hand-off included, by backend",
+)
+
+
+def backend_name(storage: Storage) -> str:
+    """Class name of the backend, looking through wrappers such as CachedStorage"""
+    while hasattr(storage, "storage"):
+        storage = storage.storage
+    return type(storage).__name__
+
+
+class AsyncStorage:
+    """
+    Async facade over a blocking storage backend. Every call runs in a worker
+    thread so disk I/O never stalls the event loop. Calls are timed in
+    `storage_seconds` by backend and operation.
+    """
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+        self.backend = backend_name(storage)
+
+    async def get_conversation(self, session_id: str) -> Optional[Conversation]:
+        """Get conversation without blocking the event loop"""
+        with storage_seconds.time(backend=self.backend, operation="get"):
+            return await asyncio.to_thread(self.storage.get_conversation, session_id)
+
+    async def get_conversations(
+        self, session_ids: Iterable[str]
+    ) -> dict[str, Conversation]:
+        """Get many conversations in one worker thread call, in bulk if supported"""
+        with storage_seconds.time(backend=self.backend, operation="get_many"):
+            return await asyncio.to_thread(
+                get_conversations, self.storage, list(session_ids)
+            )
+
+    async def get_or_create_conversation(self, session_id: str) -> Conversation:
+        """Get or create conversation without blocking the event loop"""
+        with storage_seconds.time(backend=self.backend, operation="get_or_create"):
+            return await asyncio.to_thread(
+                self.storage.get_or_create_conversation, session_id
+            )
+
+    async def update_conversation(
+        self, session_id: str, conversation: Conversation
+    ) -> None:
+        """Update conversation without blocking the event loop"""
+        with storage_seconds.time(backend=self.backend, operation="update"):
+            await asyncio.to_thread(
+                self.storage.update_conversation, session_id, conversation
+            )
+
+    async def save_summary(
+        self, session_id: str, summary: ConversationSummary
+    ) -> None:
+        """Store a conversation summary without blocking the event loop"""
+        with storage_seconds.time(backend=self.backend, operation="save_summary"):
+            await asyncio.to_thread(save_summary, self.storage, session_id, summary)
+
+    async def query_conversations(self, query: ConversationQuery) -> ConversationPage:
+        """Query the conversation index without blocking the event loop"""
+        with storage_seconds.time(backend=self.backend, operation="query"):
+            return await asyncio.to_thread(query_conversations, self.storage, query)
+
+    async def close(self) -> None:
+        """Close the storage if it supports it, e.g. to flush queued writes"""
+        close = getattr(self.storage, "close", None)
+        if close is not None:
+            await asyncio.to_thread(close)
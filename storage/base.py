@@ -0,0 +1,167 @@
+from typing import TYPE_CHECKING, Hashable, Iterable, Optional, Protocol
+
+from .models import Conversation, ConversationPage, ConversationSummary
+
+if TYPE_CHECKING:
+    from .index import ConversationQuery
+
+
+class ConversationConflictError(Exception):
+    """Raised when a conversation was updated since it was read."""
+
+    def __init__(self, session_id: str, expected_version: int, stored_version: int):
+        super().__init__(
+            f"Conversation {session_id} is at version {stored_version}, "
+            f"expected {expected_version}"
+        )
+        self.session_id = session_id
+        self.expected_version = expected_version
+        self.stored_version = stored_version
+
+
+class Storage(Protocol):
+    """
+    Interface every conversation storage backend implements.
+
+    Backends are blocking; AsyncStorage runs them in worker threads.
+    """
+
+    def get_conversation(self, session_id: str) -> Optional[Conversation]:
+        """Get a stored conversation, or None if it does not exist"""
+        ...
+
+    def get_or_create_conversation(self, session_id: str) -> Conversation:
+        """Get a stored conversation or a new, not yet stored, empty one"""
+        ...
+
+    def update_conversation(
+        self, session_id: str, conversation: Conversation
+    ) -> Optional[Hashable]:
+        """
+        Persist the conversation if the stored version still equals
+        conversation.version (compare-and-swap), then increment
+        conversation.version. Raises ConversationConflictError otherwise.
+        Returns the new version token if get_version is supported.
+        """
+        ...
+
+
+class VersionedStorage(Storage, Protocol):
+    """Backend that can cheaply tell whether a conversation has changed."""
+
+    def get_version(self, session_id: str) -> Optional[Hashable]:
+        """Token that changes on every update, None if the conversation is missing"""
+        ...
+
+
+class GroupCommitStorage(Storage, Protocol):
+    """Backend that can store a batch of conversations with a single sync."""
+
+    def write_conversations(
+        self, writes: list[tuple[Conversation, int]]
+    ) -> dict[str, Optional[Hashable]]:
+        """
+        Store each conversation as is, version included, if its stored version
+        still equals the expected version paired with it, then make the whole
+        batch durable at once. Returns the new version token of every stored
+        conversation; conversations that conflicted are left out.
+        """
+        ...
+
+
+class BulkStorage(Storage, Protocol):
+    """Backend that can read many conversations at once."""
+
+    def get_conversations(self, session_ids: list[str]) -> dict[str, Conversation]:
+        """Stored conversations by session id; missing ones are left out"""
+        ...
+
+
+class ScannableStorage(Storage, Protocol):
+    """Backend that can list the conversations it stores."""
+
+    def session_ids(self) -> list[str]:
+        """Session ids of every stored conversation"""
+        ...
+
+
+class QueryableStorage(Storage, Protocol):
+    """Backend that can find conversations by their indexed metadata."""
+
+    def query_conversations(self, query: "ConversationQuery") -> ConversationPage:
+        """Matching conversations, most recently updated first, one page at a time"""
+        ...
+
+
+class SummaryStorage(Storage, Protocol):
+    """Backend that can store a summary apart from the conversation's turns."""
+
+    def save_summary(self, session_id: str, summary: ConversationSummary) -> None:
+        """
+        Store the summary of a stored conversation, leaving its version and
+        updated_at alone: a summary is derived from the turns, not a turn.
+        Does nothing if the conversation is missing or already has a summary
+        covering at least as many messages.
+        """
+        ...
+
+
+def supersedes(summary: ConversationSummary, conversation: Conversation) -> bool:
+    """Whether the summary covers more of the conversation than its current one"""
+    return summary.message_count <= len(conversation.messages) and (
+        conversation.summary is None
+        or conversation.summary.message_count < summary.message_count
+    )
+
+
+def get_conversations(
+    storage: Storage, session_ids: Iterable[str]
+) -> dict[str, Conversation]:
+    """
+    Read many conversations, in bulk if the backend supports it and one by
+    one otherwise. Missing conversations are left out.
+    """
+    session_ids = list(dict.fromkeys(session_ids))
+    get_many = getattr(storage, "get_conversations", None)
+    if get_many is not None:
+        return get_many(session_ids)
+    conversations = {}
+    for session_id in session_ids:
+        conversation = storage.get_conversation(session_id)
+        if conversation is not None:
+            conversations[session_id] = conversation
+    return conversations
+
+
+def query_conversations(
+    storage: Storage, query: "ConversationQuery"
+) -> ConversationPage:
+    """
+    Answer the query from the outermost layer of storage wrappers that can,
+    such as IndexedStorage or SQLiteStorage. Raises NotImplementedError when
+    no layer keeps an index.
+    """
+    layer = storage
+    while layer is not None:
+        query_method = getattr(layer, "query_conversations", None)
+        if query_method is not None:
+            return query_method(query)
+        layer = getattr(layer, "storage", None)
+    raise NotImplementedError(
+        f"{type(storage).__name__} cannot query conversations: "
+        "no conversation index is configured"
+    )
+
+
+def save_summary(
+    storage: Storage, session_id: str, summary: ConversationSummary
+) -> bool:
+    """
+    Store a conversation summary if the backend supports it. Returns False
+    when it does not: the summary is then recomputed on the next request.
+    """
+    save = getattr(storage, "save_summary", None)
+    if save is None:
+        return False
+    save(session_id, summary)
+    return True
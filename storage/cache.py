@@ -0,0 +1,220 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+import metrics
+
+from .base import Storage, get_conversations, save_summary
+from .models import Conversation, ConversationSummary
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 300.0
+
+# Rough per-message overhead on top of the content (object headers, role, ...)
+MESSAGE_OVERHEAD_BYTES = 64
+
+cache_hits = metrics.counter(
+    "storage_cache_hits_total", "Conversation reads served from the cache"
+)
+cache_misses = metrics.counter(
+    "storage_cache_misses_total",
+    "Conversation reads that went to the storage backend",
+)
+cache_evictions = metrics.counter(
+    "storage_cache_evictions_total",
+    "Conversations dropped from the cache because of size, count, TTL or staleness",
+)
+
+
+@dataclass
+class CacheEntry:
+    conversation: Conversation
+    version: Optional[Hashable]
+    size: int
+    expires_at: float
+
+
+def _estimate_size(conversation: Conversation) -> int:
+    return sum(
+        len(message.content) + MESSAGE_OVERHEAD_BYTES
+        for message in conversation.messages
+    )
+
+
+def _copy(conversation: Conversation) -> Conversation:
+    """
+    Copy the conversation and its message list. Message objects are shared:
+    callers only ever append messages, they never edit them in place.
+    """
+    return conversation.model_copy(update={"messages": list(conversation.messages)})
+
+
+class CachedStorage:
+    """
+    Write-through in-process LRU cache in front of any storage backend.
+
+    Entries are bounded by count, by estimated size and by a TTL. If the
+    backend implements get_version(), every hit is checked against the
+    backend's current version (e.g. file mtime), so a conversation rewritten
+    by another worker is never served stale.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float = DEFAULT_TTL,
+    ):
+        self.storage = storage
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _get_version(self, session_id: str) -> Optional[Hashable]:
+        get_version = getattr(self.storage, "get_version", None)
+        return get_version(session_id) if get_version else None
+
+    def _remove(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._size -= entry.size
+            cache_evictions.inc()
+
+    def _put(self, conversation: Conversation, version: Optional[Hashable]) -> None:
+        entry = CacheEntry(
+            conversation=_copy(conversation),
+            version=version,
+            size=_estimate_size(conversation),
+            expires_at=time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            previous = self._entries.pop(conversation.session_id, None)
+            if previous is not None:
+                self._size -= previous.size
+            if entry.size > self.max_bytes:
+                return
+            self._entries[conversation.session_id] = entry
+            self._size += entry.size
+            while (
+                len(self._entries) > self.max_entries or self._size > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, session_id: str) -> None:
+        """Drop a conversation from the cache"""
+        with self._lock:
+            self._remove(session_id)
+
+    def _cached(self, session_id: str) -> Optional[Conversation]:
+        """Copy of the cached conversation if it is fresh and current"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(session_id)
+                entry = None
+
+        if entry is not None:
+            if entry.version == self._get_version(session_id):
+                with self._lock:
+                    if session_id in self._entries:
+                        self._entries.move_to_end(session_id)
+                cache_hits.inc()
+                return _copy(entry.conversation)
+            self.invalidate(session_id)
+        return None
+
+    def get_conversation(self, session_id: str) -> Optional[Conversation]:
+        """Get conversation from the cache, falling back to the backend"""
+        conversation = self._cached(session_id)
+        if conversation is not None:
+            return conversation
+
+        cache_misses.inc()
+        # Read the version first: if the data changes in between, the next
+        # version check fails and the entry is refreshed
+        version = self._get_version(session_id)
+        conversation = self.storage.get_conversation(session_id)
+        if conversation is not None:
+            self._put(conversation, version)
+        return conversation
+
+    def get_conversations(self, session_ids: list[str]) -> dict[str, Conversation]:
+        """Get conversations from the cache, reading the misses in bulk"""
+        conversations = {}
+        misses = []
+        for session_id in session_ids:
+            conversation = self._cached(session_id)
+            if conversation is None:
+                misses.append(session_id)
+            else:
+                conversations[session_id] = conversation
+
+        cache_misses.inc(len(misses))
+        versions = {session_id: self._get_version(session_id) for session_id in misses}
+        for session_id, conversation in get_conversations(self.storage, misses).items():
+            self._put(conversation, versions[session_id])
+            conversations[session_id] = conversation
+        return {
+            session_id: conversations[session_id]
+            for session_id in session_ids
+            if session_id in conversations
+        }
+
+    def get_or_create_conversation(self, session_id: str) -> Conversation:
+        """Get conversation from the cache, or let the backend create it"""
+        conversation = self.get_conversation(session_id)
+        return conversation or self.storage.get_or_create_conversation(session_id)
+
+    def update_conversation(
+        self, session_id: str, conversation: Conversation
+    ) -> Optional[Hashable]:
+        """
+        Write conversation through to the backend and cache it. Backends that
+        support versions return the version they wrote; asking for it after
+        the write could pick up another worker's newer version instead.
+        """
+        try:
+            version = self.storage.update_conversation(session_id, conversation)
+        except Exception:
+            self.invalidate(session_id)
+            raise
+        if version is None and hasattr(self.storage, "get_version"):
+            self.invalidate(session_id)
+        else:
+            self._put(conversation, version)
+        return version
+
+    def save_summary(self, session_id: str, summary: ConversationSummary) -> None:
+        """
+        Store the summary in the backend and drop the cached copy: the
+        backend's version may not change with it
+        """
+        try:
+            save_summary(self.storage, session_id, summary)
+        finally:
+            self.invalidate(session_id)
+
+    def write_conversations(
+        self, writes: list[tuple[Conversation, int]]
+    ) -> dict[str, Optional[Hashable]]:
+        """Write a batch through to the backend and cache what was stored"""
+        try:
+            versions = self.storage.write_conversations(writes)
+        except Exception:
+            for conversation, _ in writes:
+                self.invalidate(conversation.session_id)
+            raise
+        for conversation, _ in writes:
+            version = versions.get(conversation.session_id)
+            if version is None:
+                self.invalidate(conversation.session_id)
+            else:
+                self._put(conversation, version)
+        return versions
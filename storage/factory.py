@@ -0,0 +1,30 @@
+from functools import partial
+from typing import Optional
+
+from .base import Storage
+from .log_storage import LogStorage
+from .sqlite_storage import SQLiteStorage
+from .storage import SimpleStorage
+
+# Backend name -> (class, default path)
+# json and binary stores are sharded; flat stores are migrated as they are written
+STORAGE_BACKENDS = {
+    "json": (partial(SimpleStorage, layout="sharded"), "storage/records"),
+    "binary": (
+        partial(SimpleStorage, record_format="binary", layout="sharded"),
+        "storage/records",
+    ),
+    "log": (LogStorage, "storage/log"),
+    "sqlite": (SQLiteStorage, "storage/conversations.sqlite3"),
+}
+
+
+def create_storage(backend: str = "json", db_path: Optional[str] = None) -> Storage:
+    """Build the storage backend called `backend`, at its default path unless given"""
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(
+            f"Unknown storage backend: {backend!r} "
+            f"(expected one of {', '.join(STORAGE_BACKENDS)})"
+        )
+    storage_class, default_path = STORAGE_BACKENDS[backend]
+    return storage_class(db_path=db_path or default_path)
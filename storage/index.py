@@ -0,0 +1,355 @@
+"""
+Secondary index over conversation metadata: order_number, problem_category,
+urgency_level and updated_at.
+
+ConversationIndex keeps one row per conversation in an SQLite file, for
+backends that cannot query their own records. SQLiteStorage answers the same
+queries from its conversations table. Both carry one composite index per
+filter ending in (updated_at, session_id): results come newest first and are
+paged with a keyset cursor, so every page is an index range scan no matter
+how deep it is.
+"""
+
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Hashable, Iterable, Iterator, Optional
+
+import metrics
+
+from .base import ScannableStorage, Storage, get_conversations, save_summary
+from .models import (Conversation, ConversationPage, ConversationRef,
+                     ConversationSummary)
+
+logger = logging.getLogger(__name__)
+
+INDEXED_FIELDS = ["order_number", "problem_category", "urgency_level"]
+
+RESULT_COLUMNS = [
+    "session_id",
+    *INDEXED_FIELDS,
+    "message_count",
+    "created_at",
+    "updated_at",
+]
+
+# Indexes serving the queries, on any `conversations` table with these columns
+QUERY_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS conversations_recent "
+    "ON conversations (updated_at, session_id);\n"
+) + "".join(
+    f"CREATE INDEX IF NOT EXISTS conversations_{field}_recent "
+    f"ON conversations ({field}, updated_at, session_id);\n"
+    for field in INDEXED_FIELDS
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    session_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    order_number INTEGER,
+    problem_category TEXT,
+    urgency_level TEXT,
+    message_count INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+DEFAULT_PAGE_SIZE = 50
+
+# Conversations indexed per transaction by rebuild()
+REBUILD_CHUNK = 1000
+
+index_errors = metrics.counter(
+    "storage_index_errors_total",
+    "Stored conversations whose index update failed; rebuild the index to fix",
+)
+
+
+class InvalidCursorError(ValueError):
+    """Raised for a page cursor that was not returned by a query."""
+
+
+@dataclass
+class ConversationQuery:
+    """Filters of a conversation query; unset filters match everything"""
+
+    order_number: Optional[int] = None
+    problem_category: Optional[str] = None
+    urgency_level: Optional[str] = None
+    updated_after: Optional[datetime] = None
+    updated_before: Optional[datetime] = None
+    limit: int = DEFAULT_PAGE_SIZE
+    cursor: Optional[str] = None
+
+
+def timestamp(value: datetime) -> str:
+    """updated_at as stored in the index: ISO 8601 in UTC, naive values are UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def _encode_cursor(updated_at: str, session_id: str) -> str:
+    cursor = json.dumps([updated_at, session_id]).encode()
+    return base64.urlsafe_b64encode(cursor).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        updated_at, session_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError):
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+    return str(updated_at), str(session_id)
+
+
+def run_query(
+    connection: sqlite3.Connection, query: ConversationQuery
+) -> ConversationPage:
+    """Run the query against the `conversations` table of `connection`"""
+    conditions, params = [], []
+    for field in INDEXED_FIELDS:
+        value = getattr(query, field)
+        if value is not None:
+            conditions.append(f"{field} = ?")
+            # Enums such as UrgencyLevel are stored by value
+            params.append(getattr(value, "value", value))
+    if query.updated_after is not None:
+        conditions.append("updated_at >= ?")
+        params.append(timestamp(query.updated_after))
+    if query.updated_before is not None:
+        conditions.append("updated_at < ?")
+        params.append(timestamp(query.updated_before))
+    if query.cursor is not None:
+        conditions.append("(updated_at, session_id) < (?, ?)")
+        params.extend(_decode_cursor(query.cursor))
+
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    # One extra row tells whether there is a next page
+    rows = connection.execute(
+        f"SELECT {', '.join(RESULT_COLUMNS)} FROM conversations {where}"
+        "ORDER BY updated_at DESC, session_id DESC LIMIT ?",
+        [*params, query.limit + 1],
+    ).fetchall()
+    items = [ConversationRef(**dict(zip(RESULT_COLUMNS, row))) for row in rows]
+    next_cursor = None
+    if len(items) > query.limit:
+        last = rows[query.limit - 1]
+        next_cursor = _encode_cursor(last[-1], last[0])
+    return ConversationPage(items=items[: query.limit], next_cursor=next_cursor)
+
+
+class ConversationIndex:
+    """
+    Index rows in an SQLite file in WAL mode, shared by the workers on the
+    host. Rows only move forward: a row is never replaced by an older version
+    of its conversation, so updates may arrive in any order.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._connection().executescript(SCHEMA + QUERY_INDEXES)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def update(self, conversations: Iterable[Conversation]) -> None:
+        """Index the conversations in one transaction"""
+        rows = []
+        for conversation in conversations:
+            collected_data = conversation.collected_data
+            fields = (
+                collected_data.model_dump(mode="json", include=set(INDEXED_FIELDS))
+                if collected_data
+                else {}
+            )
+            rows.append(
+                (
+                    conversation.session_id,
+                    conversation.version,
+                    *(fields.get(field) for field in INDEXED_FIELDS),
+                    len(conversation.messages),
+                    timestamp(conversation.created_at),
+                    timestamp(conversation.updated_at),
+                )
+            )
+        columns = ["session_id", "version", *RESULT_COLUMNS[1:]]
+        connection = self._connection()
+        # rebuild() calls this inside its own transaction
+        own_transaction = not connection.in_transaction
+        if own_transaction:
+            connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                f"INSERT INTO conversations ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)}) "
+                "ON CONFLICT (session_id) DO UPDATE SET "
+                + ", ".join(
+                    f"{column} = excluded.{column}" for column in columns[1:]
+                )
+                + " WHERE excluded.version >= conversations.version",
+                rows,
+            )
+            if own_transaction:
+                connection.execute("COMMIT")
+        except BaseException:
+            if own_transaction:
+                connection.execute("ROLLBACK")
+            raise
+
+    def remove(self, session_ids: Iterable[str]) -> None:
+        """Drop the rows of deleted conversations"""
+        self._connection().executemany(
+            "DELETE FROM conversations WHERE session_id = ?",
+            [(session_id,) for session_id in session_ids],
+        )
+
+    def query(self, query: ConversationQuery) -> ConversationPage:
+        return run_query(self._connection(), query)
+
+    def rebuild(self, conversations: Iterable[Conversation]) -> int:
+        """
+        Index every conversation, then drop the rows of conversations that
+        were not seen. Runs in chunks of REBUILD_CHUNK, so concurrent writers
+        are never blocked for long, and rows they update meanwhile are kept.
+        Returns the number of conversations indexed.
+        """
+        started = timestamp(datetime.now(timezone.utc))
+        connection = self._connection()
+        connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS seen (session_id TEXT PRIMARY KEY)"
+        )
+        connection.execute("DELETE FROM seen")
+        conversations = iter(conversations)
+        count = 0
+        while chunk := list(islice(conversations, REBUILD_CHUNK)):
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.update(chunk)
+                connection.executemany(
+                    "INSERT OR IGNORE INTO seen VALUES (?)",
+                    [(conversation.session_id,) for conversation in chunk],
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            count += len(chunk)
+        connection.execute(
+            "DELETE FROM conversations WHERE updated_at < ? "
+            "AND session_id NOT IN (SELECT session_id FROM seen)",
+            (started,),
+        )
+        connection.execute("DROP TABLE seen")
+        return count
+
+    def close(self) -> None:
+        """Close every connection opened by this index"""
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class IndexedStorage:
+    """
+    Keeps a ConversationIndex up to date with every conversation stored in a
+    backend that cannot query its own records, and answers queries from it.
+
+    The index is updated right after each write. If that fails the write
+    still stands: the error is logged and counted in
+    storage_index_errors_total, and rebuild_index() repairs the index.
+    Writes made while the index was not configured also need a rebuild.
+    """
+
+    def __init__(self, storage: Storage, index: ConversationIndex):
+        self.storage = storage
+        self.index = index
+
+    def _index(self, conversations: list[Conversation]) -> None:
+        try:
+            self.index.update(conversations)
+        except Exception:
+            index_errors.inc(len(conversations))
+            logger.exception("Failed to index %d conversations", len(conversations))
+
+    def get_conversation(self, session_id: str) -> Optional[Conversation]:
+        return self.storage.get_conversation(session_id)
+
+    def get_conversations(self, session_ids: list[str]) -> dict[str, Conversation]:
+        return get_conversations(self.storage, session_ids)
+
+    def get_or_create_conversation(self, session_id: str) -> Conversation:
+        return self.storage.get_or_create_conversation(session_id)
+
+    def update_conversation(
+        self, session_id: str, conversation: Conversation
+    ) -> Optional[Hashable]:
+        version = self.storage.update_conversation(session_id, conversation)
+        self._index([conversation])
+        return version
+
+    def save_summary(self, session_id: str, summary: ConversationSummary) -> None:
+        # Summaries are not indexed
+        save_summary(self.storage, session_id, summary)
+
+    def write_conversations(
+        self, writes: list[tuple[Conversation, int]]
+    ) -> dict[str, Optional[Hashable]]:
+        versions = self.storage.write_conversations(writes)
+        self._index(
+            [
+                conversation
+                for conversation, _ in writes
+                if conversation.session_id in versions
+            ]
+        )
+        return versions
+
+    def query_conversations(self, query: ConversationQuery) -> ConversationPage:
+        return self.index.query(query)
+
+    def close(self) -> None:
+        self.index.close()
+
+
+def rebuild_index(storage: ScannableStorage, index: ConversationIndex) -> int:
+    """
+    Re-index every conversation stored in a backend, e.g. after enabling the
+    index on an existing store. Returns the number of conversations indexed.
+    """
+
+    def stored_conversations() -> Iterator[Conversation]:
+        for session_id in storage.session_ids():
+            conversation = storage.get_conversation(session_id)
+            if conversation is not None:
+                yield conversation
+
+    return index.rebuild(stored_conversations())
@@ -0,0 +1,499 @@
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import IO, Hashable, Optional
+
+from .base import ConversationConflictError
+from .models import CollectedData, Conversation, ConversationSummary
+
+try:
+    import fcntl
+except ImportError:  # Windows: a second writer is not detected
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_COMPACTION_INTERVAL = 60.0
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})\.log$")
+
+# Held with an exclusive flock while a LogStorage has db_path open
+LOCK_FILE = "LOCK"
+
+SNAPSHOT = "snapshot"
+APPEND = "append"
+
+# Conversation fields written to a record only when they change
+SUMMARY_FIELDS = ("summary", "history_summary")
+
+
+@dataclass
+class Location:
+    segment_id: int
+    offset: int
+    length: int
+
+
+@dataclass
+class IndexEntry:
+    """Where a session's records live, plus what is needed to compute deltas."""
+
+    locations: list[Location] = field(default_factory=list)
+    message_count: int = 0
+    version: int = 0
+    collected_data: Optional[dict] = None
+    summaries: dict[str, Optional[dict]] = field(default_factory=dict)
+
+
+def _collected_data_delta(old: Optional[dict], new: Optional[dict]) -> object:
+    """
+    Fields of `new` that differ from `old`. Returns None to clear the
+    collected data and an empty dict when nothing changed.
+    """
+    if new is None:
+        return None if old is not None else {}
+    old = old or {}
+    return {key: value for key, value in new.items() if old.get(key, ...) != value}
+
+
+class LogStorage:
+    """
+    Append-only, log-structured conversation storage.
+
+    Each update appends a single JSON line with only the new messages and the
+    changed collected_data fields to the active segment file, so a turn costs
+    O(turn) bytes instead of rewriting the whole conversation. An in-memory
+    index maps each session to its record offsets; it is rebuilt by scanning
+    the segments at startup. A background thread compacts sealed segments into
+    one snapshot record per session.
+
+    Meant for a single writer process: the index and version checks are not
+    shared across workers. Opening a db_path that another LogStorage holds
+    open fails, in this process or any other.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "db",
+        max_segment_bytes: int = DEFAULT_MAX_SEGMENT_BYTES,
+        compaction_interval: Optional[float] = DEFAULT_COMPACTION_INTERVAL,
+        fsync: bool = False,
+    ):
+        self.db_path = db_path
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync = fsync
+        os.makedirs(db_path, exist_ok=True)
+        self._lock_file = self._acquire_lock()
+
+        self._lock = threading.RLock()
+        self._index: dict[str, IndexEntry] = {}
+        self._segment_ids: list[int] = []
+        self._compacted_segment_id: Optional[int] = None
+        self._rebuild_index()
+        self._open_active_segment()
+
+        self._closed = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        if compaction_interval:
+            self._compactor = threading.Thread(
+                target=self._compaction_loop,
+                args=(compaction_interval,),
+                name="log-storage-compactor",
+                daemon=True,
+            )
+            self._compactor.start()
+
+    def _acquire_lock(self) -> Optional[IO]:
+        """Lock db_path for as long as the store is open, or fail right away"""
+        if fcntl is None:
+            return None
+        lock_file = open(os.path.join(self.db_path, LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(
+                f"{self.db_path} is already open in another LogStorage: "
+                "the log supports a single writer process"
+            )
+        return lock_file
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.db_path, f"segment-{segment_id:06d}.log")
+
+    def _rebuild_index(self) -> None:
+        """Replay every segment in order to rebuild the in-memory index"""
+        self._segment_ids = sorted(
+            int(match.group(1))
+            for name in os.listdir(self.db_path)
+            if (match := SEGMENT_PATTERN.match(name))
+        )
+        for segment_id in self._segment_ids:
+            path = self._segment_path(segment_id)
+            offset = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    record = json.loads(line)
+                    self._apply_to_index(
+                        record, Location(segment_id, offset, len(line))
+                    )
+                    offset += len(line)
+            if offset != os.path.getsize(path):
+                # Torn write from a crash: drop the partial record
+                logger.warning(f"Truncating partial record in segment {segment_id}")
+                os.truncate(path, offset)
+
+    def _apply_to_index(self, record: dict, location: Location) -> None:
+        session_id = record["session_id"]
+        if record["type"] == SNAPSHOT:
+            entry = self._index[session_id] = IndexEntry()
+        else:
+            entry = self._index.setdefault(session_id, IndexEntry())
+        entry.locations.append(location)
+        entry.message_count += len(record["messages"])
+        entry.version = record.get("version", 0)
+        if "collected_data" in record:
+            delta = record["collected_data"]
+            entry.collected_data = (
+                None if delta is None else {**(entry.collected_data or {}), **delta}
+            )
+        for name in SUMMARY_FIELDS:
+            if name in record:
+                entry.summaries[name] = record[name]
+
+    def _open_active_segment(self) -> None:
+        if not self._segment_ids:
+            self._segment_ids.append(1)
+        self._active_id = self._segment_ids[-1]
+        self._active = open(self._segment_path(self._active_id), "ab")
+        self._active_size = self._active.tell()
+
+    def _roll_segment(self) -> None:
+        # Sealed segments never change again: make them durable once
+        os.fsync(self._active.fileno())
+        self._active.close()
+        self._segment_ids.append(self._active_id + 1)
+        self._open_active_segment()
+
+    def _append(self, record: dict, fsync: bool = False) -> Location:
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        full = self._active_size + len(line) > self.max_segment_bytes
+        if self._active_size and full:
+            self._roll_segment()
+        location = Location(self._active_id, self._active_size, len(line))
+        self._active.write(line)
+        self._active.flush()
+        if fsync:
+            os.fsync(self._active.fileno())
+        self._active_size += len(line)
+        return location
+
+    def _read_records(self, locations: list[Location]) -> list[dict]:
+        """
+        Read records in order. Each segment is opened once and adjacent
+        records are fetched with a single read.
+        """
+        runs: list[Location] = []
+        for location in locations:
+            last = runs[-1] if runs else None
+            if (
+                last is not None
+                and last.segment_id == location.segment_id
+                and last.offset + last.length == location.offset
+            ):
+                last.length += location.length
+            else:
+                runs.append(Location(**vars(location)))
+
+        files = {}
+        try:
+            records = []
+            for run in runs:
+                f = files.get(run.segment_id)
+                if f is None:
+                    f = files[run.segment_id] = open(
+                        self._segment_path(run.segment_id), "rb"
+                    )
+                f.seek(run.offset)
+                # One JSON array parse is much cheaper than a loads() per line
+                lines = f.read(run.length).splitlines()
+                records.extend(json.loads(b"[" + b",".join(lines) + b"]"))
+            return records
+        finally:
+            for f in files.values():
+                f.close()
+
+    def _replay(self, locations: list[Location]) -> Optional[dict]:
+        state: Optional[dict] = None
+        for record in self._read_records(locations):
+            if record["type"] == SNAPSHOT or state is None:
+                state = {
+                    "session_id": record["session_id"],
+                    "messages": [],
+                    "collected_data": None,
+                    **{name: None for name in SUMMARY_FIELDS},
+                    "created_at": record.get("created_at"),
+                }
+            state["messages"].extend(record["messages"])
+            if "updated_at" in record:
+                state["updated_at"] = record["updated_at"]
+            state["version"] = record.get("version", 0)
+            if "collected_data" in record:
+                delta = record["collected_data"]
+                state["collected_data"] = (
+                    None
+                    if delta is None
+                    else {**(state["collected_data"] or {}), **delta}
+                )
+            for name in SUMMARY_FIELDS:
+                if name in record:
+                    state[name] = record[name]
+        return state
+
+    def get_conversation(self, session_id: str) -> Optional[Conversation]:
+        """Get conversation by replaying its records"""
+        with self._lock:
+            entry = self._index.get(session_id)
+            if entry is None:
+                return None
+            state = self._replay(entry.locations)
+        return Conversation.model_validate(state)
+
+    def get_or_create_conversation(self, session_id: str) -> Conversation:
+        """Get or create conversation from the log"""
+        conversation = self.get_conversation(session_id)
+        return conversation or Conversation(
+            session_id=session_id,
+            messages=[],
+            collected_data=CollectedData(),
+            created_at=datetime.now(timezone.utc),
+            updated_at=datetime.now(timezone.utc),
+        )
+
+    def session_ids(self) -> list[str]:
+        """Session ids of every stored conversation"""
+        with self._lock:
+            return list(self._index)
+
+    def get_version(self, session_id: str) -> Optional[Hashable]:
+        """Position of the session's latest record"""
+        with self._lock:
+            entry = self._index.get(session_id)
+            if entry is None:
+                return None
+            location = entry.locations[-1]
+            return (location.segment_id, location.offset)
+
+    def _check_version(
+        self, session_id: str, expected_version: int
+    ) -> Optional[IndexEntry]:
+        """Raise unless the stored version equals expected_version; hold the lock"""
+        entry = self._index.get(session_id)
+        stored_version = entry.version if entry is not None else 0
+        if stored_version != expected_version:
+            raise ConversationConflictError(
+                session_id, expected_version, stored_version
+            )
+        return entry
+
+    def _record(
+        self,
+        session_id: str,
+        conversation: Conversation,
+        entry: Optional[IndexEntry],
+        version: int,
+    ) -> dict:
+        """Record bringing the session from `entry` to `conversation` at `version`"""
+        collected_data = (
+            conversation.collected_data.model_dump(mode="json")
+            if conversation.collected_data is not None
+            else None
+        )
+        summaries = {
+            name: summary.model_dump(mode="json")
+            if (summary := getattr(conversation, name)) is not None
+            else None
+            for name in SUMMARY_FIELDS
+        }
+        if entry is None or len(conversation.messages) < entry.message_count:
+            # New session, or history was rewritten: store a full snapshot
+            return {
+                "session_id": session_id,
+                "type": SNAPSHOT,
+                "version": version,
+                "messages": [m.model_dump(mode="json") for m in conversation.messages],
+                "collected_data": collected_data,
+                **summaries,
+                "created_at": conversation.created_at.isoformat(),
+                "updated_at": conversation.updated_at.isoformat(),
+            }
+
+        record = {
+            "session_id": session_id,
+            "type": APPEND,
+            "version": version,
+            "messages": [
+                m.model_dump(mode="json")
+                for m in conversation.messages[entry.message_count :]
+            ],
+            "updated_at": conversation.updated_at.isoformat(),
+        }
+        delta = _collected_data_delta(entry.collected_data, collected_data)
+        if delta != {}:
+            record["collected_data"] = delta
+        for name, summary in summaries.items():
+            if summary != entry.summaries.get(name):
+                record[name] = summary
+        return record
+
+    def update_conversation(
+        self, session_id: str, conversation: Conversation
+    ) -> Hashable:
+        """
+        Append the new messages and collected_data changes to the log if
+        nobody else updated the conversation since it was read. Returns the
+        new version token.
+        """
+        with self._lock:
+            entry = self._check_version(session_id, conversation.version)
+            conversation.updated_at = datetime.now(timezone.utc)
+            record = self._record(
+                session_id, conversation, entry, conversation.version + 1
+            )
+            location = self._append(record, fsync=self.fsync)
+            self._apply_to_index(record, location)
+            conversation.version += 1
+            return (location.segment_id, location.offset)
+
+    def save_summary(self, session_id: str, summary: ConversationSummary) -> None:
+        """
+        Append a record carrying only the summary. It keeps the session's
+        version and has no updated_at, so the conversation's is unchanged.
+        """
+        with self._lock:
+            entry = self._index.get(session_id)
+            if entry is None or summary.message_count > entry.message_count:
+                return
+            stored = entry.summaries.get("summary")
+            if stored is not None and stored["message_count"] >= summary.message_count:
+                return
+            record = {
+                "session_id": session_id,
+                "type": APPEND,
+                "version": entry.version,
+                "messages": [],
+                "summary": summary.model_dump(mode="json"),
+            }
+            location = self._append(record, fsync=self.fsync)
+            self._apply_to_index(record, location)
+
+    def write_conversations(
+        self, writes: list[tuple[Conversation, int]]
+    ) -> dict[str, Hashable]:
+        """
+        Append a record for every conversation whose stored version is still
+        the expected one, then fsync the segment once for the whole batch
+        """
+        versions = {}
+        with self._lock:
+            for conversation, expected_version in writes:
+                session_id = conversation.session_id
+                try:
+                    entry = self._check_version(session_id, expected_version)
+                except ConversationConflictError:
+                    continue
+                record = self._record(
+                    session_id, conversation, entry, conversation.version
+                )
+                location = self._append(record)
+                self._apply_to_index(record, location)
+                versions[session_id] = (location.segment_id, location.offset)
+            if versions:
+                os.fsync(self._active.fileno())
+        return versions
+
+    def compact(self) -> None:
+        """
+        Rewrite all sealed segments into a single segment holding one snapshot
+        record per session. The active segment is left untouched, so writers
+        are only blocked while the index is swapped.
+        """
+        with self._lock:
+            sealed = [
+                segment_id
+                for segment_id in self._segment_ids
+                if segment_id != self._active_id
+            ]
+            if not sealed or sealed == [self._compacted_segment_id]:
+                return
+            sealed_set = set(sealed)
+            sessions = {
+                session_id: [
+                    location
+                    for location in entry.locations
+                    if location.segment_id in sealed_set
+                ]
+                for session_id, entry in self._index.items()
+            }
+
+        # Sealed segments are immutable, so they can be read without the lock
+        target_id = sealed[-1]
+        tmp_path = self._segment_path(target_id) + ".compact"
+        snapshots: dict[str, Location] = {}
+        offset = 0
+        with open(tmp_path, "wb") as f:
+            for session_id, locations in sessions.items():
+                if not locations:
+                    continue
+                state = self._replay(locations)
+                record = {"session_id": session_id, "type": SNAPSHOT, **state}
+                line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+                f.write(line)
+                snapshots[session_id] = Location(target_id, offset, len(line))
+                offset += len(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self._lock:
+            # Replacing the newest sealed segment is crash safe: the snapshots
+            # reset each session's state, so replaying leftovers is harmless
+            os.replace(tmp_path, self._segment_path(target_id))
+            for session_id, location in snapshots.items():
+                entry = self._index[session_id]
+                entry.locations = [location] + [
+                    loc for loc in entry.locations if loc.segment_id not in sealed_set
+                ]
+            for segment_id in sealed[:-1]:
+                os.remove(self._segment_path(segment_id))
+            self._segment_ids = [
+                segment_id
+                for segment_id in self._segment_ids
+                if segment_id not in sealed_set or segment_id == target_id
+            ]
+            self._compacted_segment_id = target_id
+
+        logger.info(f"Compacted {len(sealed)} segments into segment {target_id}")
+
+    def _compaction_loop(self, interval: float) -> None:
+        while not self._closed.wait(interval):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Log compaction failed: {e}")
+
+    def close(self) -> None:
+        """Stop background compaction, close the active segment and unlock"""
+        self._closed.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            self._active.close()
+            if self._lock_file is not None:
+                self._lock_file.close()
@@ -20,6 +20,8 @@ class MessageRole(str, Enum):
 class Message(BaseModel):
     role: MessageRole
     content: str
+    # Computed once when the message is created, used for prompt budgeting
+    token_count: Optional[int] = None
 
 
 class CollectedData(BaseModel):
@@ -34,9 +36,38 @@ class CollectedData(BaseModel):
         return v.lower() if isinstance(v, str) else v
 
 
+class ConversationSummary(BaseModel):
+    text: str
+    # Number of messages the summary covers
+    message_count: int
+
+
 class Conversation(BaseModel):
     session_id: str
+    # Incremented on every stored update, used for optimistic concurrency
+    version: int = 0
     messages: list[Message] = Field(default_factory=list)
     collected_data: Optional[CollectedData] = None
+    summary: Optional[ConversationSummary] = None
+    # Rolling summary of the oldest messages, sent instead of them to the LLM
+    history_summary: Optional[ConversationSummary] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class ConversationRef(BaseModel):
+    """Indexed metadata of a conversation, as returned by conversation queries"""
+
+    session_id: str
+    order_number: Optional[int] = None
+    problem_category: Optional[str] = None
+    urgency_level: Optional[UrgencyLevel] = None
+    message_count: int
     created_at: datetime
     updated_at: datetime
+
+
+class ConversationPage(BaseModel):
+    items: list[ConversationRef]
+    # Pass back as `cursor` to get the next page, None on the last page
+    next_cursor: Optional[str] = None
@@ -0,0 +1,100 @@
+"""
+Binary conversation record format of the `binary` storage backend.
+
+A record is a fixed header followed by the conversation as compact JSON,
+compressed with zstd when the optional `zstandard` package is installed and
+with zlib otherwise:
+
+    magic b"CONV" | format version u8 | codec u8 | conversation version u64 |
+    payload length u32 | payload
+
+The header carries the conversation version, so the compare-and-swap on
+every update reads a few bytes instead of parsing the whole conversation.
+Records are only ever written by this process from validated models, so
+loading them is a single compiled validation pass over the payload.
+
+Existing JSON stores are converted with `python -m storage convert-records`.
+"""
+
+import struct
+import zlib
+from typing import BinaryIO
+
+from .models import Conversation
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency
+    zstandard = None
+
+MAGIC = b"CONV"
+FORMAT_VERSION = 1
+HEADER = struct.Struct(">4sBBQI")
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+DEFAULT_CODEC = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+class RecordFormatError(ValueError):
+    """Raised when a file is not a record this version can read."""
+
+
+def _compress(payload: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(payload, ZLIB_LEVEL)
+    return payload
+
+
+def _decompress(data: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RecordFormatError("Record is zstd compressed: install zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_NONE:
+        return data
+    raise RecordFormatError(f"Unknown record codec {codec}")
+
+
+def encode_record(conversation: Conversation, codec: int = DEFAULT_CODEC) -> bytes:
+    """Serialize a conversation into a record"""
+    payload = _compress(conversation.model_dump_json().encode(), codec)
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, codec, conversation.version, len(payload)
+    )
+    return header + payload
+
+
+def _unpack_header(header: bytes) -> tuple[int, int, int]:
+    """Codec, conversation version and payload length of a record header"""
+    if len(header) < HEADER.size:
+        raise RecordFormatError("Truncated record header")
+    magic, format_version, codec, version, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise RecordFormatError("Not a conversation record")
+    if format_version != FORMAT_VERSION:
+        raise RecordFormatError(f"Unsupported record format {format_version}")
+    return codec, version, length
+
+
+def decode_record(data: bytes) -> Conversation:
+    """Load a conversation from a record"""
+    codec, _, length = _unpack_header(data[: HEADER.size])
+    payload = data[HEADER.size :]
+    if len(payload) != length:
+        raise RecordFormatError("Truncated record payload")
+    return Conversation.model_validate_json(_decompress(payload, codec))
+
+
+def read_record_version(f: BinaryIO) -> int:
+    """Conversation version of the record in `f`, read from its header only"""
+    _, version, _ = _unpack_header(f.read(HEADER.size))
+    return version
@@ -0,0 +1,432 @@
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Hashable, Optional
+
+from .base import ConversationConflictError
+from .index import QUERY_INDEXES, ConversationQuery, run_query, timestamp
+from .models import (CollectedData, Conversation, ConversationPage,
+                     ConversationSummary)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    session_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    message_count INTEGER NOT NULL,
+    has_collected_data INTEGER NOT NULL,
+    order_number INTEGER,
+    problem_category TEXT,
+    problem_description TEXT,
+    urgency_level TEXT,
+    summary TEXT,
+    summary_message_count INTEGER,
+    history_summary TEXT,
+    history_summary_message_count INTEGER,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    token_count INTEGER,
+    PRIMARY KEY (session_id, position)
+) WITHOUT ROWID;
+"""
+
+# Single column indexes of the first release, superseded by QUERY_INDEXES
+DROPPED_INDEXES = [
+    "conversations_order_number",
+    "conversations_problem_category",
+    "conversations_urgency_level",
+    "conversations_updated_at",
+]
+
+COLLECTED_DATA_FIELDS = list(CollectedData.model_fields)
+
+# Columns added after the first release, created on databases that lack them
+MIGRATIONS = {
+    ("conversations", "summary"): "TEXT",
+    ("conversations", "summary_message_count"): "INTEGER",
+    ("conversations", "history_summary"): "TEXT",
+    ("conversations", "history_summary_message_count"): "INTEGER",
+    ("messages", "token_count"): "INTEGER",
+}
+
+# Summaries stored as a (text, message_count) column pair
+SUMMARY_FIELDS = ["summary", "history_summary"]
+SUMMARY_COLUMNS = [
+    column for name in SUMMARY_FIELDS for column in (name, f"{name}_message_count")
+]
+
+CONVERSATION_COLUMNS = ", ".join(
+    [
+        "version",
+        "has_collected_data",
+        *COLLECTED_DATA_FIELDS,
+        *SUMMARY_COLUMNS,
+        "created_at",
+        "updated_at",
+    ]
+)
+
+# Session ids bound per bulk query, well below SQLite's parameter limit
+BULK_READ_CHUNK = 500
+
+
+class SQLiteStorage:
+    """
+    SQLite conversation storage in WAL mode.
+
+    Messages are stored one row per message, so a turn only inserts its new
+    rows, and collected_data lives in indexed columns that can be queried.
+    WAL lets several uvicorn workers share the same file: readers never block
+    the single writer. Each thread reuses its own connection.
+
+    update_conversation commits every turn on its own. The write-behind queue
+    batches the commits of many turns through write_conversations.
+    """
+
+    def __init__(
+        self, db_path: str = "conversations.sqlite3", busy_timeout: float = 5.0
+    ):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._connection().executescript(SCHEMA)
+        self._migrate()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Transactions are managed explicitly with BEGIN/COMMIT. Each
+            # connection is only used by its thread, apart from close()
+            connection = sqlite3.connect(
+                self.db_path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _migrate(self) -> None:
+        connection = self._connection()
+        for (table, column), column_type in MIGRATIONS.items():
+            columns = {
+                row[1] for row in connection.execute(f"PRAGMA table_info({table})")
+            }
+            if column not in columns:
+                connection.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"
+                )
+        for index in DROPPED_INDEXES:
+            connection.execute(f"DROP INDEX IF EXISTS {index}")
+        connection.executescript(QUERY_INDEXES)
+
+    def get_conversation(self, session_id: str) -> Optional[Conversation]:
+        """Get conversation and its messages"""
+        connection = self._connection()
+        # One read transaction so the row and its messages are consistent
+        connection.execute("BEGIN")
+        try:
+            row = connection.execute(
+                f"SELECT {CONVERSATION_COLUMNS} FROM conversations "
+                "WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            messages = connection.execute(
+                "SELECT role, content, token_count FROM messages "
+                "WHERE session_id = ? ORDER BY position",
+                (session_id,),
+            ).fetchall()
+        finally:
+            connection.execute("COMMIT")
+        return self._to_conversation(session_id, row, messages)
+
+    def get_conversations(self, session_ids: list[str]) -> dict[str, Conversation]:
+        """Get many conversations and their messages in one read transaction"""
+        connection = self._connection()
+        rows = {}
+        messages = defaultdict(list)
+        connection.execute("BEGIN")
+        try:
+            for start in range(0, len(session_ids), BULK_READ_CHUNK):
+                chunk = session_ids[start : start + BULK_READ_CHUNK]
+                placeholders = ", ".join("?" for _ in chunk)
+                for session_id, *row in connection.execute(
+                    f"SELECT session_id, {CONVERSATION_COLUMNS} FROM conversations "
+                    f"WHERE session_id IN ({placeholders})",
+                    chunk,
+                ):
+                    rows[session_id] = row
+                for session_id, *message in connection.execute(
+                    "SELECT session_id, role, content, token_count FROM messages "
+                    f"WHERE session_id IN ({placeholders}) "
+                    "ORDER BY session_id, position",
+                    chunk,
+                ):
+                    messages[session_id].append(message)
+        finally:
+            connection.execute("COMMIT")
+        return {
+            session_id: self._to_conversation(
+                session_id, rows[session_id], messages[session_id]
+            )
+            for session_id in session_ids
+            if session_id in rows
+        }
+
+    @staticmethod
+    def _to_conversation(session_id: str, row: tuple, messages: list) -> Conversation:
+        (
+            version,
+            has_collected_data,
+            *values,
+            created_at,
+            updated_at,
+        ) = row
+        collected_values = values[: len(COLLECTED_DATA_FIELDS)]
+        summary_values = values[len(COLLECTED_DATA_FIELDS) :]
+        return Conversation.model_validate(
+            {
+                "session_id": session_id,
+                "version": version,
+                "messages": [
+                    {"role": role, "content": content, "token_count": token_count}
+                    for role, content, token_count in messages
+                ],
+                "collected_data": dict(zip(COLLECTED_DATA_FIELDS, collected_values))
+                if has_collected_data
+                else None,
+                **{
+                    name: {"text": text, "message_count": message_count}
+                    if text is not None
+                    else None
+                    for name, text, message_count in zip(
+                        SUMMARY_FIELDS, summary_values[::2], summary_values[1::2]
+                    )
+                },
+                "created_at": created_at,
+                "updated_at": updated_at,
+            }
+        )
+
+    def get_version(self, session_id: str) -> Optional[Hashable]:
+        """Version counter of the conversation row"""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT version FROM conversations WHERE session_id = ?", (session_id,)
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def get_or_create_conversation(self, session_id: str) -> Conversation:
+        """Get or create conversation from the database"""
+        conversation = self.get_conversation(session_id)
+        return conversation or Conversation(
+            session_id=session_id,
+            messages=[],
+            collected_data=CollectedData(),
+            created_at=datetime.now(timezone.utc),
+            updated_at=datetime.now(timezone.utc),
+        )
+
+    def _write(
+        self,
+        connection: sqlite3.Connection,
+        session_id: str,
+        conversation: Conversation,
+        expected_version: int,
+        version: int,
+    ) -> None:
+        """
+        Store the conversation at `version` if the stored version equals
+        expected_version. Runs inside the caller's write transaction.
+        """
+        collected_data = (
+            conversation.collected_data.model_dump(mode="json")
+            if conversation.collected_data is not None
+            else None
+        )
+        collected_values = [
+            (collected_data or {}).get(name) for name in COLLECTED_DATA_FIELDS
+        ]
+        summary_values = []
+        for name in SUMMARY_FIELDS:
+            summary = getattr(conversation, name)
+            summary_values += (
+                [summary.text, summary.message_count] if summary else [None, None]
+            )
+
+        row = connection.execute(
+            "SELECT version, message_count FROM conversations WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        stored_version, stored_count = row if row else (0, 0)
+        if stored_version != expected_version:
+            raise ConversationConflictError(
+                session_id, expected_version, stored_version
+            )
+        if len(conversation.messages) < stored_count:
+            # History was rewritten: replace all rows
+            connection.execute(
+                "DELETE FROM messages WHERE session_id = ?", (session_id,)
+            )
+            stored_count = 0
+        connection.executemany(
+            "INSERT INTO messages "
+            "(session_id, position, role, content, token_count) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    session_id,
+                    position,
+                    message.role.value,
+                    message.content,
+                    message.token_count,
+                )
+                for position, message in enumerate(
+                    conversation.messages[stored_count:], start=stored_count
+                )
+            ],
+        )
+        connection.execute(
+            "INSERT INTO conversations (session_id, version, message_count, "
+            "has_collected_data, "
+            + ", ".join(COLLECTED_DATA_FIELDS)
+            + ", "
+            + ", ".join(SUMMARY_COLUMNS)
+            + ", created_at, updated_at) VALUES (?, ?, ?, ?, "
+            + ", ".join("?" for _ in COLLECTED_DATA_FIELDS + SUMMARY_COLUMNS)
+            + ", ?, ?) ON CONFLICT (session_id) DO UPDATE SET "
+            + ", ".join(
+                f"{column} = excluded.{column}"
+                for column in [
+                    "version",
+                    "message_count",
+                    "has_collected_data",
+                    *COLLECTED_DATA_FIELDS,
+                    *SUMMARY_COLUMNS,
+                    "updated_at",
+                ]
+            ),
+            (
+                session_id,
+                version,
+                len(conversation.messages),
+                collected_data is not None,
+                *collected_values,
+                *summary_values,
+                timestamp(conversation.created_at),
+                timestamp(conversation.updated_at),
+            ),
+        )
+
+    def update_conversation(
+        self, session_id: str, conversation: Conversation
+    ) -> Hashable:
+        """
+        Insert the new messages and update the conversation row in a single
+        transaction, if nobody else updated it since it was read. Returns the
+        new version.
+        """
+        conversation.updated_at = datetime.now(timezone.utc)
+        connection = self._connection()
+        # IMMEDIATE takes the write lock up front, so the message count read
+        # in _write cannot change before our inserts
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._write(
+                connection,
+                session_id,
+                conversation,
+                conversation.version,
+                conversation.version + 1,
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        conversation.version += 1
+        return conversation.version
+
+    def save_summary(self, session_id: str, summary: ConversationSummary) -> None:
+        """Store the summary in the conversation row, keeping its version"""
+        self._connection().execute(
+            "UPDATE conversations SET summary = ?, summary_message_count = ? "
+            "WHERE session_id = ? AND message_count >= ? "
+            "AND (summary IS NULL OR summary_message_count < ?)",
+            (
+                summary.text,
+                summary.message_count,
+                session_id,
+                summary.message_count,
+                summary.message_count,
+            ),
+        )
+
+    def write_conversations(
+        self, writes: list[tuple[Conversation, int]]
+    ) -> dict[str, Hashable]:
+        """
+        Store every conversation whose stored version is still the expected
+        one in a single transaction, committed with one fsync of the WAL
+        """
+        connection = self._connection()
+        versions = {}
+        # Only this commit waits for the disk; other writers keep NORMAL
+        connection.execute("PRAGMA synchronous=FULL")
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for conversation, expected_version in writes:
+                session_id = conversation.session_id
+                connection.execute("SAVEPOINT write")
+                try:
+                    self._write(
+                        connection,
+                        session_id,
+                        conversation,
+                        expected_version,
+                        conversation.version,
+                    )
+                except ConversationConflictError:
+                    connection.execute("ROLLBACK TO write")
+                    continue
+                finally:
+                    connection.execute("RELEASE write")
+                versions[session_id] = conversation.version
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.execute("PRAGMA synchronous=NORMAL")
+        return versions
+
+    def query_conversations(self, query: ConversationQuery) -> ConversationPage:
+        """Query the indexed columns of the conversations table"""
+        return run_query(self._connection(), query)
+
+    def close(self) -> None:
+        """Close every connection opened by this storage"""
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
@@ -1,28 +1,200 @@
+import hashlib
+import json
 import os
+import re
+import threading
+import uuid
+import zlib
+from contextlib import contextmanager, suppress
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Hashable, Iterator, Optional
 
-from .models import CollectedData, Conversation
+from .archive import ConversationArchive
+from .base import ConversationConflictError, supersedes
+from .index import timestamp
+from .models import CollectedData, Conversation, ConversationSummary
+from .records import decode_record, encode_record, read_record_version
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover threads of this process
+    fcntl = None
+
+# Sessions hash onto a fixed set of lock files instead of one lock file each
+LOCK_STRIPES = 64
+
+# Record format -> file suffix. Binary stores still read JSON records that
+# were not converted yet, see storage/records.py
+RECORD_FORMATS = {"json": ".json", "binary": ".rec"}
+
+# "flat" keeps every record in db_path. "sharded" spreads them over 256
+# directories, db_path/00/ to db_path/ff/, by a hash of the session id: ten
+# million conversations are ~40k files per directory. A second level measured
+# slower below hundreds of millions. Sharded stores still read flat records
+# until they are rewritten
+LAYOUTS = ["flat", "sharded"]
+SHARD_PATTERN = re.compile(r"[0-9a-f]{2}")
+
+# Conversations packed into each archive segment by archive_idle()
+ARCHIVE_BATCH = 10_000
+
+
+def _stat_version(stat: os.stat_result) -> Hashable:
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _fsync_directory(path: str) -> None:
+    """Make the files renamed into the directory durable"""
+    if os.name == "nt":  # Directories cannot be opened for fsync
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 class SimpleStorage:
     """
-    Simple file-based conversation storage using JSON.
+    Simple file-based conversation storage, one file per conversation: JSON
+    or, with record_format="binary", compressed records (storage/records.py).
+    Conversations idle for long can be packed into an archive
+    (storage/archive.py) and are still read from there, more slowly.
+
+    Like LogStorage, single updates are only synced to disk with fsync=True,
+    while write_conversations always syncs its batch.
     In production, replace with a proper database (e.g., Redis, MongoDB).
     """
 
-    def __init__(self, db_path: str = "db"):
+    def __init__(
+        self,
+        db_path: str = "db",
+        record_format: str = "json",
+        layout: str = "flat",
+        fsync: bool = False,
+    ):
+        if record_format not in RECORD_FORMATS:
+            raise ValueError(
+                f"Unknown record format: {record_format!r} "
+                f"(expected one of {', '.join(RECORD_FORMATS)})"
+            )
+        if layout not in LAYOUTS:
+            raise ValueError(
+                f"Unknown layout: {layout!r} (expected one of {', '.join(LAYOUTS)})"
+            )
         self.db_path = db_path
+        self.record_format = record_format
+        self.layout = layout
+        self.fsync = fsync
         os.makedirs(db_path, exist_ok=True)
+        self._locks_path = os.path.join(db_path, ".locks")
+        os.makedirs(self._locks_path, exist_ok=True)
+        self._thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._archive_path = os.path.join(db_path, "archive")
+        self._archive: Optional[ConversationArchive] = None
+        self._archive_lock = threading.Lock()
+
+    def _path(
+        self,
+        session_id: str,
+        record_format: Optional[str] = None,
+        layout: Optional[str] = None,
+    ) -> str:
+        suffix = RECORD_FORMATS[record_format or self.record_format]
+        directory = self.db_path
+        if (layout or self.layout) == "sharded":
+            shard = hashlib.blake2b(session_id.encode(), digest_size=1).hexdigest()
+            directory = os.path.join(self.db_path, shard)
+        return os.path.join(directory, f"{session_id}{suffix}")
+
+    def _paths(self, session_id: str) -> list[str]:
+        """Where the session's record may be, the current layout and format first"""
+        return [
+            self._path(session_id, record_format, layout)
+            for layout in dict.fromkeys([self.layout, "flat"])
+            for record_format in dict.fromkeys([self.record_format, "json"])
+        ]
+
+    def _record_paths(self) -> Iterator[tuple[str, str]]:
+        """Session id and path of every record file, in any layout and format"""
+        directories = [self.db_path] + [
+            os.path.join(self.db_path, name)
+            for name in os.listdir(self.db_path)
+            if SHARD_PATTERN.fullmatch(name)
+        ]
+        for directory in directories:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    for suffix in RECORD_FORMATS.values():
+                        if entry.name.endswith(suffix):
+                            yield entry.name[: -len(suffix)], entry.path
+
+    def _get_archive(self, create: bool = False) -> Optional[ConversationArchive]:
+        """The store's archive, once some process has created it"""
+        if self._archive is None and (create or os.path.isdir(self._archive_path)):
+            with self._archive_lock:
+                if self._archive is None:
+                    self._archive = ConversationArchive(self._archive_path)
+        return self._archive
+
+    @contextmanager
+    def _session_lock(self, session_id: str) -> Iterator[None]:
+        """Exclusive lock on the session across threads and processes"""
+        stripe = zlib.crc32(session_id.encode()) % LOCK_STRIPES
+        with self._thread_locks[stripe]:
+            if fcntl is None:
+                yield
+                return
+            lock_path = os.path.join(self._locks_path, f"{stripe:02d}.lock")
+            with open(lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_live(self, session_id: str) -> Optional[Conversation]:
+        """Conversation from its record file, ignoring the archive"""
+        for path in self._paths(session_id):
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            if path.endswith(RECORD_FORMATS["binary"]):
+                return decode_record(data)
+            return Conversation.model_validate_json(data)
+        return None
 
     def get_conversation(self, session_id: str) -> Optional[Conversation]:
-        """Get conversation from JSON file"""
-        file_path = os.path.join(self.db_path, f"{session_id}.json")
-        if os.path.exists(file_path):
-            with open(file_path, "r") as f:
-                return Conversation.model_validate_json(f.read())
+        """Get conversation from its record file, or from the archive"""
+        conversation = self._read_live(session_id)
+        if conversation is None and (archive := self._get_archive()) is not None:
+            return archive.get(session_id)
+        return conversation
+
+    def get_version(self, session_id: str) -> Optional[Hashable]:
+        """Cheap token that changes whenever the conversation file is rewritten"""
+        for path in self._paths(session_id):
+            try:
+                return _stat_version(os.stat(path))
+            except FileNotFoundError:
+                continue
+        if (archive := self._get_archive()) is not None:
+            version = archive.version(session_id)
+            if version is not None:
+                return ("archived", version)
         return None
 
+    def session_ids(self) -> list[str]:
+        """Session ids of every stored conversation, live or archived"""
+        session_ids = dict.fromkeys(
+            session_id for session_id, _ in self._record_paths()
+        )
+        if (archive := self._get_archive()) is not None:
+            session_ids.update(dict.fromkeys(archive.session_ids()))
+        return list(session_ids)
+
     def get_or_create_conversation(self, session_id: str) -> Conversation:
         """Get or create conversation from JSON file"""
         conversation = self.get_conversation(session_id)
@@ -36,9 +208,240 @@ class SimpleStorage:
             updated_at=datetime.now(timezone.utc),
         )
 
-    def update_conversation(self, session_id: str, conversation: Conversation) -> None:
-        """Update conversation in JSON file"""
-        conversation.updated_at = datetime.now(timezone.utc)
-        file_path = os.path.join(self.db_path, f"{session_id}.json")
-        with open(file_path, "w") as f:
-            f.write(conversation.model_dump_json())
+    def _stored_version(self, session_id: str) -> tuple[int, bool]:
+        """Stored version of the conversation and whether it is archived"""
+        for path in self._paths(session_id):
+            try:
+                with open(path, "rb") as f:
+                    if path.endswith(RECORD_FORMATS["binary"]):
+                        return read_record_version(f), False
+                    return json.load(f).get("version", 0), False
+            except FileNotFoundError:
+                continue
+        if (archive := self._get_archive()) is not None:
+            version = archive.version(session_id)
+            if version is not None:
+                return version, True
+        return 0, False
+
+    def _check_version(self, session_id: str, expected_version: int) -> bool:
+        """
+        Raise unless the stored version equals expected_version; hold the
+        lock. Returns whether the stored conversation is archived.
+        """
+        stored_version, archived = self._stored_version(session_id)
+        if stored_version != expected_version:
+            raise ConversationConflictError(
+                session_id, expected_version, stored_version
+            )
+        return archived
+
+    def _write(
+        self, session_id: str, conversation: Conversation, fsync: bool = False
+    ) -> Hashable:
+        """
+        Atomically replace the conversation file and return its version. With
+        fsync, the file is synced before the rename; syncing the directory
+        that holds the rename is left to the caller.
+        """
+        if self.record_format == "binary":
+            data = encode_record(conversation)
+        else:
+            data = conversation.model_dump_json().encode()
+        file_path, *stale_paths = self._paths(session_id)
+        if self.layout != "flat":
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+                version = _stat_version(os.fstat(f.fileno()))
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        # Records in an older format or layout are now stale
+        for path in stale_paths:
+            with suppress(FileNotFoundError):
+                os.remove(path)
+        return version
+
+    def _unarchive(self, session_ids: list[str]) -> None:
+        """Drop archived copies of conversations that were written again"""
+        if session_ids:
+            self._get_archive(create=True).remove(session_ids)
+
+    def update_conversation(
+        self, session_id: str, conversation: Conversation
+    ) -> Hashable:
+        """
+        Update conversation in JSON file if nobody else updated it since it
+        was read. The file is replaced atomically, so readers never see a
+        partial write. Returns the new file version.
+        """
+        with self._session_lock(session_id):
+            archived = self._check_version(session_id, conversation.version)
+            conversation.updated_at = datetime.now(timezone.utc)
+            conversation.version += 1
+            try:
+                version = self._write(session_id, conversation, fsync=self.fsync)
+                if self.fsync:
+                    _fsync_directory(os.path.dirname(self._path(session_id)))
+            except BaseException:
+                conversation.version -= 1
+                raise
+            if archived:
+                self._unarchive([session_id])
+            return version
+
+    def save_summary(self, session_id: str, summary: ConversationSummary) -> None:
+        """
+        Store the summary in the conversation's record file. The version and
+        updated_at are kept, and so is the file's mtime, which retention reads
+        as the last activity. Archived conversations are left as they are.
+        """
+        with self._session_lock(session_id):
+            for path in self._paths(session_id):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                conversation = self._read_live(session_id)
+                if conversation is None or not supersedes(summary, conversation):
+                    return
+                conversation.summary = summary
+                self._write(session_id, conversation)
+                os.utime(
+                    self._path(session_id), ns=(stat.st_atime_ns, stat.st_mtime_ns)
+                )
+                return
+
+    def write_conversations(
+        self, writes: list[tuple[Conversation, int]]
+    ) -> dict[str, Hashable]:
+        """
+        Replace the files of the conversations whose stored version is still
+        the expected one. Each file is synced as it is written, and each
+        directory they were renamed into once for the whole batch.
+        """
+        versions = {}
+        unarchived = []
+        directories = set()
+        for conversation, expected_version in writes:
+            session_id = conversation.session_id
+            with self._session_lock(session_id):
+                try:
+                    archived = self._check_version(session_id, expected_version)
+                except ConversationConflictError:
+                    continue
+                versions[session_id] = self._write(
+                    session_id, conversation, fsync=True
+                )
+            directories.add(os.path.dirname(self._path(session_id)))
+            if archived:
+                unarchived.append(session_id)
+        for directory in directories:
+            _fsync_directory(directory)
+        self._unarchive(unarchived)
+        return versions
+
+    def convert_records(self) -> int:
+        """
+        Rewrite every record that is not in this store's record format and
+        layout, e.g. after switching a flat JSON store to sharded binary
+        records. Safe to run while the store is in use. Returns the number
+        converted.
+        """
+        converted = 0
+        for session_id, path in self._record_paths():
+            if path == self._path(session_id):
+                continue
+            with self._session_lock(session_id):
+                if os.path.exists(self._path(session_id)):
+                    # Left behind by a crash right after a newer record was written
+                    with suppress(FileNotFoundError):
+                        os.remove(path)
+                    continue
+                conversation = self._read_live(session_id)
+                if conversation is None:
+                    continue
+                self._write(session_id, conversation)
+                converted += 1
+        return converted
+
+    def archive_idle(self, before: datetime) -> int:
+        """
+        Move conversations last updated before `before` into the archive, in
+        segments of ARCHIVE_BATCH. Returns the number archived.
+
+        Records last written after `before` are skipped without being read:
+        a conversation's updated_at is never later than its file's mtime.
+        """
+        archived = 0
+        batch: dict[str, None] = {}
+        for session_id, path in self._record_paths():
+            try:
+                if os.stat(path).st_mtime >= before.timestamp():
+                    continue
+            except FileNotFoundError:
+                continue
+            batch[session_id] = None
+            if len(batch) >= ARCHIVE_BATCH:
+                archived += self._archive_batch(list(batch), before)
+                batch.clear()
+        return archived + self._archive_batch(list(batch), before)
+
+    def _archive_batch(self, session_ids: list[str], before: datetime) -> int:
+        conversations = [
+            conversation
+            for conversation in map(self._read_live, session_ids)
+            if conversation is not None
+            and timestamp(conversation.updated_at) < timestamp(before)
+        ]
+        if not conversations:
+            return 0
+        # The batch is appended as one segment, before any session is locked
+        archive = self._get_archive(create=True)
+        archive.append(conversations)
+        changed = []
+        for conversation in conversations:
+            session_id = conversation.session_id
+            with self._session_lock(session_id):
+                # Updated meanwhile: keep the file, and drop the stale copy
+                # below so that it cannot resurface once the file is deleted
+                if self._stored_version(session_id) != (conversation.version, False):
+                    changed.append(session_id)
+                    continue
+                for path in self._paths(session_id):
+                    with suppress(FileNotFoundError):
+                        os.remove(path)
+        archive.remove(changed)
+        return len(conversations) - len(changed)
+
+    def delete_expired(self, before: datetime) -> list[str]:
+        """
+        Delete conversations last updated before `before`, live or archived.
+        Returns the session ids deleted.
+        """
+        deleted = {}
+        for session_id, path in self._record_paths():
+            with self._session_lock(session_id):
+                try:
+                    if os.stat(path).st_mtime >= before.timestamp():
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            deleted[session_id] = None
+        if (archive := self._get_archive()) is not None:
+            deleted.update(dict.fromkeys(archive.expire(before)))
+        return list(deleted)
+
+    def close(self) -> None:
+        """Close the archive's index connections"""
+        if self._archive is not None:
+            self._archive.close()
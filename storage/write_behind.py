@@ -0,0 +1,298 @@
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Hashable, Iterable, Iterator, Optional
+
+import metrics
+
+from .base import (ConversationConflictError, GroupCommitStorage,
+                   get_conversations, save_summary, supersedes)
+from .cache import _copy
+from .models import Conversation, ConversationSummary
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 1000
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_MAX_BATCH = 100
+
+# Sessions hash onto a fixed set of locks that serialize their updates
+LOCK_STRIPES = 64
+
+flush_seconds = metrics.histogram(
+    "storage_flush_seconds", "Seconds to write and sync one write-behind batch"
+)
+write_lag_seconds = metrics.histogram(
+    "storage_write_lag_seconds",
+    "Seconds from queueing a conversation until its batch was durable",
+)
+flushed_writes = metrics.counter(
+    "storage_flushed_writes_total", "Conversations written by the write-behind writer"
+)
+coalesced_writes = metrics.counter(
+    "storage_coalesced_writes_total",
+    "Updates folded into a conversation that was already queued",
+)
+write_conflicts = metrics.counter(
+    "storage_write_conflicts_total",
+    "Queued conversations dropped because another worker changed them first",
+)
+flush_errors = metrics.counter(
+    "storage_flush_errors_total", "Write-behind batches that failed and were retried"
+)
+
+
+@dataclass
+class PendingWrite:
+    conversation: Conversation
+    # Stored version the write applies to, checked again when it is written
+    expected_version: int
+    queued_at: float
+
+
+class WriteBehindStorage:
+    """
+    Write-behind queue in front of a storage backend.
+
+    update_conversation checks the version and queues a copy of the
+    conversation instead of writing it. A background thread writes the queue
+    in batches of up to `max_batch` through the backend's
+    write_conversations, so each batch costs one sync. Updates of a session
+    that is still queued replace the queued copy, and reads return it.
+
+    At most `max_pending` sessions are queued; further updates block until
+    the writer catches up. close() writes everything still queued.
+    """
+
+    def __init__(
+        self,
+        storage: GroupCommitStorage,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_batch: int = DEFAULT_MAX_BATCH,
+    ):
+        if not hasattr(storage, "write_conversations"):
+            raise TypeError(
+                f"{type(storage).__name__} does not support batched writes"
+            )
+        self.storage = storage
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: OrderedDict[str, PendingWrite] = OrderedDict()
+        # Batch being written: still served to readers until it is stored
+        self._writing: dict[str, PendingWrite] = {}
+        self._flush_waiters = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._session_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+        metrics.gauge(
+            "storage_write_queue_depth", "Conversations waiting for the writer"
+        ).set_function(lambda: len(self._pending))
+
+        self._writer = threading.Thread(
+            target=self._write_loop, name="storage-write-behind", daemon=True
+        )
+        self._writer.start()
+
+    @contextmanager
+    def _session_lock(self, session_id: str) -> Iterator[None]:
+        with self._session_locks[zlib.crc32(session_id.encode()) % LOCK_STRIPES]:
+            yield
+
+    def _latest(self, session_id: str) -> Optional[PendingWrite]:
+        """Newest queued or in-flight write of the session"""
+        with self._condition:
+            return self._pending.get(session_id) or self._writing.get(session_id)
+
+    def get_conversation(self, session_id: str) -> Optional[Conversation]:
+        """Get the queued conversation, falling back to the backend"""
+        pending = self._latest(session_id)
+        if pending is not None:
+            return _copy(pending.conversation)
+        return self.storage.get_conversation(session_id)
+
+    def get_conversations(self, session_ids: Iterable[str]) -> dict[str, Conversation]:
+        """Get queued conversations from memory and read the rest in bulk"""
+        conversations = {}
+        missing = []
+        for session_id in session_ids:
+            pending = self._latest(session_id)
+            if pending is None:
+                missing.append(session_id)
+            else:
+                conversations[session_id] = _copy(pending.conversation)
+        conversations.update(get_conversations(self.storage, missing))
+        return {
+            session_id: conversations[session_id]
+            for session_id in session_ids
+            if session_id in conversations
+        }
+
+    def get_or_create_conversation(self, session_id: str) -> Conversation:
+        """Get the queued conversation, or let the backend get or create it"""
+        conversation = self.get_conversation(session_id)
+        return conversation or self.storage.get_or_create_conversation(session_id)
+
+    def update_conversation(
+        self, session_id: str, conversation: Conversation
+    ) -> Optional[Hashable]:
+        """
+        Queue the conversation if nobody updated it since it was read. The
+        version is checked against the queued copy, or the stored one if none
+        is queued, and incremented as the backends do. Returns None: there is
+        no stored version yet. Once closed, updates are written directly.
+        """
+        with self._session_lock(session_id):
+            if self._closed:
+                self._writer.join()
+                return self.storage.update_conversation(session_id, conversation)
+
+            pending = self._latest(session_id)
+            if pending is not None:
+                stored_version = pending.conversation.version
+            else:
+                stored = self.storage.get_conversation(session_id)
+                stored_version = stored.version if stored is not None else 0
+            if stored_version != conversation.version:
+                raise ConversationConflictError(
+                    session_id, conversation.version, stored_version
+                )
+
+            conversation.updated_at = datetime.now(timezone.utc)
+            conversation.version += 1
+            self._enqueue(session_id, _copy(conversation), stored_version)
+            return None
+
+    def save_summary(self, session_id: str, summary: ConversationSummary) -> None:
+        """
+        Put the summary on the queued copy of the conversation, so the writer
+        stores it with the turn, or store it in the backend if none is queued.
+        A copy being written is waited for: it would overwrite the summary.
+        """
+        with self._session_lock(session_id):
+            with self._condition:
+                self._condition.wait_for(lambda: session_id not in self._writing)
+                pending = self._pending.get(session_id)
+                if pending is not None:
+                    if supersedes(summary, pending.conversation):
+                        pending.conversation.summary = summary
+                    return
+            # Nothing can queue the session while its lock is held
+            save_summary(self.storage, session_id, summary)
+
+    def _enqueue(
+        self, session_id: str, conversation: Conversation, stored_version: int
+    ) -> None:
+        with self._condition:
+            queued = self._pending.get(session_id)
+            if queued is not None:
+                # Still waiting for the writer: the latest version replaces it
+                queued.conversation = conversation
+                coalesced_writes.inc()
+                return
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self._condition.wait()
+            self._pending[session_id] = PendingWrite(
+                conversation, stored_version, time.monotonic()
+            )
+            self._condition.notify_all()
+
+    def _next_batch(self) -> dict[str, PendingWrite]:
+        """Wait for queued writes and move up to max_batch of them to _writing"""
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            # Give the batch time to fill, unless someone is waiting for it
+            self._condition.wait_for(
+                lambda: len(self._pending) >= self.max_batch
+                or self._closed
+                or self._flush_waiters,
+                timeout=self.flush_interval,
+            )
+            while self._pending and len(self._writing) < self.max_batch:
+                session_id, pending = self._pending.popitem(last=False)
+                self._writing[session_id] = pending
+            self._condition.notify_all()
+            return dict(self._writing)
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+
+            start = time.perf_counter()
+            try:
+                versions = self.storage.write_conversations(
+                    [
+                        (pending.conversation, pending.expected_version)
+                        for pending in batch.values()
+                    ]
+                )
+            except Exception as e:
+                flush_errors.inc()
+                logger.error(f"Failed to write {len(batch)} conversations: {e}")
+                self._requeue(batch)
+                if self._closed:
+                    logger.error(
+                        f"Dropped {len(self._pending)} queued conversations on close"
+                    )
+                    with self._condition:
+                        self._pending.clear()
+                        self._condition.notify_all()
+                    return
+                time.sleep(self.flush_interval)
+                continue
+
+            now = time.monotonic()
+            flush_seconds.observe(time.perf_counter() - start)
+            flushed_writes.inc(len(versions))
+            for session_id, pending in batch.items():
+                write_lag_seconds.observe(now - pending.queued_at)
+                if session_id not in versions:
+                    write_conflicts.inc()
+                    logger.warning(
+                        f"Queued update of {session_id} dropped: the conversation "
+                        f"changed in storage since version {pending.expected_version}"
+                    )
+            with self._condition:
+                self._writing.clear()
+                self._condition.notify_all()
+
+    def _requeue(self, batch: dict[str, PendingWrite]) -> None:
+        """Put a failed batch back, under any newer update of the same session"""
+        with self._condition:
+            for session_id, pending in batch.items():
+                newer = self._pending.get(session_id)
+                if newer is not None:
+                    newer.expected_version = pending.expected_version
+                    newer.queued_at = pending.queued_at
+                else:
+                    self._pending[session_id] = pending
+            self._writing.clear()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far is written; False on timeout"""
+        with self._condition:
+            self._flush_waiters += 1
+            self._condition.notify_all()
+            try:
+                return self._condition.wait_for(
+                    lambda: not self._pending and not self._writing, timeout
+                )
+            finally:
+                self._flush_waiters -= 1
+
+    def close(self) -> None:
+        """Write everything still queued and stop the writer"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._writer.join()
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import subprocess
+import sys
+from unittest.mock import AsyncMock, Mock, patch
+
+from fastapi.testclient import TestClient
+
+from main import create_app
+
+# Seconds `import main` may take in a fresh interpreter (FastAPI is most of it)
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "1.5"))
+
+# Modules the first request that needs the upstream imports, not startup
+LAZY_MODULES = ("openai", "openai_client", "llm.transport")
+
+
+def import_times(code: str) -> dict[str, int]:
+    """Cumulative microseconds per module imported by `code`, from -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={"OPENAI_API_KEY": "test", **os.environ},
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+def report(times: dict[str, int], top: int = 15) -> str:
+    slowest = sorted(times.items(), key=lambda item: item[1], reverse=True)[:top]
+    return "\n".join(f"{us / 1000:>9.1f} ms  {module}" for module, us in slowest)
+
+
+class TestImportTime:
+    def test_import_main_within_budget(self):
+        times = import_times("import main")
+
+        print(f"\n`import main`, cumulative import time:\n{report(times)}")
+        assert times["main"] / 1e6 <= IMPORT_TIME_BUDGET, report(times)
+
+    def test_upstream_client_is_imported_on_first_use(self):
+        times = import_times("import main; main.create_app()")
+
+        assert not set(LAZY_MODULES) & set(times), report(times)
+
+
+class TestCreateApp:
+    def test_lifespan_opens_storage_and_closes_services(self):
+        app = create_app()
+        services = app.state.services
+        storage = Mock(close=AsyncMock())
+
+        with patch("services.create_conversation_storage", return_value=storage):
+            with TestClient(app):
+                assert services.storage is storage
+                assert "openai_client" not in vars(services)
+
+        storage.close.assert_awaited_once()
+
+    def test_close_cancels_background_summaries(self):
+        services = create_app().state.services
+
+        async def scenario():
+            task = asyncio.create_task(asyncio.sleep(60))
+            services.background_summaries.add(task)
+            await services.close()
+            return task
+
+        assert asyncio.run(scenario()).cancelled()
+
+    def test_apps_have_their_own_limiter(self):
+        first, second = create_app(), create_app()
+        assert first.state.limiter is not second.state.limiter
+        assert first.state.services is not second.state.services
+        assert (
+            first.state.services.session_locks
+            is not second.state.services.session_locks
+        )
+
+        with patch.object(
+            first.state.services.openai_client,
+            "is_offensive_content",
+            return_value=True,
+        ):
+            client = TestClient(first)
+            statuses = [
+                client.post("/chat", json={"user_message": "Hi"}).status_code
+                for _ in range(11)
+            ]
+        with patch.object(
+            second.state.services.openai_client,
+            "is_offensive_content",
+            return_value=True,
+        ):
+            status = TestClient(second).post("/chat", json={"user_message": "Hi"})
+
+        assert statuses == [400] * 10 + [429]
+        assert status.status_code == 400
@@ -6,23 +6,30 @@ from openai.types.chat import \
     ChatCompletionUserMessageParam as OpenAIUserMessage
 
 from chat import CHAT_SYSTEM_MESSAGE, ChatResponse
-from main import app
+from chat.api import wasted_completions
+from main import create_app
 from storage import CollectedData, Conversation
 
+app = create_app()
+openai_client = app.state.services.openai_client
+storage = app.state.services.storage
+limiter = app.state.limiter
+
 
 class TestChatAPI:
     def setup_method(self):
         self.client = TestClient(app)
+        limiter.reset()
 
         # Mock openai client methods
-        self.offensive_patcher = patch("config.openai_client.is_offensive_content")
-        self.completion_patcher = patch("config.openai_client.create_chat_completion")
+        self.offensive_patcher = patch.object(openai_client, "is_offensive_content")
+        self.completion_patcher = patch.object(openai_client, "create_chat_completion")
         self.mock_is_offensive = self.offensive_patcher.start()
         self.mock_create_completion = self.completion_patcher.start()
 
         # Mock storage
-        self.get_or_create_patcher = patch("config.storage.get_or_create_conversation")
-        self.update_patcher = patch("config.storage.update_conversation")
+        self.get_or_create_patcher = patch.object(storage, "get_or_create_conversation")
+        self.update_patcher = patch.object(storage, "update_conversation")
         self.mock_get_or_create = self.get_or_create_patcher.start()
         self.mock_update = self.update_patcher.start()
 
@@ -120,3 +127,69 @@ class TestChatAPI:
         assert response.json() == {
             "detail": "Failed to generate response: Failed to create chat completion"
         }
+
+    @patch("chat.api.schedule_summary")
+    @patch("chat.api.SUMMARY_PRECOMPUTE", True)
+    def test_chat_completing_collected_data_precomputes_summary(self, m_schedule):
+        self.mock_get_or_create.return_value = Conversation(
+            session_id="test-session-id",
+            collected_data=CollectedData(
+                order_number=1234, problem_category="broken product"
+            ),
+            created_at=datetime.now(timezone.utc),
+            updated_at=datetime.now(timezone.utc),
+        )
+        self.mock_is_offensive.return_value = False
+        self.mock_create_completion.return_value = (
+            "Thank you for providing all the details."
+            '<COLLECTED_DATA>{"order_number": 1234, "problem_category": '
+            '"broken product", "problem_description": "The blender does not start", '
+            '"urgency_level": "high"}</COLLECTED_DATA>'
+        )
+
+        response = self.client.post(
+            "/chat",
+            json={
+                "user_message": "The blender does not start",
+                "transaction_id": "test-transaction-id",
+            },
+        )
+
+        assert response.status_code == 200
+        m_schedule.assert_called_once_with(app.state.services, "test-transaction-id")
+
+
+class TestSpeculativeChatAPI(TestChatAPI):
+    """Re-run the chat tests with moderation and completion overlapping."""
+
+    def setup_method(self):
+        super().setup_method()
+        self.speculative_patcher = patch("chat.api.SPECULATIVE_MODERATION", True)
+        self.speculative_patcher.start()
+
+    def teardown_method(self):
+        self.speculative_patcher.stop()
+        super().teardown_method()
+
+    def test_chat_offensive_content_discards_completion(self):
+        self.mock_get_or_create.return_value = Conversation(
+            session_id="test-session-id",
+            created_at=datetime.now(timezone.utc),
+            updated_at=datetime.now(timezone.utc),
+        )
+        self.mock_is_offensive.return_value = True
+        self.mock_create_completion.return_value = "Reply to an offensive message"
+        wasted_before = wasted_completions.value
+
+        response = self.client.post(
+            "/chat",
+            json={
+                "user_message": "fuck you",
+                "transaction_id": "test-transaction-id",
+            },
+        )
+
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Message contains offensive content."}
+        self.mock_update.assert_not_called()
+        assert wasted_completions.value == wasted_before + 1
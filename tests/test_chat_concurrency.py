@@ -0,0 +1,182 @@
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from chat.api import conversation_conflicts, save_turn
+from chat.models import OpenAIResponse
+from chat.prompts import CHAT_SUMMARY_SYSTEM_MESSAGE
+from main import create_app
+from storage import (AsyncStorage, CachedStorage, LogStorage, SimpleStorage,
+                     SQLiteStorage)
+from storage.models import (CollectedData, ConversationSummary, Message,
+                            MessageRole)
+
+app = create_app()
+services = app.state.services
+openai_client = services.openai_client
+limiter = app.state.limiter
+
+TURNS = 20
+
+BACKENDS = {
+    "json": lambda path: SimpleStorage(db_path=str(path / "records")),
+    "log": lambda path: LogStorage(
+        db_path=str(path / "log"), compaction_interval=None
+    ),
+    "sqlite": lambda path: SQLiteStorage(db_path=str(path / "db.sqlite3")),
+    "cached-json": lambda path: CachedStorage(
+        SimpleStorage(db_path=str(path / "records"))
+    ),
+}
+
+
+async def slow_completion(messages, **kwargs):
+    # Long enough for every request to read the conversation before any writes
+    await asyncio.sleep(0.05)
+    return f"Reply to: {messages[-1]['content']}"
+
+
+async def send_turns(transaction_id: str) -> list[httpx.Response]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(
+            *(
+                client.post(
+                    "/chat",
+                    json={
+                        "user_message": f"Turn {i}",
+                        "transaction_id": transaction_id,
+                    },
+                )
+                for i in range(TURNS)
+            )
+        )
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, tmp_path):
+    backend = BACKENDS[request.param](tmp_path)
+    yield backend
+    if hasattr(backend, "close"):
+        backend.close()
+
+
+@pytest.fixture(autouse=True)
+def mock_app(backend):
+    limiter.enabled = False
+    with (
+        patch.object(services, "storage", AsyncStorage(backend)),
+        patch.object(openai_client, "is_offensive_content", return_value=False),
+        patch.object(
+            openai_client, "create_chat_completion", side_effect=slow_completion
+        ),
+    ):
+        yield
+    limiter.enabled = True
+
+
+def test_concurrent_turns_are_rebased_without_losing_any(backend):
+    # In the worst case the last writer loses TURNS - 1 races
+    with patch("chat.api.MAX_REBASE_ATTEMPTS", TURNS):
+        responses = asyncio.run(send_turns("stress-session"))
+
+    assert [r.status_code for r in responses] == [200] * TURNS
+    conversation = backend.get_conversation("stress-session")
+    assert conversation.version == TURNS
+    user_messages = [m.content for m in conversation.messages if m.role == "user"]
+    assert sorted(user_messages) == sorted(f"Turn {i}" for i in range(TURNS))
+    # Every user message is directly followed by its own reply
+    messages = conversation.messages
+    for user, assistant in zip(messages[::2], messages[1::2]):
+        assert assistant.content == f"Reply to: {user.content}"
+
+
+def test_concurrent_turns_are_rejected_with_409(backend):
+    with patch("chat.api.CONFLICT_POLICY", "reject"):
+        responses = asyncio.run(send_turns("stress-session"))
+
+    accepted = [r for r in responses if r.status_code == 200]
+    assert {r.status_code for r in responses} <= {200, 409}
+    assert 409 in {r.status_code for r in responses}
+    # Every accepted turn is stored
+    conversation = backend.get_conversation("stress-session")
+    assert len(conversation.messages) == 2 * len(accepted)
+
+
+def test_rebased_turn_keeps_the_stored_history_summary(backend):
+    turn = [
+        Message(role=MessageRole.USER, content="Hi"),
+        Message(role=MessageRole.ASSISTANT, content="Hello"),
+    ]
+    conversation = backend.get_or_create_conversation("rebase-session")
+    conversation.messages.extend(turn)
+    backend.update_conversation("rebase-session", conversation)
+
+    stale = backend.get_conversation("rebase-session")
+    winner = backend.get_conversation("rebase-session")
+    winner.messages.extend(turn)
+    winner.history_summary = ConversationSummary(text="Winner", message_count=2)
+    backend.update_conversation("rebase-session", winner)
+    # Folded by build_context from the history the concurrent turn missed
+    stale.history_summary = ConversationSummary(text="Stale", message_count=2)
+
+    response = OpenAIResponse(reply="Reply", collected_data=CollectedData())
+    asyncio.run(save_turn(services, "rebase-session", stale, "Again", response))
+
+    stored = backend.get_conversation("rebase-session")
+    assert stored.history_summary.text == "Winner"
+    assert [m.content for m in stored.messages] == [
+        "Hi",
+        "Hello",
+        "Hi",
+        "Hello",
+        "Again",
+        "Reply",
+    ]
+
+
+def test_session_locks_serialize_turns(backend):
+    with patch("chat.api.SESSION_LOCKS", True):
+        responses = asyncio.run(send_turns("stress-session"))
+
+    assert [r.status_code for r in responses] == [200] * TURNS
+    conversation = backend.get_conversation("stress-session")
+    # Serialized turns each see the full history: the LLM got every earlier turn
+    assert len(conversation.messages) == 2 * TURNS
+
+
+def test_summary_does_not_conflict_with_a_turn(backend):
+    async def completion(messages, **kwargs):
+        if messages[0] == CHAT_SUMMARY_SYSTEM_MESSAGE:
+            return "Summary"
+        return await slow_completion(messages)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            chat = {"user_message": "Hi", "transaction_id": "summary-session"}
+            await client.post("/chat", json=chat)
+            before = backend.get_conversation("summary-session")
+            turn = asyncio.create_task(client.post("/chat", json=chat))
+            # Summarize while the turn waits for its completion
+            await asyncio.sleep(0.01)
+            await client.post(
+                "/chat/summary", json={"transaction_id": "summary-session"}
+            )
+            summarized = backend.get_conversation("summary-session")
+            return before, summarized, await turn
+
+    conflicts = conversation_conflicts.get()
+    with patch.object(openai_client, "create_chat_completion", side_effect=completion):
+        before, summarized, turn = asyncio.run(scenario())
+
+    assert summarized.summary.text == "Summary"
+    assert summarized.version == before.version
+    assert summarized.updated_at == before.updated_at
+    assert turn.status_code == 200
+    assert conversation_conflicts.get() == conflicts
+    assert backend.get_conversation("summary-session").version == 2
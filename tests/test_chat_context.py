@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, Mock, patch
+
+from chat.context import (build_context, context_folds, folded_tokens,
+                          message_tokens, window_start)
+from chat.prompts import (CHAT_SYSTEM_MESSAGE, CONTEXT_SUMMARY_SYSTEM_MESSAGE,
+                          collected_data_message, history_summary_message,
+                          previous_summary_message)
+from chat.utils import parse_message
+from storage.models import (CollectedData, Conversation, ConversationSummary,
+                            Message, MessageRole)
+
+
+def make_conversation(turns: int) -> Conversation:
+    messages = []
+    for index in range(turns):
+        messages += [
+            Message(role=MessageRole.USER, content=f"User message {index} " * 5),
+            Message(role=MessageRole.ASSISTANT, content=f"Reply {index} " * 5),
+        ]
+    return Conversation(
+        session_id="session",
+        messages=messages,
+        collected_data=CollectedData(order_number=1234),
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc),
+    )
+
+
+USER_MESSAGE = Message(role=MessageRole.USER, content="Any update?")
+
+
+class TestBuildContext:
+    def setup_method(self):
+        self.mock_create_completion = AsyncMock(return_value="Folded summary")
+        self.openai_client = Mock(create_chat_completion=self.mock_create_completion)
+
+    def build_context(self, conversation: Conversation, budget: int) -> list:
+        return asyncio.run(
+            build_context(self.openai_client, conversation, USER_MESSAGE, budget)
+        )
+
+    def test_message_tokens_are_counted_once(self):
+        message = Message(role=MessageRole.USER, content="Hello there")
+
+        first = message_tokens(message)
+
+        assert message.token_count is not None
+        with patch("chat.context.count_tokens") as m_count:
+            assert message_tokens(message) == first
+        m_count.assert_not_called()
+
+    def test_window_starts_at_a_user_message(self):
+        messages = make_conversation(turns=3).messages
+        turn_size = message_tokens(messages[0]) + message_tokens(messages[1])
+
+        assert window_start(messages, turn_size * 2) == 2
+        assert window_start(messages, turn_size * 2 - 1) == 4
+        assert window_start(messages, 0) == 6
+
+    def test_whole_history_within_budget(self):
+        conversation = make_conversation(turns=3)
+
+        messages = self.build_context(conversation, 100_000)
+
+        assert messages == [
+            CHAT_SYSTEM_MESSAGE,
+            *[parse_message(message) for message in conversation.messages],
+            parse_message(USER_MESSAGE),
+        ]
+        self.mock_create_completion.assert_not_called()
+
+    def test_no_budget_sends_everything(self):
+        conversation = make_conversation(turns=50)
+
+        messages = self.build_context(conversation, 0)
+
+        assert len(messages) == 102
+
+    def test_older_turns_are_folded(self):
+        conversation = make_conversation(turns=20)
+        folds, folded = context_folds.value, folded_tokens.value
+
+        messages = self.build_context(conversation, 1000)
+
+        summary = conversation.history_summary
+        assert summary.text == "Folded summary"
+        assert summary.message_count % 2 == 0
+        assert messages[:3] == [
+            CHAT_SYSTEM_MESSAGE,
+            history_summary_message("Folded summary"),
+            collected_data_message(conversation.collected_data.model_dump_json()),
+        ]
+        assert messages[3:] == [
+            parse_message(message)
+            for message in conversation.messages[summary.message_count :]
+        ] + [parse_message(USER_MESSAGE)]
+        fold_messages = self.mock_create_completion.call_args.kwargs["messages"]
+        assert fold_messages[0] == CONTEXT_SUMMARY_SYSTEM_MESSAGE
+        assert len(fold_messages) == 1 + summary.message_count
+        assert context_folds.value == folds + 1
+        assert folded_tokens.value > folded
+
+    def test_fold_is_reused_until_the_budget_is_exceeded_again(self):
+        conversation = make_conversation(turns=20)
+        self.build_context(conversation, 1000)
+        folded_count = conversation.history_summary.message_count
+
+        conversation.messages += make_conversation(turns=1).messages
+        self.build_context(conversation, 1000)
+
+        assert self.mock_create_completion.call_count == 1
+        assert conversation.history_summary.message_count == folded_count
+
+    def test_fold_extends_the_previous_summary(self):
+        conversation = make_conversation(turns=20)
+        conversation.history_summary = ConversationSummary(
+            text="Earlier summary", message_count=4
+        )
+
+        self.build_context(conversation, 1000)
+
+        fold_messages = self.mock_create_completion.call_args.kwargs["messages"]
+        assert fold_messages[1] == previous_summary_message("Earlier summary")
+        assert fold_messages[2] == parse_message(conversation.messages[4])
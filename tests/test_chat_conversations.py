@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from main import create_app
+from storage import InvalidCursorError
+from storage.models import ConversationPage, ConversationRef
+
+app = create_app()
+storage = app.state.services.storage
+limiter = app.state.limiter
+
+
+class TestChatConversationsAPI:
+    def setup_method(self):
+        self.client = TestClient(app)
+        limiter.reset()
+
+        self.query_patcher = patch.object(storage, "query_conversations")
+        self.mock_query = self.query_patcher.start()
+
+    def teardown_method(self):
+        self.query_patcher.stop()
+        self.client.close()
+
+    def test_returns_a_page_of_conversations(self):
+        # Given
+        now = datetime.now(timezone.utc)
+        self.mock_query.return_value = ConversationPage(
+            items=[
+                ConversationRef(
+                    session_id="abc",
+                    order_number=1234,
+                    urgency_level="high",
+                    message_count=4,
+                    created_at=now,
+                    updated_at=now,
+                )
+            ],
+            next_cursor="next",
+        )
+
+        # When
+        response = self.client.get(
+            "/chat/conversations",
+            params={
+                "urgency_level": "high",
+                "updated_after": "2024-01-01T00:00:00Z",
+                "limit": 1,
+            },
+        )
+
+        # Then
+        assert response.status_code == 200
+        body = response.json()
+        assert body["next_cursor"] == "next"
+        [item] = body["conversations"]
+        assert item["transaction_id"] == "abc"
+        assert item["order_number"] == 1234
+        assert item["message_count"] == 4
+        [query] = self.mock_query.call_args.args
+        assert query.urgency_level == "high"
+        assert query.updated_after == datetime(2024, 1, 1, tzinfo=timezone.utc)
+        assert query.limit == 1
+        assert query.order_number is None
+
+    def test_rejects_invalid_cursor(self):
+        self.mock_query.side_effect = InvalidCursorError("Invalid cursor: 'x'")
+
+        response = self.client.get("/chat/conversations", params={"cursor": "x"})
+
+        assert response.status_code == 400
+
+    def test_rejects_oversized_page(self):
+        response = self.client.get("/chat/conversations", params={"limit": 1000})
+
+        assert response.status_code == 422
+        self.mock_query.assert_not_called()
+
+    def test_reports_missing_index(self):
+        self.mock_query.side_effect = NotImplementedError("no conversation index")
+
+        response = self.client.get("/chat/conversations")
+
+        assert response.status_code == 503
@@ -0,0 +1,125 @@
+import json
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from chat import ChatResponse
+from main import create_app
+from storage import CollectedData, Conversation
+
+app = create_app()
+openai_client = app.state.services.openai_client
+storage = app.state.services.storage
+limiter = app.state.limiter
+
+
+def parse_sse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append(
+            (event.removeprefix("event: "), json.loads(data.removeprefix("data: ")))
+        )
+    return events
+
+
+class TestChatStreamAPI:
+    def setup_method(self):
+        self.client = TestClient(app)
+        limiter.reset()
+
+        self.offensive_patcher = patch.object(openai_client, "is_offensive_content")
+        self.stream_patcher = patch.object(openai_client, "stream_chat_completion")
+        self.mock_is_offensive = self.offensive_patcher.start()
+        self.mock_stream_completion = self.stream_patcher.start()
+
+        self.get_or_create_patcher = patch.object(storage, "get_or_create_conversation")
+        self.update_patcher = patch.object(storage, "update_conversation")
+        self.mock_get_or_create = self.get_or_create_patcher.start()
+        self.mock_update = self.update_patcher.start()
+
+    def teardown_method(self):
+        self.offensive_patcher.stop()
+        self.stream_patcher.stop()
+        self.get_or_create_patcher.stop()
+        self.update_patcher.stop()
+        self.client.close()
+
+    def mock_stream(self, *chunks):
+        async def stream(**kwargs):
+            for chunk in chunks:
+                yield chunk
+
+        self.mock_stream_completion.side_effect = stream
+
+    def test_chat_stream_success(self):
+        # Given
+        conversation = Conversation(
+            session_id="test-session-id",
+            collected_data=CollectedData(),
+            created_at=datetime.now(timezone.utc),
+            updated_at=datetime.now(timezone.utc),
+        )
+        self.mock_get_or_create.return_value = conversation
+        self.mock_is_offensive.return_value = False
+        self.mock_stream(
+            "Could you share ",
+            "your order number?<COLLEC",
+            'TED_DATA>{"order_number": null}</COLLECTED_DATA>',
+        )
+
+        expected_response = ChatResponse(
+            transaction_id="test-transaction-id",
+            response="Could you share your order number?",
+            collected_data=CollectedData(),
+        )
+
+        # When
+        response = self.client.post(
+            "/chat/stream",
+            json={
+                "user_message": "My order is broken",
+                "transaction_id": "test-transaction-id",
+            },
+        )
+
+        # Then
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert parse_sse_events(response.text) == [
+            ("token", {"content": "Could you share "}),
+            ("token", {"content": "your order number?"}),
+            ("done", expected_response.model_dump(mode="json")),
+        ]
+        self.mock_update.assert_called_once_with("test-transaction-id", conversation)
+        assert conversation.messages[-1].content == "Could you share your order number?"
+
+    def test_chat_stream_offensive_content(self):
+        self.mock_is_offensive.return_value = True
+        response = self.client.post(
+            "/chat/stream",
+            json={"user_message": "fuck you", "transaction_id": "test-transaction-id"},
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Message contains offensive content."}
+        self.mock_stream_completion.assert_not_called()
+
+    def test_chat_stream_failure(self):
+        self.mock_is_offensive.return_value = False
+
+        async def failing_stream(**kwargs):
+            yield "Partial"
+            raise Exception("Connection reset")
+
+        self.mock_stream_completion.side_effect = failing_stream
+        response = self.client.post(
+            "/chat/stream",
+            json={"user_message": "Hello", "transaction_id": "test-transaction-id"},
+        )
+        assert response.status_code == 200
+        assert parse_sse_events(response.text) == [
+            ("token", {"content": "Partial"}),
+            ("error", {"detail": "Connection reset"}),
+        ]
+        self.mock_update.assert_not_called()
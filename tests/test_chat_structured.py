@@ -0,0 +1,179 @@
+import json
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from chat.prompts import CHAT_STRUCTURED_SYSTEM_MESSAGE
+from chat.structured import (CHAT_RESPONSE_FORMAT, StructuredStreamParser,
+                             parse_structured_response)
+from chat.utils import parse_failures, parse_response
+from main import create_app
+from storage import CollectedData, Conversation
+
+app = create_app()
+openai_client = app.state.services.openai_client
+storage = app.state.services.storage
+limiter = app.state.limiter
+
+COLLECTED_DATA = CollectedData(
+    order_number=1234,
+    problem_category="broken product",
+    problem_description="The blender does not start",
+    urgency_level="high",
+)
+STRUCTURED_REPLY = json.dumps(
+    {
+        "reply": "Thanks, I have everything I need.",
+        "collected_data": COLLECTED_DATA.model_dump(mode="json"),
+    }
+)
+
+
+def test_response_format_is_strict():
+    schema = CHAT_RESPONSE_FORMAT["json_schema"]["schema"]
+    collected_data = schema["$defs"]["CollectedData"]
+
+    assert CHAT_RESPONSE_FORMAT["json_schema"]["strict"] is True
+    assert schema["required"] == ["reply", "collected_data"]
+    assert schema["additionalProperties"] is False
+    assert collected_data["required"] == list(CollectedData.model_fields)
+    assert "default" not in json.dumps(schema)
+    assert "maxLength" not in json.dumps(schema)
+
+
+def test_parse_structured_response():
+    response = parse_structured_response(STRUCTURED_REPLY)
+
+    assert response.reply == "Thanks, I have everything I need."
+    assert response.collected_data == COLLECTED_DATA
+
+
+def test_truncated_response_keeps_complete_fields():
+    failures = parse_failures["structured"].value
+    # Cut off by max_tokens in the middle of the problem description
+    content = STRUCTURED_REPLY[: STRUCTURED_REPLY.index("does not")]
+
+    response = parse_structured_response(content)
+
+    assert response.reply == "Thanks, I have everything I need."
+    assert response.collected_data == CollectedData(
+        order_number=1234, problem_category="broken product"
+    )
+    assert parse_failures["structured"].value == failures
+
+
+def test_truncated_number_is_dropped():
+    response = parse_structured_response(
+        '{"reply": "Thanks", "collected_data": {"order_number": 12'
+    )
+
+    assert response.collected_data == CollectedData()
+
+
+def test_complete_number_is_kept_when_a_later_field_is_cut_off():
+    response = parse_structured_response(
+        '{"reply": "Thanks", "collected_data": {"order_number": 1234, '
+        '"problem_category": "br'
+    )
+
+    assert response.collected_data == CollectedData(order_number=1234)
+
+
+def test_invalid_field_does_not_drop_the_others():
+    response = parse_structured_response(
+        '{"reply": "Thanks", "collected_data": {"order_number": 1234, '
+        '"problem_category": "x", "problem_description": null, "urgency_level": null}}'
+    )
+
+    assert response.collected_data == CollectedData(order_number=1234)
+
+
+def test_plain_text_falls_back_to_the_collected_data_block():
+    failures = parse_failures["structured"].value
+    content = (
+        "Thanks!<COLLECTED_DATA>"
+        + COLLECTED_DATA.model_dump_json()
+        + "</COLLECTED_DATA>"
+    )
+
+    response = parse_structured_response(content)
+
+    assert response.reply == "Thanks!"
+    assert response.collected_data == COLLECTED_DATA
+    assert parse_failures["structured"].value == failures
+
+    parse_structured_response("Thanks!")
+    assert parse_failures["structured"].value == failures + 1
+
+
+def test_regex_failures_are_counted():
+    failures = parse_failures["regex"].value
+
+    parse_response("Thanks!")
+    parse_response("Thanks!<COLLECTED_DATA>{}</COLLECTED_DATA>")
+
+    assert parse_failures["regex"].value == failures + 1
+
+
+def test_stream_parser_releases_the_reply_as_it_grows():
+    parser = StructuredStreamParser()
+    chunks = [STRUCTURED_REPLY[i : i + 7] for i in range(0, len(STRUCTURED_REPLY), 7)]
+
+    released = "".join(parser.feed(chunk) for chunk in chunks) + parser.finish()
+
+    assert released == "Thanks, I have everything I need."
+    assert parser.to_response().collected_data == COLLECTED_DATA
+
+
+def test_stream_parser_releases_plain_text_at_the_end():
+    parser = StructuredStreamParser()
+
+    assert parser.feed("Sorry, ") == ""
+    assert parser.feed("what is your order number?") == ""
+    assert parser.finish() == "Sorry, what is your order number?"
+
+
+class TestStructuredChatAPI:
+    def setup_method(self):
+        self.client = TestClient(app)
+        limiter.reset()
+        self.patchers = [
+            patch("chat.api.STRUCTURED_OUTPUT", True),
+            patch.object(openai_client, "is_offensive_content", return_value=False),
+            patch.object(
+                openai_client, "create_chat_completion",
+                return_value=STRUCTURED_REPLY,
+            ),
+            patch.object(
+                storage, "get_or_create_conversation",
+                return_value=Conversation(
+                    session_id="test-session-id",
+                    created_at=datetime.now(timezone.utc),
+                    updated_at=datetime.now(timezone.utc),
+                ),
+            ),
+            patch.object(storage, "update_conversation"),
+        ]
+        self.mocks = [patcher.start() for patcher in self.patchers]
+        self.mock_create_completion = self.mocks[2]
+
+    def teardown_method(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.client.close()
+
+    def test_chat_requests_and_parses_structured_output(self):
+        response = self.client.post(
+            "/chat",
+            json={"user_message": "My blender", "transaction_id": "test-session-id"},
+        )
+
+        assert response.status_code == 200
+        assert response.json()["response"] == "Thanks, I have everything I need."
+        assert response.json()["collected_data"] == COLLECTED_DATA.model_dump(
+            mode="json"
+        )
+        kwargs = self.mock_create_completion.call_args.kwargs
+        assert kwargs["response_format"] == CHAT_RESPONSE_FORMAT
+        assert kwargs["messages"][0] == CHAT_STRUCTURED_SYSTEM_MESSAGE
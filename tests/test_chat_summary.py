@@ -2,29 +2,57 @@ from datetime import datetime, timezone
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
+from openai.types.chat import \
+    ChatCompletionAssistantMessageParam as OpenAIAssistantMessage
 from openai.types.chat import ChatCompletionUserMessageParam as OpenAIUserMessage
 
 from chat.models import ChatSummaryResponse
-from chat.prompts import CHAT_SUMMARY_SYSTEM_MESSAGE
-from main import app
-from storage.models import CollectedData, Conversation, Message, MessageRole
+from chat.prompts import (CHAT_SUMMARY_SYSTEM_MESSAGE,
+                          CHAT_SUMMARY_UPDATE_SYSTEM_MESSAGE,
+                          previous_summary_message)
+from main import create_app
+from storage.models import (CollectedData, Conversation, ConversationSummary,
+                            Message, MessageRole)
+
+app = create_app()
+openai_client = app.state.services.openai_client
+storage = app.state.services.storage
 
 
 class TestChatSummaryAPI:
     def setup_method(self):
         self.client = TestClient(app)
 
-        self.completion_patcher = patch("config.openai_client.create_chat_completion")
+        self.completion_patcher = patch.object(openai_client, "create_chat_completion")
         self.mock_create_completion = self.completion_patcher.start()
 
-        self.get_conversation_patcher = patch("config.storage.get_conversation")
+        self.get_conversation_patcher = patch.object(storage, "get_conversation")
         self.mock_get_conversation = self.get_conversation_patcher.start()
 
+        self.save_summary_patcher = patch.object(storage, "save_summary")
+        self.mock_save_summary = self.save_summary_patcher.start()
+
     def teardown_method(self):
         self.completion_patcher.stop()
         self.get_conversation_patcher.stop()
+        self.save_summary_patcher.stop()
         self.client.close()
 
+    def conversation(self, turns: int, summary=None) -> Conversation:
+        messages = []
+        for index in range(turns):
+            messages += [
+                Message(role=MessageRole.USER, content=f"User message {index}"),
+                Message(role=MessageRole.ASSISTANT, content=f"Reply {index}"),
+            ]
+        return Conversation(
+            session_id="test-transaction-id",
+            messages=messages,
+            summary=summary,
+            created_at=datetime.now(timezone.utc),
+            updated_at=datetime.now(timezone.utc),
+        )
+
     def test_chat_summary_success(self):
         # Given
         self.mock_create_completion.return_value = "Summary of the conversation"
@@ -76,6 +104,7 @@ class TestChatSummaryAPI:
         assert response.json() == {"detail": "Conversation not found."}
 
     def test_chat_summary_failure(self):
+        self.mock_get_conversation.return_value = self.conversation(turns=1)
         self.mock_create_completion.side_effect = Exception(
             "Failed to create chat completion"
         )
@@ -87,3 +116,54 @@ class TestChatSummaryAPI:
         assert response.json() == {
             "detail": "Failed to generate summary: Failed to create chat completion"
         }
+
+
+    def test_chat_summary_is_stored_with_message_count(self):
+        self.mock_create_completion.return_value = "Summary"
+        self.mock_get_conversation.return_value = self.conversation(turns=2)
+
+        self.client.post(
+            "/chat/summary", json={"transaction_id": "test-transaction-id"}
+        )
+
+        self.mock_save_summary.assert_called_once_with(
+            "test-transaction-id", ConversationSummary(text="Summary", message_count=4)
+        )
+
+    def test_chat_summary_up_to_date_is_reused(self):
+        self.mock_get_conversation.return_value = self.conversation(
+            turns=2, summary=ConversationSummary(text="Stored summary", message_count=4)
+        )
+
+        response = self.client.post(
+            "/chat/summary", json={"transaction_id": "test-transaction-id"}
+        )
+
+        assert response.status_code == 200
+        assert response.json()["summary"] == "Stored summary"
+        self.mock_create_completion.assert_not_called()
+        self.mock_save_summary.assert_not_called()
+
+    def test_chat_summary_only_sends_new_messages(self):
+        self.mock_create_completion.return_value = "Updated summary"
+        self.mock_get_conversation.return_value = self.conversation(
+            turns=3, summary=ConversationSummary(text="Old summary", message_count=4)
+        )
+
+        response = self.client.post(
+            "/chat/summary", json={"transaction_id": "test-transaction-id"}
+        )
+
+        assert response.json()["summary"] == "Updated summary"
+        self.mock_create_completion.assert_called_once_with(
+            messages=[
+                CHAT_SUMMARY_UPDATE_SYSTEM_MESSAGE,
+                previous_summary_message("Old summary"),
+                OpenAIUserMessage(role="user", content="User message 2"),
+                OpenAIAssistantMessage(role="assistant", content="Reply 2"),
+            ]
+        )
+        self.mock_save_summary.assert_called_once_with(
+            "test-transaction-id",
+            ConversationSummary(text="Updated summary", message_count=6),
+        )
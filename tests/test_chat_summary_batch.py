@@ -0,0 +1,131 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from main import create_app
+from storage.models import CollectedData, Conversation, Message, MessageRole
+
+app = create_app()
+openai_client = app.state.services.openai_client
+storage = app.state.services.storage
+limiter = app.state.limiter
+
+
+def conversation(session_id: str) -> Conversation:
+    return Conversation(
+        session_id=session_id,
+        messages=[Message(role=MessageRole.USER, content=f"Help with {session_id}")],
+        collected_data=CollectedData(order_number=1234),
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc),
+    )
+
+
+class TestChatSummaryBatchAPI:
+    def setup_method(self):
+        self.client = TestClient(app)
+        limiter.reset()
+
+        self.completion_patcher = patch.object(openai_client, "create_chat_completion")
+        self.mock_create_completion = self.completion_patcher.start()
+        self.mock_create_completion.return_value = "Summary"
+
+        self.get_conversations_patcher = patch.object(storage, "get_conversations")
+        self.mock_get_conversations = self.get_conversations_patcher.start()
+
+        self.save_summary_patcher = patch.object(storage, "save_summary")
+        self.save_summary_patcher.start()
+
+    def teardown_method(self):
+        self.completion_patcher.stop()
+        self.get_conversations_patcher.stop()
+        self.save_summary_patcher.stop()
+        self.client.close()
+
+    def post_batch(self, transaction_ids: list[str]) -> list[dict]:
+        response = self.client.post(
+            "/chat/summary/batch", json={"transaction_ids": transaction_ids}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    def test_reports_every_item(self):
+        # Given
+        self.mock_get_conversations.return_value = {
+            "a": conversation("a"),
+            "b": conversation("b"),
+        }
+        self.mock_create_completion.side_effect = ["Summary", Exception("upstream")]
+
+        # When
+        items = self.post_batch(["a", "missing", "b", "a"])
+
+        # Then
+        self.mock_get_conversations.assert_called_once_with(["a", "missing", "b"])
+        by_id = {item["transaction_id"]: item for item in items}
+        assert len(items) == 3
+        assert by_id["missing"] == {"transaction_id": "missing", "status": "not_found"}
+        assert {by_id["a"]["status"], by_id["b"]["status"]} == {"ok", "error"}
+        ok = by_id["a"] if by_id["a"]["status"] == "ok" else by_id["b"]
+        assert ok["summary"] == "Summary"
+        assert ok["collected_data"]["order_number"] == 1234
+
+    def test_streams_in_completion_order(self):
+        self.mock_get_conversations.return_value = {
+            "slow": conversation("slow"),
+            "fast": conversation("fast"),
+        }
+
+        async def complete(messages):
+            if "slow" in messages[-1]["content"]:
+                await asyncio.sleep(0.05)
+            return "Summary"
+
+        self.mock_create_completion.side_effect = complete
+
+        items = self.post_batch(["slow", "fast"])
+
+        assert [item["transaction_id"] for item in items] == ["fast", "slow"]
+
+    def test_concurrency_is_capped(self):
+        transaction_ids = [f"t{index}" for index in range(10)]
+        self.mock_get_conversations.return_value = {
+            transaction_id: conversation(transaction_id)
+            for transaction_id in transaction_ids
+        }
+        running = peak = 0
+
+        async def complete(messages):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return "Summary"
+
+        self.mock_create_completion.side_effect = complete
+
+        with patch("chat.api.SUMMARY_BATCH_CONCURRENCY", 3):
+            items = self.post_batch(transaction_ids)
+
+        assert len(items) == 10
+        assert all(item["status"] == "ok" for item in items)
+        assert peak == 3
+
+    def test_storage_failure(self):
+        self.mock_get_conversations.side_effect = OSError("disk")
+
+        response = self.client.post(
+            "/chat/summary/batch", json={"transaction_ids": ["a"]}
+        )
+
+        assert response.status_code == 500
+
+    def test_empty_batch_is_rejected(self):
+        response = self.client.post("/chat/summary/batch", json={"transaction_ids": []})
+
+        assert response.status_code == 422
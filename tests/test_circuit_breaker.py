@@ -0,0 +1,170 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from llm import CircuitBreaker
+from llm.circuit_breaker import CircuitState, circuit_transitions
+from openai_client import AsyncOpenAIClient
+
+
+class FakeStream:
+    """Chunks of a streamed completion, closable like openai's AsyncStream"""
+
+    def __init__(self, contents: list):
+        self.contents = contents
+        self.closed = False
+
+    async def __aiter__(self):
+        for content in self.contents:
+            yield Mock(choices=[Mock(delta=Mock(content=content))])
+
+    async def close(self):
+        self.closed = True
+
+
+class TestCircuitBreaker:
+    def test_opens_at_the_error_rate(self):
+        breaker = CircuitBreaker("test_breaker_opens", window=10, error_rate=0.5)
+        for _ in range(5):
+            breaker.record_success(0.1)
+        for _ in range(4):
+            breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert not breaker.allow()
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = CircuitBreaker(
+            "test_breaker_slow", window=5, error_rate=1, latency_threshold=1
+        )
+        for _ in range(5):
+            breaker.record_success(2)
+
+        assert breaker.state == CircuitState.OPEN
+
+    def test_probe_closes_or_reopens(self):
+        breaker = CircuitBreaker("test_breaker_probe", window=5, reset_timeout=30)
+        for _ in range(5):
+            breaker.record_failure()
+
+        later = time.monotonic() + 31
+        with patch("llm.circuit_breaker.time.monotonic", return_value=later):
+            assert breaker.allow()
+            assert breaker.state == CircuitState.HALF_OPEN
+            # Only one probe per timeout
+            assert not breaker.allow()
+
+            breaker.record_failure()
+            assert breaker.state == CircuitState.OPEN
+
+        with patch("llm.circuit_breaker.time.monotonic", return_value=later + 31):
+            assert breaker.allow()
+            breaker.record_success(0.1)
+            assert breaker.state == CircuitState.CLOSED
+            assert breaker.allow()
+
+        transitions = {
+            state: circuit_transitions.get(name="test_breaker_probe", state=state)
+            for state in ("open", "half_open", "closed")
+        }
+        assert transitions == {"open": 2, "half_open": 2, "closed": 1}
+
+
+class TestClientWithBreaker:
+    def setup_method(self):
+        self.patcher = patch("openai_client.AsyncOpenAI")
+        mock_openai_class = self.patcher.start()
+        self.mock_client = Mock()
+        self.mock_client.chat.completions.create = AsyncMock(
+            side_effect=Exception("Upstream error")
+        )
+        mock_openai_class.return_value = self.mock_client
+        self.breaker = CircuitBreaker("test_client_breaker", window=5)
+
+    def teardown_method(self):
+        self.patcher.stop()
+
+    def trip(self, client: AsyncOpenAIClient) -> None:
+        for _ in range(5):
+            with pytest.raises(HTTPException):
+                asyncio.run(
+                    client.create_chat_completion([{"role": "user", "content": "Hi"}])
+                )
+        assert self.breaker.state == CircuitState.OPEN
+
+    def test_fails_fast_while_open(self):
+        client = AsyncOpenAIClient(circuit_breaker=self.breaker)
+        self.trip(client)
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(
+                client.create_chat_completion([{"role": "user", "content": "Hi"}])
+            )
+        assert exc_info.value.status_code == 503
+        assert self.mock_client.chat.completions.create.await_count == 5
+
+    def test_streams_fail_fast_while_open(self):
+        client = AsyncOpenAIClient(circuit_breaker=self.breaker)
+
+        async def stream():
+            return [
+                chunk
+                async for chunk in client.stream_chat_completion(
+                    [{"role": "user", "content": "Hi"}]
+                )
+            ]
+
+        # Streams that fail to open count against the breaker too
+        for _ in range(5):
+            with pytest.raises(HTTPException):
+                asyncio.run(stream())
+        assert self.breaker.state == CircuitState.OPEN
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(stream())
+        assert exc_info.value.status_code == 503
+        assert self.mock_client.chat.completions.create.await_count == 5
+
+    def test_stream_uses_the_fallback_model_while_open(self):
+        client = AsyncOpenAIClient(
+            circuit_breaker=self.breaker, fallback_model="gpt-fallback"
+        )
+        self.trip(client)
+        self.mock_client.chat.completions.create.side_effect = None
+        self.mock_client.chat.completions.create.return_value = FakeStream(["Hi"])
+
+        async def stream():
+            return [
+                chunk
+                async for chunk in client.stream_chat_completion(
+                    [{"role": "user", "content": "Hi"}]
+                )
+            ]
+
+        assert asyncio.run(stream()) == ["Hi"]
+        kwargs = self.mock_client.chat.completions.create.await_args.kwargs
+        assert kwargs["model"] == "gpt-fallback"
+
+    def test_uses_the_fallback_model_while_open(self):
+        client = AsyncOpenAIClient(
+            circuit_breaker=self.breaker, fallback_model="gpt-fallback"
+        )
+        self.trip(client)
+        self.mock_client.chat.completions.create.side_effect = None
+        self.mock_client.chat.completions.create.return_value = Mock(
+            choices=[Mock(message=Mock(content="Fallback reply"))]
+        )
+
+        result = asyncio.run(
+            client.create_chat_completion([{"role": "user", "content": "Hi"}])
+        )
+
+        assert result == "Fallback reply"
+        kwargs = self.mock_client.chat.completions.create.await_args.kwargs
+        assert kwargs["model"] == "gpt-fallback"
+        assert self.breaker.state == CircuitState.OPEN
@@ -0,0 +1,173 @@
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, Mock, patch
+
+from fastapi.testclient import TestClient
+
+from llm import CompletionCache
+from llm.completion_cache import (completion_cache_key,
+                                  completion_cache_saved_tokens)
+from main import create_app
+from openai_client import AsyncOpenAIClient
+from storage import CollectedData, Conversation
+
+app = create_app()
+openai_client = app.state.services.openai_client
+storage = app.state.services.storage
+limiter = app.state.limiter
+
+SYSTEM = {"role": "system", "content": "You are a support agent."}
+FIRST_TURN = [SYSTEM, {"role": "user", "content": "hi"}]
+SECOND_TURN = [
+    *FIRST_TURN,
+    {"role": "assistant", "content": "Hello!"},
+    {"role": "user", "content": "Where is my order?"},
+]
+
+
+class FakeStream:
+    """Chunks of a streamed completion, closable like openai's AsyncStream"""
+
+    def __init__(self, contents: list):
+        self.contents = contents
+        self.closed = False
+
+    async def __aiter__(self):
+        for content in self.contents:
+            yield Mock(choices=[Mock(delta=Mock(content=content))])
+
+    async def close(self):
+        self.closed = True
+
+
+class TestCompletionCache:
+    def test_key_is_canonical(self):
+        reordered = [{"content": "hi", "role": "user"}]
+        assert completion_cache_key(
+            "gpt-4o-mini", [{"role": "user", "content": "hi"}], temperature=0.2
+        ) == completion_cache_key("gpt-4o-mini", reordered, temperature=0.2)
+        assert completion_cache_key(
+            "gpt-4o-mini", reordered, temperature=0.2
+        ) != completion_cache_key("gpt-4o-mini", reordered, temperature=0.5)
+        assert completion_cache_key("gpt-4o-mini", reordered) != completion_cache_key(
+            "gpt-4o", reordered
+        )
+
+    def test_only_shallow_prompts_are_cacheable(self):
+        assert CompletionCache().cacheable(FIRST_TURN)
+        assert not CompletionCache().cacheable(SECOND_TURN)
+        assert CompletionCache(max_depth=2).cacheable(SECOND_TURN)
+
+    def test_hits_report_savings(self):
+        cache = CompletionCache()
+        saved = completion_cache_saved_tokens.value
+
+        assert cache.get("key") is None
+        cache.set("key", "Hello!", tokens=30, latency=0.5)
+        assert cache.get("key") == "Hello!"
+
+        assert cache.hit_ratio == 0.5
+        assert completion_cache_saved_tokens.value == saved + 30
+
+
+class TestCachedCompletions:
+    def setup_method(self):
+        self.patcher = patch("openai_client.AsyncOpenAI")
+        mock_openai_class = self.patcher.start()
+        self.mock_client = Mock()
+        self.mock_client.chat.completions.create = AsyncMock(
+            return_value=Mock(choices=[Mock(message=Mock(content="Hello!"))])
+        )
+        mock_openai_class.return_value = self.mock_client
+        self.client = AsyncOpenAIClient(completion_cache=CompletionCache())
+
+    def teardown_method(self):
+        self.patcher.stop()
+
+    def test_first_turn_is_completed_once(self):
+        async def scenario():
+            return [
+                await self.client.create_chat_completion(list(FIRST_TURN))
+                for _ in range(3)
+            ]
+
+        assert asyncio.run(scenario()) == ["Hello!"] * 3
+        self.mock_client.chat.completions.create.assert_awaited_once()
+        assert self.client.completion_cache.hits == 2
+
+    def test_deeper_turns_and_bypass_are_not_cached(self):
+        async def scenario():
+            await self.client.create_chat_completion(SECOND_TURN)
+            await self.client.create_chat_completion(SECOND_TURN)
+            await self.client.create_chat_completion(FIRST_TURN, cache=False)
+            await self.client.create_chat_completion(FIRST_TURN, cache=False)
+
+        asyncio.run(scenario())
+        assert self.mock_client.chat.completions.create.await_count == 4
+        assert len(self.client.completion_cache.memory) == 0
+
+    def test_parameters_are_part_of_the_key(self):
+        async def scenario():
+            await self.client.create_chat_completion(FIRST_TURN)
+            await self.client.create_chat_completion(FIRST_TURN, max_tokens=50)
+
+        asyncio.run(scenario())
+        assert self.mock_client.chat.completions.create.await_count == 2
+
+    def test_stream_is_cached_and_replayed(self):
+        self.mock_client.chat.completions.create = AsyncMock(
+            side_effect=lambda **kwargs: FakeStream(["Hel", "lo!"])
+        )
+
+        async def collect():
+            return [
+                chunk async for chunk in self.client.stream_chat_completion(FIRST_TURN)
+            ]
+
+        assert asyncio.run(collect()) == ["Hel", "lo!"]
+        assert asyncio.run(collect()) == ["Hello!"]
+        self.mock_client.chat.completions.create.assert_awaited_once()
+
+
+class TestChatCacheBypass:
+    def setup_method(self):
+        self.client = TestClient(app)
+        limiter.reset()
+        self.offensive_patcher = patch.object(
+            openai_client, "is_offensive_content", return_value=False
+        )
+        self.completion_patcher = patch.object(
+            openai_client, "create_chat_completion", return_value="Hello!"
+        )
+        self.get_or_create_patcher = patch.object(
+            storage, "get_or_create_conversation",
+            return_value=Conversation(
+                session_id="test-session-id",
+                messages=[],
+                collected_data=CollectedData(),
+                created_at=datetime.now(timezone.utc),
+                updated_at=datetime.now(timezone.utc),
+            ),
+        )
+        self.update_patcher = patch.object(storage, "update_conversation")
+        self.offensive_patcher.start()
+        self.mock_create_completion = self.completion_patcher.start()
+        self.get_or_create_patcher.start()
+        self.update_patcher.start()
+
+    def teardown_method(self):
+        self.offensive_patcher.stop()
+        self.completion_patcher.stop()
+        self.get_or_create_patcher.stop()
+        self.update_patcher.stop()
+        self.client.close()
+
+    def test_no_cache_header_bypasses_the_cache(self):
+        response = self.client.post(
+            "/chat",
+            json={"user_message": "hi", "transaction_id": "test-session-id"},
+            headers={"Cache-Control": "no-cache"},
+        )
+
+        assert response.status_code == 200
+        assert self.mock_create_completion.call_args.kwargs["cache"] is False
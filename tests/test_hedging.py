@@ -0,0 +1,119 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from llm import HedgePolicy
+from llm.hedging import hedge_wins, hedges
+from openai_client import AsyncOpenAIClient
+
+
+def delayed(results: list):
+    """Call factory whose n-th call sleeps and returns (or raises) results[n]"""
+    calls = []
+
+    async def call():
+        delay, result = results[len(calls)]
+        calls.append(delay)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return call, calls
+
+
+class TestHedgePolicy:
+    def test_fast_call_is_not_hedged(self):
+        policy = HedgePolicy("test_hedge_fast", min_delay=0.05)
+        call, calls = delayed([(0, "first")])
+
+        assert asyncio.run(policy.run(call)) == "first"
+        assert len(calls) == 1
+
+    def test_slow_call_is_hedged_and_cancelled(self):
+        policy = HedgePolicy("test_hedge_slow", min_delay=0.01)
+        call, calls = delayed([(10, "slow"), (0, "hedge")])
+
+        async def scenario():
+            result = await asyncio.wait_for(policy.run(call), timeout=1)
+            # Only the hedge remains once the slow call is cancelled
+            return result, len(asyncio.all_tasks())
+
+        assert asyncio.run(scenario()) == ("hedge", 1)
+        assert len(calls) == 2
+        assert hedge_wins.get(name="test_hedge_slow") == 1
+
+    def test_failed_hedge_waits_for_the_first_call(self):
+        policy = HedgePolicy("test_hedge_failed", min_delay=0.01)
+        call, _ = delayed([(0.05, "first"), (0, HTTPException(500, "down"))])
+
+        assert asyncio.run(policy.run(call)) == "first"
+
+    def test_both_failures_raise(self):
+        policy = HedgePolicy("test_hedge_both_failed", min_delay=0.01)
+        call, _ = delayed(
+            [(0.05, HTTPException(500, "first")), (0, HTTPException(500, "hedge"))]
+        )
+
+        with pytest.raises(HTTPException):
+            asyncio.run(policy.run(call))
+
+    def test_delay_follows_the_latency_percentile(self):
+        policy = HedgePolicy("test_hedge_delay", percentile=90, min_delay=0.01)
+        assert policy.delay() == 0.01
+
+        for latency in range(1, 101):
+            policy.record(latency / 100)
+        assert policy.delay() == pytest.approx(0.9, abs=0.02)
+
+    def test_budget_caps_the_hedge_rate(self):
+        policy = HedgePolicy("test_hedge_budget", min_delay=0, budget=0.1)
+        policy._tokens = 1
+
+        async def scenario():
+            async def slow():
+                await asyncio.sleep(0.001)
+                return "ok"
+
+            for _ in range(10):
+                await policy.run(slow)
+
+        asyncio.run(scenario())
+        assert hedges.get(name="test_hedge_budget") == 2
+
+
+class TestHedgedClient:
+    def setup_method(self):
+        self.patcher = patch("openai_client.AsyncOpenAI")
+        mock_openai_class = self.patcher.start()
+        self.mock_client = Mock()
+        mock_openai_class.return_value = self.mock_client
+        self.client = AsyncOpenAIClient(
+            hedge_policy=HedgePolicy("test_hedged_client", min_delay=0.01)
+        )
+
+    def teardown_method(self):
+        self.patcher.stop()
+
+    def test_slow_completion_is_hedged(self):
+        delays = iter([10, 0])
+
+        async def create(**kwargs):
+            await asyncio.sleep(next(delays))
+            return Mock(choices=[Mock(message=Mock(content="Hi"))])
+
+        self.mock_client.chat.completions.create = AsyncMock(side_effect=create)
+
+        result = asyncio.run(
+            asyncio.wait_for(
+                self.client.create_chat_completion(
+                    [{"role": "user", "content": "Hello"}]
+                ),
+                timeout=1,
+            )
+        )
+
+        assert result == "Hi"
+        assert self.mock_client.chat.completions.create.await_count == 2
@@ -0,0 +1,100 @@
+import sqlite3
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+
+from storage import (CollectedData, Conversation, ConversationIndex,
+                     ConversationQuery, IndexedStorage, Message, MessageRole,
+                     SimpleStorage, SQLiteStorage, rebuild_index)
+from storage.index import index_errors, run_query
+
+
+def conversation(session_id: str, version: int = 1, **collected_data) -> Conversation:
+    return Conversation(
+        session_id=session_id,
+        version=version,
+        messages=[Message(role=MessageRole.USER, content="My order is late")],
+        collected_data=CollectedData(**collected_data),
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc),
+    )
+
+
+def session_ids(index: ConversationIndex, **filters) -> list[str]:
+    page = index.query(ConversationQuery(**filters))
+    return [item.session_id for item in page.items]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ConversationIndex(str(tmp_path / "index.sqlite3"))
+    yield index
+    index.close()
+
+
+def test_older_versions_never_replace_newer_rows(index):
+    index.update([conversation("session", version=2, urgency_level="high")])
+    index.update([conversation("session", version=1, urgency_level="low")])
+
+    assert session_ids(index, urgency_level="high") == ["session"]
+    assert session_ids(index, urgency_level="low") == []
+
+
+def test_rebuild_indexes_an_existing_store(index, tmp_path):
+    storage = SimpleStorage(db_path=str(tmp_path / "records"))
+    for session_id in ("a", "b"):
+        stored = storage.get_or_create_conversation(session_id)
+        stored.collected_data = CollectedData(order_number=7)
+        storage.update_conversation(session_id, stored)
+    # Row of a conversation that is no longer stored
+    gone = conversation("gone", order_number=7)
+    gone.updated_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    index.update([gone])
+
+    with patch("storage.index.REBUILD_CHUNK", 1):
+        assert rebuild_index(storage, index) == 2
+
+    assert sorted(session_ids(index, order_number=7)) == ["a", "b"]
+
+
+def test_failed_index_update_keeps_the_write(index, tmp_path):
+    storage = IndexedStorage(SimpleStorage(db_path=str(tmp_path / "records")), index)
+    errors = index_errors.value
+    stored = storage.get_or_create_conversation("session")
+
+    with patch.object(index, "update", side_effect=sqlite3.OperationalError("locked")):
+        storage.update_conversation("session", stored)
+
+    assert index_errors.value == errors + 1
+    assert storage.get_conversation("session").version == 1
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {},
+        {"order_number": 1},
+        {"problem_category": "delivery"},
+        {"urgency_level": "high", "updated_after": datetime(2024, 1, 1)},
+    ],
+)
+@pytest.mark.parametrize("backend", ["index", "sqlite"])
+def test_queries_use_an_index_without_sorting(tmp_path, backend, filters):
+    path = str(tmp_path / "db.sqlite3")
+    opened = ConversationIndex(path) if backend == "index" else SQLiteStorage(path)
+    connection = opened._connection()
+    plans = []
+
+    class ExplainingConnection:
+        def execute(self, sql, params):
+            plan = connection.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plans.extend(row[-1] for row in plan)
+            return connection.execute(sql, params)
+
+    run_query(ExplainingConnection(), ConversationQuery(**filters))
+    opened.close()
+
+    assert len(plans) == 1
+    assert "USING INDEX conversations_" in plans[0]
+    assert "TEMP B-TREE" not in plans[0]
@@ -0,0 +1,153 @@
+import os
+import shutil
+
+import pytest
+
+from storage import CollectedData, LogStorage, Message, MessageRole
+
+
+def turn(index: int) -> list[Message]:
+    return [
+        Message(role=MessageRole.USER, content=f"User message {index}"),
+        Message(role=MessageRole.ASSISTANT, content=f"Assistant reply {index}"),
+    ]
+
+
+class TestLogStorage:
+    def setup_method(self):
+        self.db_path = "tests/log_db"
+        self.storage = LogStorage(db_path=self.db_path, compaction_interval=None)
+
+    def teardown_method(self):
+        self.storage.close()
+        shutil.rmtree(self.db_path)
+
+    def segments(self) -> list[str]:
+        return [name for name in os.listdir(self.db_path) if name.endswith(".log")]
+
+    def segment_bytes(self) -> int:
+        return sum(
+            os.path.getsize(os.path.join(self.db_path, name))
+            for name in self.segments()
+        )
+
+    def test_second_writer_fails_fast(self):
+        with pytest.raises(RuntimeError, match="single writer"):
+            LogStorage(db_path=self.db_path, compaction_interval=None)
+
+        # Closing releases the lock
+        self.storage.close()
+        self.storage = LogStorage(db_path=self.db_path, compaction_interval=None)
+
+    def test_get_missing_conversation(self):
+        assert self.storage.get_conversation("missing") is None
+
+    def test_update_and_get_conversation(self):
+        session_id = "feca9559-dbc0-4b4e-a9e2-7de000907035"
+        conversation = self.storage.get_or_create_conversation(session_id)
+        conversation.messages.extend(turn(1))
+        self.storage.update_conversation(session_id, conversation)
+
+        conversation.messages.extend(turn(2))
+        conversation.collected_data = CollectedData(order_number=42)
+        self.storage.update_conversation(session_id, conversation)
+
+        stored = self.storage.get_conversation(session_id)
+        assert stored.messages == turn(1) + turn(2)
+        assert stored.collected_data == CollectedData(order_number=42)
+        assert stored.created_at == conversation.created_at
+        assert stored.updated_at == conversation.updated_at
+
+    def test_update_appends_only_new_messages(self):
+        session_id = "session"
+        conversation = self.storage.get_or_create_conversation(session_id)
+        for index in range(20):
+            conversation.messages.extend(turn(index))
+            self.storage.update_conversation(session_id, conversation)
+        size_before = self.segment_bytes()
+
+        conversation.messages.extend(turn(20))
+        self.storage.update_conversation(session_id, conversation)
+
+        full_size = len(conversation.model_dump_json())
+        assert self.segment_bytes() - size_before < full_size / 10
+
+    def test_rewritten_history_is_snapshotted(self):
+        session_id = "session"
+        conversation = self.storage.get_or_create_conversation(session_id)
+        conversation.messages.extend(turn(1) + turn(2))
+        self.storage.update_conversation(session_id, conversation)
+
+        conversation.messages = turn(3)
+        self.storage.update_conversation(session_id, conversation)
+
+        assert self.storage.get_conversation(session_id).messages == turn(3)
+
+    def test_index_is_rebuilt_from_segments(self):
+        session_id = "session"
+        conversation = self.storage.get_or_create_conversation(session_id)
+        conversation.messages.extend(turn(1))
+        conversation.collected_data = CollectedData(urgency_level="high")
+        self.storage.update_conversation(session_id, conversation)
+        conversation.messages.extend(turn(2))
+        conversation.collected_data = None
+        self.storage.update_conversation(session_id, conversation)
+        self.storage.close()
+
+        self.storage = LogStorage(db_path=self.db_path, compaction_interval=None)
+        stored = self.storage.get_conversation(session_id)
+        assert stored.messages == turn(1) + turn(2)
+        assert stored.collected_data is None
+
+        # Appends continue from the rebuilt index
+        stored.messages.extend(turn(3))
+        self.storage.update_conversation(session_id, stored)
+        assert self.storage.get_conversation(session_id).messages == (
+            turn(1) + turn(2) + turn(3)
+        )
+
+    def test_partial_record_is_truncated_on_startup(self):
+        session_id = "session"
+        conversation = self.storage.get_or_create_conversation(session_id)
+        conversation.messages.extend(turn(1))
+        self.storage.update_conversation(session_id, conversation)
+        self.storage.close()
+        with open(os.path.join(self.db_path, "segment-000001.log"), "ab") as f:
+            f.write(b'{"session_id": "session", "type": "app')
+
+        self.storage = LogStorage(db_path=self.db_path, compaction_interval=None)
+        stored = self.storage.get_conversation(session_id)
+        stored.messages.extend(turn(2))
+        self.storage.update_conversation(session_id, stored)
+
+        assert self.storage.get_conversation(session_id).messages == turn(1) + turn(2)
+
+    def test_compaction_merges_sealed_segments(self):
+        self.storage.close()
+        self.storage = LogStorage(
+            db_path=self.db_path, max_segment_bytes=512, compaction_interval=None
+        )
+        conversations = {}
+        for session_id in ["a", "b", "c"]:
+            conversations[session_id] = self.storage.get_or_create_conversation(
+                session_id
+            )
+        for index in range(10):
+            for session_id, conversation in conversations.items():
+                conversation.messages.extend(turn(index))
+                self.storage.update_conversation(session_id, conversation)
+        segments_before = len(self.segments())
+        assert segments_before > 2
+
+        self.storage.compact()
+
+        assert len(self.segments()) == 2
+        for session_id in conversations:
+            assert self.storage.get_conversation(session_id).messages == [
+                message for index in range(10) for message in turn(index)
+            ]
+
+        # Still readable after a restart
+        self.storage.close()
+        self.storage = LogStorage(db_path=self.db_path, compaction_interval=None)
+        assert len(self.storage.get_conversation("a").messages) == 20
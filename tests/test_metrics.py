@@ -0,0 +1,145 @@
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, Mock, patch
+
+from fastapi.testclient import TestClient
+from openai.types import CompletionUsage
+
+from chat.api import stage_errors, stage_seconds
+from main import create_app
+from metrics import Counter, Gauge, Histogram
+from openai_client import AsyncOpenAIClient, prompt_tokens, request_seconds
+from storage import CollectedData, Conversation
+
+app = create_app()
+openai_client = app.state.services.openai_client
+storage = app.state.services.storage
+limiter = app.state.limiter
+
+
+class TestMetrics:
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("test_seconds", "Test", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 5.0):
+            histogram.observe(value, stage="a")
+
+        rendered = histogram.render()
+        assert 'test_seconds_bucket{stage="a",le="0.1"} 1\n' in rendered
+        assert 'test_seconds_bucket{stage="a",le="1"} 3\n' in rendered
+        assert 'test_seconds_bucket{stage="a",le="+Inf"} 4\n' in rendered
+        assert 'test_seconds_count{stage="a"} 4\n' in rendered
+        assert histogram.count(stage="a") == 4
+        assert histogram.sum(stage="a") == 6.25
+
+    def test_histogram_times_failing_blocks(self):
+        histogram = Histogram("test_seconds", "Test")
+        try:
+            with histogram.time(stage="b"):
+                raise ValueError
+        except ValueError:
+            pass
+        assert histogram.count(stage="b") == 1
+
+    def test_counter_labels(self):
+        counter = Counter("test_total", "Test")
+        assert counter.render().endswith("test_total 0\n")
+
+        counter.inc(2, stage='say "hi"')
+        assert counter.get(stage='say "hi"') == 2
+        assert counter.render().endswith('test_total{stage="say \\"hi\\""} 2\n')
+
+    def test_gauge_labels(self):
+        gauge = Gauge("test_gauge", "Test")
+        assert gauge.render().endswith("test_gauge 0\n")
+
+        gauge.set(3, name="a")
+        gauge.set_function(lambda: 5, name="b")
+        assert gauge.get(name="b") == 5
+        rendered = gauge.render()
+        assert 'test_gauge{name="a"} 3\n' in rendered
+        assert 'test_gauge{name="b"} 5\n' in rendered
+        assert "test_gauge 0" not in rendered
+
+
+class TestClientMetrics:
+    def setup_method(self):
+        self.patcher = patch("openai_client.AsyncOpenAI")
+        mock_openai_class = self.patcher.start()
+        self.mock_client = Mock()
+        self.mock_client.chat.completions.create = AsyncMock(
+            return_value=Mock(
+                choices=[Mock(message=Mock(content="Hello!"))],
+                usage=CompletionUsage(
+                    prompt_tokens=12, completion_tokens=3, total_tokens=15
+                ),
+            )
+        )
+        mock_openai_class.return_value = self.mock_client
+        self.client = AsyncOpenAIClient()
+
+    def teardown_method(self):
+        self.patcher.stop()
+
+    def test_completion_is_timed_and_usage_counted(self):
+        timed = request_seconds.count(operation="completion")
+        tokens = prompt_tokens.get(model="gpt-4o-mini")
+
+        asyncio.run(
+            self.client.create_chat_completion([{"role": "user", "content": "Hi"}])
+        )
+
+        assert request_seconds.count(operation="completion") == timed + 1
+        assert prompt_tokens.get(model="gpt-4o-mini") == tokens + 12
+
+
+class TestChatStageMetrics:
+    def setup_method(self):
+        self.client = TestClient(app)
+        limiter.reset()
+        self.patchers = [
+            patch.object(openai_client, "is_offensive_content", return_value=False),
+            patch.object(openai_client, "create_chat_completion", return_value="Hi!"),
+            patch.object(
+                storage, "get_or_create_conversation",
+                return_value=Conversation(
+                    session_id="test-session-id",
+                    messages=[],
+                    collected_data=CollectedData(),
+                    created_at=datetime.now(timezone.utc),
+                    updated_at=datetime.now(timezone.utc),
+                ),
+            ),
+            patch.object(storage, "update_conversation"),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def teardown_method(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.client.close()
+
+    def post_chat(self):
+        return self.client.post(
+            "/chat", json={"user_message": "Hi", "transaction_id": "test-session-id"}
+        )
+
+    def test_every_stage_is_timed(self):
+        stages = ("moderation", "load", "context", "completion", "parse", "store")
+        before = {
+            name: stage_seconds.count(endpoint="/chat", stage=name) for name in stages
+        }
+
+        assert self.post_chat().status_code == 200
+
+        for name in stages:
+            count = stage_seconds.count(endpoint="/chat", stage=name)
+            assert count == before[name] + 1
+        series = 'chat_stage_seconds_bucket{endpoint="/chat",stage="store",le='
+        assert series in self.client.get("/metrics").text
+
+    def test_failures_are_counted_by_stage(self):
+        errors = stage_errors.get(endpoint="/chat", stage="store")
+        with patch.object(storage, "update_conversation", side_effect=OSError("disk")):
+            assert self.post_chat().status_code == 500
+        assert stage_errors.get(endpoint="/chat", stage="store") == errors + 1
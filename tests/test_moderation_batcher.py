@@ -0,0 +1,147 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+from fastapi import HTTPException
+from openai import RateLimitError as OpenAIRateLimitError
+
+from llm import ModerationBatcher
+from openai_client import AsyncOpenAIClient
+
+
+def flag_offensive(calls: list):
+    async def moderate(texts):
+        calls.append(list(texts))
+        await asyncio.sleep(0)
+        return ["offensive" in text for text in texts]
+
+    return moderate
+
+
+class TestModerationBatcher:
+    def test_concurrent_requests_share_one_call(self):
+        calls = []
+        batcher = ModerationBatcher(flag_offensive(calls), window=0.01)
+
+        async def scenario():
+            return await asyncio.gather(
+                batcher.is_flagged("hi"),
+                batcher.is_flagged("offensive"),
+                batcher.is_flagged("order 123"),
+            )
+
+        assert asyncio.run(scenario()) == [False, True, False]
+        assert calls == [["hi", "offensive", "order 123"]]
+
+    def test_identical_texts_are_sent_once(self):
+        calls = []
+        batcher = ModerationBatcher(flag_offensive(calls), window=0.01)
+
+        async def scenario():
+            return await asyncio.gather(*(batcher.is_flagged("hi") for _ in range(3)))
+
+        assert asyncio.run(scenario()) == [False, False, False]
+        assert calls == [["hi"]]
+
+    def test_full_batch_is_sent_before_the_window(self):
+        calls = []
+        batcher = ModerationBatcher(flag_offensive(calls), window=60, max_batch_size=2)
+
+        async def scenario():
+            return await asyncio.wait_for(
+                asyncio.gather(*(batcher.is_flagged(f"text {i}") for i in range(4))),
+                timeout=1,
+            )
+
+        assert asyncio.run(scenario()) == [False] * 4
+        assert calls == [["text 0", "text 1"], ["text 2", "text 3"]]
+
+    def test_failure_reaches_every_waiter(self):
+        moderate = AsyncMock(side_effect=HTTPException(500, "Upstream down"))
+        batcher = ModerationBatcher(moderate, window=0.01)
+
+        async def scenario():
+            return await asyncio.gather(
+                batcher.is_flagged("a"), batcher.is_flagged("b"), return_exceptions=True
+            )
+
+        results = asyncio.run(scenario())
+        assert all(isinstance(result, HTTPException) for result in results)
+        moderate.assert_awaited_once()
+
+    def test_missing_verdicts_fail_every_waiter(self):
+        moderate = AsyncMock(return_value=[False])
+        batcher = ModerationBatcher(moderate, window=0.01)
+
+        async def scenario():
+            return await asyncio.wait_for(
+                asyncio.gather(
+                    batcher.is_flagged("a"),
+                    batcher.is_flagged("b"),
+                    return_exceptions=True,
+                ),
+                timeout=1,
+            )
+
+        results = asyncio.run(scenario())
+        assert all(isinstance(result, ValueError) for result in results)
+
+    def test_cancelled_waiter_does_not_break_the_batch(self):
+        calls = []
+        batcher = ModerationBatcher(flag_offensive(calls), window=0.01)
+
+        async def scenario():
+            cancelled = asyncio.create_task(batcher.is_flagged("a"))
+            kept = asyncio.create_task(batcher.is_flagged("offensive"))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            return await kept
+
+        assert asyncio.run(scenario()) is True
+
+
+class TestBatchedModeration:
+    def setup_method(self):
+        self.patcher = patch("openai_client.AsyncOpenAI")
+        mock_openai_class = self.patcher.start()
+        self.mock_client = Mock()
+        self.mock_client.moderations.create = AsyncMock(
+            side_effect=lambda input: Mock(
+                results=[Mock(flagged="offensive" in text) for text in input]
+            )
+        )
+        mock_openai_class.return_value = self.mock_client
+        self.client = AsyncOpenAIClient(moderation_batch_window=0.01)
+
+    def teardown_method(self):
+        self.patcher.stop()
+
+    def test_concurrent_checks_use_one_list_input_call(self):
+        async def scenario():
+            return await asyncio.gather(
+                self.client.is_offensive_content("hello"),
+                self.client.is_offensive_content("offensive"),
+            )
+
+        assert asyncio.run(scenario()) == [False, True]
+        self.mock_client.moderations.create.assert_awaited_once_with(
+            input=["hello", "offensive"]
+        )
+
+    @patch("openai_client.random.uniform", return_value=1.0)
+    @patch("openai_client.asyncio.sleep", new_callable=AsyncMock)
+    def test_rate_limits_are_retried_for_the_whole_batch(self, m_sleep, m_uniform):
+        results = self.mock_client.moderations.create.side_effect
+        self.mock_client.moderations.create.side_effect = [
+            OpenAIRateLimitError("Rate limit", response=Mock(), body=Mock()),
+            results(["a", "b"]),
+        ]
+
+        async def scenario():
+            return await asyncio.gather(
+                self.client.is_offensive_content("a"),
+                self.client.is_offensive_content("b"),
+            )
+
+        assert asyncio.run(scenario()) == [False, False]
+        assert self.mock_client.moderations.create.await_count == 2
+        m_sleep.assert_awaited_once_with(self.client.base_delay)
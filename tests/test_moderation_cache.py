@@ -0,0 +1,123 @@
+import asyncio
+import shutil
+import time
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from llm import LRUCache, ModerationCache
+from llm.moderation_cache import moderation_cache_hits, moderation_cache_key
+from openai_client import AsyncOpenAIClient
+
+
+class TestLRUCache:
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+        assert cache.evictions == 1
+
+    def test_entries_expire(self):
+        cache = LRUCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+
+        with patch("llm.cache.time.monotonic", return_value=time.monotonic() + 61):
+            assert cache.get("a") is None
+        assert len(cache) == 0
+
+
+class TestModerationCache:
+    def setup_method(self):
+        self.disk_path = "tests/moderation_cache_db/verdicts.sqlite3"
+
+    def teardown_method(self):
+        shutil.rmtree("tests/moderation_cache_db", ignore_errors=True)
+
+    def test_key_is_normalized(self):
+        assert moderation_cache_key("Thanks") == moderation_cache_key("  thanks ")
+        assert moderation_cache_key("THANKS\n") == moderation_cache_key("thanks")
+        assert moderation_cache_key("hi  there") == moderation_cache_key("hi there")
+        assert moderation_cache_key("thanks") != moderation_cache_key("thank you")
+
+    def test_caches_both_verdicts(self):
+        cache = ModerationCache()
+        hits = moderation_cache_hits.value
+
+        async def scenario():
+            assert await cache.get("hi") is None
+            await cache.set("hi", False)
+            await cache.set("offensive", True)
+            return await cache.get("Hi "), await cache.get("offensive")
+
+        assert asyncio.run(scenario()) == (False, True)
+        assert cache.hits == 2
+        assert cache.misses == 1
+        assert cache.hit_ratio == 2 / 3
+        assert moderation_cache_hits.value == hits + 2
+
+    def test_disk_tier_survives_restart(self):
+        asyncio.run(ModerationCache(disk_path=self.disk_path).set("yes", False))
+
+        cache = ModerationCache(disk_path=self.disk_path)
+        assert asyncio.run(cache.get("yes")) is False
+        assert len(cache.memory) == 1
+
+    def test_disk_entries_expire(self):
+        asyncio.run(ModerationCache(ttl=60, disk_path=self.disk_path).set("yes", False))
+
+        cache = ModerationCache(disk_path=self.disk_path)
+        with patch("llm.moderation_cache.time.time", return_value=time.time() + 61):
+            assert asyncio.run(cache.get("yes")) is None
+
+    def test_disk_errors_degrade_to_a_miss(self):
+        cache = ModerationCache(disk_path=self.disk_path)
+        cache.disk._connection().execute("DROP TABLE verdicts")
+
+        async def scenario():
+            await cache.set("yes", False)
+            cache.memory = LRUCache(max_entries=10, ttl=60)
+            return await cache.get("yes")
+
+        assert asyncio.run(scenario()) is None
+
+
+class TestCachedModeration:
+    def setup_method(self):
+        self.patcher = patch("openai_client.AsyncOpenAI")
+        mock_openai_class = self.patcher.start()
+        self.mock_client = Mock()
+        self.mock_client.moderations.create = AsyncMock(
+            return_value=Mock(results=[Mock(flagged=False)])
+        )
+        mock_openai_class.return_value = self.mock_client
+        self.client = AsyncOpenAIClient(moderation_cache=ModerationCache())
+
+    def teardown_method(self):
+        self.patcher.stop()
+
+    def test_repeated_message_is_moderated_once(self):
+        async def scenario():
+            return [
+                await self.client.is_offensive_content(text)
+                for text in ["thanks", "Thanks", "thanks "]
+            ]
+
+        assert asyncio.run(scenario()) == [False, False, False]
+        self.mock_client.moderations.create.assert_awaited_once_with(input="thanks")
+
+    def test_failures_are_not_cached(self):
+        self.mock_client.moderations.create.side_effect = [
+            Exception("Connection error"),
+            Mock(results=[Mock(flagged=True)]),
+        ]
+
+        with pytest.raises(HTTPException):
+            asyncio.run(self.client.is_offensive_content("text"))
+        assert asyncio.run(self.client.is_offensive_content("text")) is True
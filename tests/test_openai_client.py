@@ -1,10 +1,26 @@
-from unittest.mock import Mock, patch
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
 from fastapi import HTTPException
 from openai import RateLimitError as OpenAIRateLimitError
 
-from openai_client import OpenAIClient
+from openai_client import AsyncOpenAIClient, OpenAIClient
+
+
+class FakeStream:
+    """Chunks of a streamed completion, closable like openai's AsyncStream"""
+
+    def __init__(self, contents: list):
+        self.contents = contents
+        self.closed = False
+
+    async def __aiter__(self):
+        for content in self.contents:
+            yield Mock(choices=[Mock(delta=Mock(content=content))])
+
+    async def close(self):
+        self.closed = True
 
 
 class TestOpenAIClient:
@@ -83,3 +99,94 @@ class TestOpenAIClient:
                 [{"role": "user", "content": "Hello"}],
             )
         assert exc_info.value.status_code == 429
+
+
+class TestAsyncOpenAIClient:
+    def setup_method(self):
+        self.patcher = patch("openai_client.AsyncOpenAI")
+        self.mock_openai_class = self.patcher.start()
+        self.mock_client = Mock()
+        self.mock_client.moderations.create = AsyncMock()
+        self.mock_client.chat.completions.create = AsyncMock()
+        self.mock_openai_class.return_value = self.mock_client
+        self.client = AsyncOpenAIClient()
+
+    def teardown_method(self):
+        self.patcher.stop()
+
+    ### Moderation API tests ###
+    def test_is_offensive_content_success(self):
+        mock_moderation = Mock()
+        mock_moderation.results = [Mock(flagged=True)]
+        self.mock_client.moderations.create.return_value = mock_moderation
+
+        result = asyncio.run(self.client.is_offensive_content("test text"))
+
+        assert result is True
+        self.mock_client.moderations.create.assert_awaited_once_with(input="test text")
+
+    @patch("openai_client.asyncio.sleep", new_callable=AsyncMock)
+    def test_is_offensive_content_rate_limit_error(self, m_sleep):
+        self.mock_client.moderations.create.side_effect = OpenAIRateLimitError(
+            "Rate limit", response=Mock(), body=Mock()
+        )
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(self.client.is_offensive_content("test text"))
+        assert exc_info.value.status_code == 429
+        assert m_sleep.await_count == self.client.max_retries
+
+    ### Chat completion API tests ###
+    def test_create_chat_completion_success(self):
+        mock_response = Mock()
+        mock_response.choices = [Mock(message=Mock(content="Test response"))]
+        self.mock_client.chat.completions.create.return_value = mock_response
+
+        messages = [{"role": "user", "content": "Hello"}]
+        result = asyncio.run(self.client.create_chat_completion(messages))
+
+        assert result == "Test response"
+
+    def test_create_chat_completion_failure(self):
+        self.mock_client.chat.completions.create.side_effect = Exception(
+            "Failed to create chat completion"
+        )
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(
+                self.client.create_chat_completion(
+                    [{"role": "user", "content": "Hello"}],
+                )
+            )
+        assert exc_info.value.status_code == 500
+
+    def test_stream_chat_completion_success(self):
+        stream = FakeStream(["Hel", None, "lo"])
+        self.mock_client.chat.completions.create.return_value = stream
+
+        async def collect():
+            return [
+                chunk
+                async for chunk in self.client.stream_chat_completion(
+                    [{"role": "user", "content": "Hello"}]
+                )
+            ]
+
+        assert asyncio.run(collect()) == ["Hel", "lo"]
+        assert self.mock_client.chat.completions.create.await_args.kwargs["stream"]
+        assert stream.closed
+
+    def test_stream_is_closed_when_the_caller_stops_reading(self):
+        stream = FakeStream(["Hel", "lo"])
+        self.mock_client.chat.completions.create.return_value = stream
+
+        async def first_chunk():
+            chunks = self.client.stream_chat_completion(
+                [{"role": "user", "content": "Hello"}]
+            )
+            chunk = await anext(chunks)
+            await chunks.aclose()
+            return chunk
+
+        assert asyncio.run(first_chunk()) == "Hel"
+        assert stream.closed
@@ -0,0 +1,223 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from openai import RateLimitError as OpenAIRateLimitError
+
+from llm import RateLimiter
+from llm.rate_limiter import TokenBucket, parse_duration, parse_retry_after
+from openai_client import AsyncOpenAIClient
+
+
+def rate_limit_error(headers: dict) -> OpenAIRateLimitError:
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return OpenAIRateLimitError("Rate limit", response=response, body=None)
+
+
+class TestHeaderParsing:
+    def test_parse_duration(self):
+        assert parse_duration("20ms") == pytest.approx(0.02)
+        assert parse_duration("1s") == 1
+        assert parse_duration("6m0s") == 360
+        assert parse_duration("1h2m3.5s") == pytest.approx(3723.5)
+        assert parse_duration("soon") is None
+        assert parse_duration(None) is None
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+        assert parse_retry_after({"retry-after": "2"}) == 2
+        assert parse_retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+        assert parse_retry_after({}) is None
+        assert parse_retry_after(None) is None
+
+
+class TestTokenBucket:
+    def test_unlimited_without_budget(self):
+        bucket = TokenBucket()
+        assert bucket.delay(10_000, now=0) == 0
+
+    def test_waits_for_refill(self):
+        bucket = TokenBucket(per_minute=60)
+        now = bucket._updated
+        bucket.take(60)
+
+        assert bucket.delay(1, now) == pytest.approx(1)
+        assert bucket.delay(1, now + 1) == pytest.approx(0)
+
+    def test_headers_lower_the_level(self):
+        bucket = TokenBucket()
+        bucket.sync(limit=600, remaining=0, reset=2)
+
+        assert bucket.capacity == 600
+        assert bucket.delay(1, bucket._updated) == pytest.approx(2.1)
+
+
+class TestRateLimiter:
+    def test_aimd(self):
+        limiter = RateLimiter("test_aimd", max_concurrency=8, initial_concurrency=4)
+
+        limiter.record_throttle()
+        assert limiter.concurrency_limit == 2
+        limiter.record_success()
+        assert limiter.concurrency_limit == 2.5
+
+        for _ in range(100):
+            limiter.record_success()
+        assert limiter.concurrency_limit == 8
+
+    def test_callers_queue_beyond_the_concurrency_limit(self):
+        limiter = RateLimiter("test_queue", max_concurrency=2)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with limiter.slot():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            await asyncio.gather(*(call() for _ in range(6)))
+
+        asyncio.run(scenario())
+        assert peak == 2
+        assert limiter.in_flight == 0
+        assert limiter.queued == 0
+
+    def test_cancelled_waiter_passes_its_wakeup_on(self):
+        limiter = RateLimiter("test_cancel", max_concurrency=1)
+
+        async def scenario():
+            await limiter.acquire()
+            woken = asyncio.create_task(limiter.acquire())
+            next_waiter = asyncio.create_task(limiter.acquire())
+            await asyncio.sleep(0)
+
+            limiter.release()
+            woken.cancel()
+            await asyncio.wait_for(next_waiter, 1)
+
+        asyncio.run(scenario())
+        assert limiter.in_flight == 1
+        assert limiter.queued == 0
+
+    def test_retry_after_pauses_every_caller(self):
+        limiter = RateLimiter("test_pause")
+
+        async def scenario():
+            limiter.record_throttle(retry_after=0.05)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            async with limiter.slot():
+                return loop.time() - start
+
+        assert asyncio.run(scenario()) >= 0.04
+
+    def test_state_is_exposed_as_metrics(self):
+        import metrics
+
+        RateLimiter("test_metrics", max_concurrency=5)
+        RateLimiter("test_small", max_concurrency=3)
+
+        rendered = metrics.render()
+        assert 'openai_limiter_concurrency_limit{name="test_metrics"} 5' in rendered
+        assert 'openai_limiter_concurrency_limit{name="test_small"} 3' in rendered
+        assert 'openai_limiter_in_flight{name="test_metrics"} 0' in rendered
+
+
+class TestLimitedClient:
+    def setup_method(self):
+        self.patcher = patch("openai_client.AsyncOpenAI")
+        mock_openai_class = self.patcher.start()
+        self.mock_client = Mock()
+        self.mock_client.chat.completions.create = AsyncMock()
+        mock_openai_class.return_value = self.mock_client
+        self.limiter = RateLimiter("test_client", max_concurrency=16)
+        self.client = AsyncOpenAIClient(completion_limiter=self.limiter)
+
+    def teardown_method(self):
+        self.patcher.stop()
+
+    def test_retry_delay_honours_retry_after(self):
+        error = rate_limit_error({"retry-after-ms": "1500"})
+        assert 1.5 <= self.client._get_retry_delay(0, error) <= 1.65
+
+        delay = self.client._get_retry_delay(2, rate_limit_error({}))
+        assert 2 * self.client.base_delay <= delay <= 4 * self.client.base_delay
+
+    def test_throttle_shrinks_the_limit_and_pauses(self):
+        self.mock_client.chat.completions.create.side_effect = [
+            rate_limit_error({"retry-after-ms": "50"}),
+            Mock(choices=[Mock(message=Mock(content="Hi"))]),
+        ]
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            result = await self.client.create_chat_completion(
+                [{"role": "user", "content": "Hello"}]
+            )
+            return result, loop.time() - start
+
+        result, elapsed = asyncio.run(scenario())
+
+        assert result == "Hi"
+        assert elapsed >= 0.05
+        assert self.limiter.concurrency_limit < 16
+
+    @patch("openai_client.asyncio.sleep", new_callable=AsyncMock)
+    def test_gives_up_after_max_retries(self, m_sleep):
+        self.mock_client.chat.completions.create.side_effect = rate_limit_error({})
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(
+                self.client.create_chat_completion(
+                    [{"role": "user", "content": "Hello"}]
+                )
+            )
+        assert exc_info.value.status_code == 429
+        assert self.limiter.in_flight == 0
+
+    def test_goodput_under_injected_throttling(self):
+        # Fake upstream that throttles every call beyond 4 concurrent ones
+        capacity = 4
+        in_flight = 0
+        throttled = 0
+
+        async def upstream(**kwargs):
+            nonlocal in_flight, throttled
+            if in_flight >= capacity:
+                throttled += 1
+                raise rate_limit_error({"retry-after-ms": "10"})
+            in_flight += 1
+            try:
+                await asyncio.sleep(0.005)
+            finally:
+                in_flight -= 1
+            return Mock(choices=[Mock(message=Mock(content="ok"))])
+
+        self.mock_client.chat.completions.create.side_effect = upstream
+        self.client.max_retries = 10
+        self.client.base_delay = 0.01
+        self.limiter.backoff_interval = 0.01
+
+        async def scenario():
+            return await asyncio.gather(
+                *(
+                    self.client.create_chat_completion(
+                        [{"role": "user", "content": f"Hello {i}"}]
+                    )
+                    for i in range(50)
+                ),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(scenario())
+
+        # Every call succeeds, and the limiter converges instead of letting
+        # each caller retry against the upstream on its own
+        assert results == ["ok"] * 50
+        assert throttled < 50
+        assert self.limiter.concurrency_limit <= 2 * capacity
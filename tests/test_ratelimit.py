@@ -0,0 +1,119 @@
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from main import create_app
+from ratelimit import SQLiteLimitStorage, composite_key
+
+app = create_app()
+services = app.state.services
+limiter = app.state.limiter
+
+STORAGE_DIR = "tests/ratelimit_db"
+
+
+def request(headers=None, body=None, host="10.0.0.1"):
+    return Mock(headers=headers or {}, _json=body, client=Mock(host=host))
+
+
+class TestSQLiteLimitStorage:
+    def setup_method(self):
+        self.uri = f"sqlite://{STORAGE_DIR}/limits.sqlite3"
+
+    def teardown_method(self):
+        shutil.rmtree(STORAGE_DIR, ignore_errors=True)
+
+    def test_registered_for_sqlite_uris(self):
+        assert isinstance(storage_from_string(self.uri), SQLiteLimitStorage)
+
+    def test_workers_share_the_budget(self):
+        limit = parse("3/minute")
+        workers = [
+            FixedWindowRateLimiter(SQLiteLimitStorage(self.uri)) for _ in range(2)
+        ]
+
+        hits = [workers[i % 2].hit(limit, "client") for i in range(4)]
+
+        assert hits == [True, True, True, False]
+        assert workers[1].get_window_stats(limit, "client").remaining == 0
+        assert workers[0].hit(limit, "other client")
+
+    def test_window_expires(self):
+        storage = SQLiteLimitStorage(self.uri)
+        assert storage.incr("key", expiry=60) == 1
+        assert storage.incr("key", expiry=60) == 2
+
+        with patch("ratelimit.time.time", return_value=time.time() + 61):
+            assert storage.get("key") == 0
+            assert storage.incr("key", expiry=60) == 1
+
+    def test_concurrent_increments_are_not_lost(self):
+        storages = [SQLiteLimitStorage(self.uri) for _ in range(4)]
+
+        def hit(i: int) -> None:
+            storages[i % 4].incr("key", expiry=60)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(hit, range(200)))
+        assert storages[0].get("key") == 200
+
+    @pytest.mark.skipif(
+        "RATE_LIMIT_TEST_REDIS_URL" not in os.environ,
+        reason="set RATE_LIMIT_TEST_REDIS_URL to a local Redis stand-in",
+    )
+    def test_redis_storage(self):
+        storage = storage_from_string(os.environ["RATE_LIMIT_TEST_REDIS_URL"])
+        storage.reset()
+        strategy = FixedWindowRateLimiter(storage)
+        limit = parse("2/minute")
+        assert [strategy.hit(limit, "client") for _ in range(3)] == [True, True, False]
+
+
+class TestCompositeKey:
+    def test_joins_components(self):
+        key = composite_key(["ip", "transaction"])
+        with_transaction = request(body={"transaction_id": "abc"})
+        assert key(with_transaction) == "ip=10.0.0.1|transaction=abc"
+        assert key(request()) == "ip=10.0.0.1|transaction="
+
+    def test_api_key_is_hashed(self):
+        key = composite_key(["api_key"])
+        from_header = key(request(headers={"x-api-key": "secret"}))
+        from_bearer = key(request(headers={"authorization": "Bearer secret"}))
+
+        assert from_header == from_bearer
+        assert "secret" not in from_header
+        assert key(request()) == "api_key="
+
+    def test_unknown_component(self):
+        with pytest.raises(ValueError):
+            composite_key(["ip", "user_agent"])
+
+
+class TestEndpointBudgets:
+    def setup_method(self):
+        self.client = TestClient(app)
+        limiter.reset()
+
+    def teardown_method(self):
+        self.client.close()
+
+    @patch.object(services.storage, "get_conversation", return_value=None)
+    @patch.object(services.openai_client, "is_offensive_content", return_value=True)
+    def test_chat_and_summary_have_separate_budgets(self, _, __):
+        statuses = [
+            self.client.post("/chat", json={"user_message": "Hi"}).status_code
+            for _ in range(11)
+        ]
+        summary = self.client.post("/chat/summary", json={"transaction_id": "x"})
+
+        assert statuses == [400] * 10 + [429]
+        assert summary.status_code == 404
@@ -0,0 +1,115 @@
+import os
+import shutil
+import zlib
+from datetime import datetime, timezone
+
+import pytest
+
+from storage import Conversation, Message, MessageRole, SimpleStorage
+from storage.records import (CODEC_NONE, HEADER, RecordFormatError,
+                             decode_record, encode_record)
+
+SAMPLE_RECORDS = "storage/records"
+
+
+def conversation(session_id: str = "session", turns: int = 3) -> Conversation:
+    messages = []
+    for index in range(turns):
+        messages += [
+            Message(role=MessageRole.USER, content=f"User message {index}"),
+            Message(
+                role=MessageRole.ASSISTANT, content=f"Reply {index}", token_count=4
+            ),
+        ]
+    return Conversation(
+        session_id=session_id,
+        version=7,
+        messages=messages,
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc),
+    )
+
+
+class TestRecordFormat:
+    def test_roundtrip(self):
+        original = conversation()
+        assert decode_record(encode_record(original)) == original
+        assert decode_record(encode_record(original, CODEC_NONE)) == original
+
+    def test_smaller_than_json(self):
+        original = conversation(turns=50)
+        assert len(encode_record(original)) < len(original.model_dump_json()) / 3
+
+    def test_rejects_foreign_and_truncated_data(self):
+        record = encode_record(conversation())
+
+        with pytest.raises(RecordFormatError):
+            decode_record(b'{"session_id": "session"}' + record)
+        with pytest.raises(RecordFormatError):
+            decode_record(record[:-1])
+        with pytest.raises(RecordFormatError):
+            # A format version from the future
+            decode_record(record[:4] + bytes([2]) + record[5:])
+
+
+class TestBinaryStorage:
+    def setup_method(self):
+        self.db_path = "tests/records_db"
+        shutil.copytree(SAMPLE_RECORDS, self.db_path)
+        self.samples = sorted(
+            name[: -len(".json")]
+            for name in os.listdir(SAMPLE_RECORDS)
+            if name.endswith(".json")
+        )
+        self.storage = SimpleStorage(db_path=self.db_path, record_format="binary")
+
+    def teardown_method(self):
+        shutil.rmtree(self.db_path)
+
+    def test_reads_json_records_until_converted(self):
+        legacy = SimpleStorage(db_path=self.db_path)
+        session_id = self.samples[0]
+
+        assert self.storage.get_conversation(session_id) == legacy.get_conversation(
+            session_id
+        )
+
+    def test_update_replaces_json_record(self):
+        session_id = self.samples[0]
+        conversation = self.storage.get_conversation(session_id)
+        conversation.messages.append(Message(role=MessageRole.USER, content="Hi"))
+
+        self.storage.update_conversation(session_id, conversation)
+
+        assert not os.path.exists(os.path.join(self.db_path, f"{session_id}.json"))
+        stored = self.storage.get_conversation(session_id)
+        assert stored.messages[-1].content == "Hi"
+        assert stored.version == conversation.version
+
+    def test_version_check_reads_the_header_only(self):
+        session_id = self.samples[0]
+        conversation = self.storage.get_conversation(session_id)
+        self.storage.update_conversation(session_id, conversation)
+        path = os.path.join(self.db_path, f"{session_id}.rec")
+        with open(path, "r+b") as f:
+            # Corrupt the payload: the version check must not need it
+            f.seek(HEADER.size)
+            f.write(b"\0" * 8)
+
+        self.storage._check_version(session_id, conversation.version)
+        with pytest.raises(zlib.error):
+            self.storage.get_conversation(session_id)
+
+    def test_convert_records(self):
+        legacy = SimpleStorage(db_path=self.db_path)
+        before = {
+            session_id: legacy.get_conversation(session_id)
+            for session_id in self.samples
+        }
+
+        assert self.storage.convert_records() == len(self.samples)
+        assert self.storage.convert_records() == 0
+
+        for session_id, conversation in before.items():
+            assert not os.path.exists(os.path.join(self.db_path, f"{session_id}.json"))
+            assert self.storage.get_conversation(session_id) == conversation
@@ -0,0 +1,178 @@
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+
+from storage import (CollectedData, Conversation, ConversationIndex,
+                     ConversationQuery, ConversationSummary, Message,
+                     MessageRole, SimpleStorage)
+from storage.__main__ import retention
+from storage.archive import SEGMENT_SUFFIX, ConversationArchive
+
+NOW = datetime.now(timezone.utc)
+
+
+def conversation(session_id: str, days_idle: float) -> Conversation:
+    updated_at = NOW - timedelta(days=days_idle)
+    return Conversation(
+        session_id=session_id,
+        version=1,
+        messages=[Message(role=MessageRole.USER, content=f"Help with {session_id}")],
+        collected_data=CollectedData(order_number=1234),
+        created_at=updated_at,
+        updated_at=updated_at,
+    )
+
+
+def store_idle(storage: SimpleStorage, session_id: str, days_idle: float) -> None:
+    """Store a conversation as if it was last written `days_idle` days ago"""
+    stored = conversation(session_id, days_idle)
+    storage._write(session_id, stored)
+    written_at = stored.updated_at.timestamp()
+    os.utime(storage._path(session_id), (written_at, written_at))
+
+
+def segments(storage: SimpleStorage) -> list[str]:
+    archive_path = os.path.join(storage.db_path, "archive")
+    return [name for name in os.listdir(archive_path) if name.endswith(SEGMENT_SUFFIX)]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SimpleStorage(
+        db_path=str(tmp_path / "records"), record_format="binary", layout="sharded"
+    )
+    yield storage
+    storage.close()
+
+
+def test_sharded_store_migrates_flat_records(tmp_path, storage):
+    flat = SimpleStorage(db_path=storage.db_path)
+    for session_id in ("a", "b"):
+        flat._write(session_id, conversation(session_id, 0))
+
+    updated = storage.get_conversation("a")
+    storage.update_conversation("a", updated)
+
+    assert not os.path.exists(flat._path("a"))
+    assert os.path.exists(storage._path("a"))
+    assert os.path.dirname(storage._path("a")) != storage.db_path
+    assert storage.get_conversation("b") == flat.get_conversation("b")
+    assert storage.convert_records() == 1
+    assert storage.convert_records() == 0
+    assert sorted(storage.session_ids()) == ["a", "b"]
+    assert [name for name in os.listdir(storage.db_path) if "." in name] == [".locks"]
+
+
+def test_idle_conversations_are_archived(storage):
+    store_idle(storage, "idle", days_idle=40)
+    store_idle(storage, "active", days_idle=1)
+
+    assert storage.archive_idle(NOW - timedelta(days=30)) == 1
+
+    assert not os.path.exists(storage._path("idle"))
+    assert os.path.exists(storage._path("active"))
+    assert len(segments(storage)) == 1
+    assert storage.get_conversation("idle") == conversation("idle", 40)
+    assert storage.get_version("idle") is not None
+    assert sorted(storage.session_ids()) == ["active", "idle"]
+
+
+def test_archive_is_read_by_another_process(storage):
+    store_idle(storage, "idle", days_idle=40)
+    # The store serving requests was opened before the archive existed
+    serving = SimpleStorage(
+        db_path=storage.db_path, record_format="binary", layout="sharded"
+    )
+    assert serving.get_conversation("idle") is not None
+
+    storage.archive_idle(NOW - timedelta(days=30))
+
+    assert serving.get_conversation("idle") == conversation("idle", 40)
+    serving.close()
+
+
+def test_updating_an_archived_conversation_restores_it(storage):
+    store_idle(storage, "idle", days_idle=40)
+    storage.archive_idle(NOW - timedelta(days=30))
+
+    archived = storage.get_or_create_conversation("idle")
+    archived.messages.append(Message(role=MessageRole.ASSISTANT, content="Back"))
+    storage.update_conversation("idle", archived)
+
+    assert os.path.exists(storage._path("idle"))
+    assert segments(storage) == []
+    stored = storage.get_conversation("idle")
+    assert stored.version == 2
+    assert stored.messages[-1].content == "Back"
+
+
+def test_conversation_updated_while_archiving_is_not_archived(storage):
+    store_idle(storage, "idle", days_idle=40)
+    append = ConversationArchive.append
+
+    def append_then_update(archive, conversations):
+        append(archive, conversations)
+        updated = storage.get_conversation("idle")
+        storage.update_conversation("idle", updated)
+
+    with patch.object(ConversationArchive, "append", append_then_update):
+        assert storage.archive_idle(NOW - timedelta(days=30)) == 0
+
+    assert os.path.exists(storage._path("idle"))
+    assert storage._get_archive().version("idle") is None
+    assert segments(storage) == []
+
+
+def test_retention_keeps_index_rows_of_live_conversations(storage, tmp_path):
+    store_idle(storage, "expired", days_idle=500)
+    store_idle(storage, "live", days_idle=500)
+    # A stale archived copy of a conversation that is live again
+    storage._get_archive(create=True).append([conversation("live", 500)])
+    os.utime(storage._path("live"))
+    index_path = str(tmp_path / "index.sqlite3")
+    index = ConversationIndex(index_path)
+    index.update([conversation("expired", 500), conversation("live", 500)])
+    index.close()
+
+    with patch("storage.__main__.create_storage", return_value=storage):
+        retention(
+            argparse.Namespace(
+                backend="binary",
+                path=storage.db_path,
+                delete_after_days=365,
+                archive_after_days=None,
+                index=index_path,
+            )
+        )
+
+    index = ConversationIndex(index_path)
+    page = index.query(ConversationQuery())
+    index.close()
+    assert [item.session_id for item in page.items] == ["live"]
+
+
+def test_expired_conversations_are_deleted(storage):
+    store_idle(storage, "archived", days_idle=400)
+    storage.archive_idle(NOW - timedelta(days=30))
+    store_idle(storage, "expired", days_idle=500)
+    store_idle(storage, "kept", days_idle=10)
+
+    deleted = storage.delete_expired(NOW - timedelta(days=365))
+
+    assert sorted(deleted) == ["archived", "expired"]
+    assert storage.get_conversation("archived") is None
+    assert storage.get_conversation("expired") is None
+    assert storage.get_conversation("kept") is not None
+    assert segments(storage) == []
+
+
+def test_summary_does_not_restart_the_idle_clock(storage):
+    store_idle(storage, "idle", days_idle=40)
+
+    storage.save_summary("idle", ConversationSummary(text="Summary", message_count=1))
+
+    assert storage.get_conversation("idle").summary.text == "Summary"
+    assert storage.archive_idle(NOW - timedelta(days=30)) == 1
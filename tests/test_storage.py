@@ -1,15 +1,18 @@
+import asyncio
 import os
 import shutil
 from datetime import datetime, timezone
+from unittest.mock import patch
 
 from freezegun import freeze_time
 
-from storage import Conversation, Message, MessageRole, Storage
+from storage import (AsyncStorage, Conversation, Message, MessageRole,
+                     SimpleStorage)
 
 
 class TestStorage:
     def setup_method(self):
-        self.storage = Storage(db_path="tests/db")
+        self.storage = SimpleStorage(db_path="tests/db")
 
     def teardown_method(self):
         # Delete the db path after each test
@@ -88,3 +91,47 @@ class TestStorage:
         assert conversation.updated_at == datetime(
             2025, 1, 1, 12, 1, 0, tzinfo=timezone.utc
         )
+
+    def test_write_conversations_syncs_files_and_directory(self):
+        conversations = [
+            self.storage.get_or_create_conversation(f"session-{index}")
+            for index in range(3)
+        ]
+
+        with patch("storage.storage.os.fsync", wraps=os.fsync) as m_fsync:
+            versions = self.storage.write_conversations(
+                [(conversation, 0) for conversation in conversations]
+            )
+            assert len(versions) == 3
+            # One fsync per file, one for the directory they were renamed into
+            assert m_fsync.call_count == 4
+
+            m_fsync.reset_mock()
+            self.storage.update_conversation("session-0", conversations[0])
+            m_fsync.assert_not_called()
+
+
+class TestAsyncStorage:
+    def setup_method(self):
+        self.storage = AsyncStorage(SimpleStorage(db_path="tests/db"))
+
+    def teardown_method(self):
+        shutil.rmtree(self.storage.storage.db_path)
+
+    def test_update_and_get_conversation(self):
+        session_id = "feca9559-dbc0-4b4e-a9e2-7de000907035"
+
+        async def roundtrip():
+            conversation = await self.storage.get_or_create_conversation(session_id)
+            conversation.messages.append(
+                Message(role=MessageRole.USER, content="Hello, how are you?")
+            )
+            await self.storage.update_conversation(session_id, conversation)
+            return await self.storage.get_conversation(session_id)
+
+        conversation = asyncio.run(roundtrip())
+
+        assert conversation.session_id == session_id
+        assert conversation.messages == [
+            Message(role=MessageRole.USER, content="Hello, how are you?")
+        ]
@@ -0,0 +1,116 @@
+import os
+import shutil
+import time
+from unittest.mock import patch
+
+from storage import CachedStorage, Message, MessageRole, SimpleStorage
+from storage.cache import cache_evictions, cache_hits, cache_misses
+
+
+def add_turn(conversation, content: str) -> None:
+    conversation.messages.extend(
+        [
+            Message(role=MessageRole.USER, content=content),
+            Message(role=MessageRole.ASSISTANT, content=f"Reply to {content}"),
+        ]
+    )
+
+
+class TestCachedStorage:
+    def setup_method(self):
+        self.backend = SimpleStorage(db_path="tests/cache_db")
+        self.storage = CachedStorage(self.backend, max_entries=2)
+
+    def teardown_method(self):
+        shutil.rmtree(self.backend.db_path)
+
+    def write(self, session_id: str, content: str = "Hello"):
+        conversation = self.storage.get_or_create_conversation(session_id)
+        add_turn(conversation, content)
+        self.storage.update_conversation(session_id, conversation)
+        return conversation
+
+    def test_read_after_write_is_a_hit(self):
+        self.write("session")
+        hits, misses = cache_hits.value, cache_misses.value
+
+        with patch.object(self.backend, "get_conversation") as m_get:
+            conversation = self.storage.get_conversation("session")
+
+        m_get.assert_not_called()
+        assert conversation.messages[0].content == "Hello"
+        assert cache_hits.value == hits + 1
+        assert cache_misses.value == misses
+
+    def test_miss_populates_cache(self):
+        conversation = self.backend.get_or_create_conversation("session")
+        add_turn(conversation, "Hello")
+        self.backend.update_conversation("session", conversation)
+        misses = cache_misses.value
+
+        self.storage.get_conversation("session")
+        with patch.object(self.backend, "get_conversation") as m_get:
+            self.storage.get_conversation("session")
+
+        m_get.assert_not_called()
+        assert cache_misses.value == misses + 1
+
+    def test_returned_conversation_is_a_copy(self):
+        self.write("session")
+
+        conversation = self.storage.get_conversation("session")
+        add_turn(conversation, "Not stored")
+
+        assert len(self.storage.get_conversation("session").messages) == 2
+
+    def test_lru_eviction_by_entry_count(self):
+        self.write("a")
+        self.write("b")
+        self.storage.get_conversation("a")  # "b" becomes least recently used
+        evictions = cache_evictions.value
+
+        self.write("c")
+
+        assert list(self.storage._entries) == ["a", "c"]
+        assert cache_evictions.value == evictions + 1
+
+    def test_eviction_by_size(self):
+        storage = CachedStorage(self.backend, max_bytes=500)
+        conversation = storage.get_or_create_conversation("a")
+        add_turn(conversation, "x" * 100)
+        storage.update_conversation("a", conversation)
+        conversation = storage.get_or_create_conversation("b")
+        add_turn(conversation, "y" * 100)
+        storage.update_conversation("b", conversation)
+
+        assert list(storage._entries) == ["b"]
+
+    def test_expired_entries_are_reloaded(self):
+        self.write("session")
+        self.storage.ttl = 0.01
+        self.write("session", "Again")
+        time.sleep(0.02)
+        misses = cache_misses.value
+
+        conversation = self.storage.get_conversation("session")
+
+        assert len(conversation.messages) == 4
+        assert cache_misses.value == misses + 1
+
+    def test_write_from_another_worker_invalidates_entry(self):
+        self.write("session")
+
+        # Another worker with its own cache appends a turn to the same file
+        other_worker = CachedStorage(SimpleStorage(db_path=self.backend.db_path))
+        conversation = other_worker.get_conversation("session")
+        add_turn(conversation, "From another worker")
+        other_worker.update_conversation("session", conversation)
+
+        conversation = self.storage.get_conversation("session")
+        assert [m.content for m in conversation.messages][-2] == "From another worker"
+
+    def test_deleted_file_is_not_served(self):
+        self.write("session")
+        os.remove(os.path.join(self.backend.db_path, "session.json"))
+
+        assert self.storage.get_conversation("session") is None
@@ -0,0 +1,470 @@
+"""
+Behaviour every storage backend must share. New backends only need an entry
+in BACKENDS to run the whole suite.
+"""
+
+import multiprocessing
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+
+from storage import (CachedStorage, CollectedData, Conversation,
+                     ConversationConflictError, ConversationIndex,
+                     ConversationPage, ConversationQuery, ConversationSummary,
+                     IndexedStorage, InvalidCursorError, LogStorage, Message,
+                     MessageRole, SimpleStorage, SQLiteStorage,
+                     WriteBehindStorage, get_conversations,
+                     query_conversations, save_summary)
+from storage.models import UrgencyLevel
+
+BACKENDS = {
+    "json": lambda path: SimpleStorage(db_path=str(path / "records")),
+    "binary": lambda path: SimpleStorage(
+        db_path=str(path / "records"), record_format="binary"
+    ),
+    "sharded-binary": lambda path: SimpleStorage(
+        db_path=str(path / "records"), record_format="binary", layout="sharded"
+    ),
+    "log": lambda path: LogStorage(
+        db_path=str(path / "log"), compaction_interval=None
+    ),
+    "sqlite": lambda path: SQLiteStorage(db_path=str(path / "db.sqlite3")),
+    "cached-json": lambda path: CachedStorage(
+        SimpleStorage(db_path=str(path / "records"))
+    ),
+    "write-behind-log": lambda path: WriteBehindStorage(
+        LogStorage(db_path=str(path / "log"), compaction_interval=None),
+        flush_interval=0.001,
+    ),
+    "write-behind-cached-json": lambda path: WriteBehindStorage(
+        CachedStorage(SimpleStorage(db_path=str(path / "records"))),
+        flush_interval=0.001,
+    ),
+    "indexed-json": lambda path: IndexedStorage(
+        SimpleStorage(db_path=str(path / "records")),
+        ConversationIndex(str(path / "index.sqlite3")),
+    ),
+    "write-behind-indexed-log": lambda path: WriteBehindStorage(
+        IndexedStorage(
+            LogStorage(db_path=str(path / "log"), compaction_interval=None),
+            ConversationIndex(str(path / "index.sqlite3")),
+        ),
+        flush_interval=0.001,
+    ),
+}
+
+
+def turn(index: int) -> list[Message]:
+    return [
+        Message(role=MessageRole.USER, content=f"User message {index}"),
+        Message(role=MessageRole.ASSISTANT, content=f"Assistant reply {index}"),
+    ]
+
+
+def close(storage) -> None:
+    # Outermost first, so queued writes are flushed before the backend closes
+    while storage is not None:
+        if hasattr(storage, "close"):
+            storage.close()
+        storage = getattr(storage, "storage", None)
+
+
+@pytest.fixture(params=BACKENDS)
+def open_storage(request, tmp_path):
+    opened = []
+
+    def open_storage():
+        storage = BACKENDS[request.param](tmp_path)
+        opened.append(storage)
+        return storage
+
+    yield open_storage
+    for storage in opened:
+        close(storage)
+
+
+@pytest.fixture
+def storage(open_storage):
+    return open_storage()
+
+
+def test_missing_conversation(storage):
+    assert storage.get_conversation("missing") is None
+
+
+def test_get_or_create_does_not_persist(storage):
+    conversation = storage.get_or_create_conversation("new")
+
+    assert isinstance(conversation, Conversation)
+    assert conversation.session_id == "new"
+    assert conversation.messages == []
+    assert conversation.collected_data == CollectedData()
+    assert storage.get_conversation("new") is None
+
+
+def test_update_roundtrip(storage):
+    conversation = storage.get_or_create_conversation("session")
+    conversation.messages.extend(turn(1))
+    conversation.collected_data = CollectedData(
+        order_number=1234,
+        problem_category="broken product",
+        problem_description="The blender does not start",
+        urgency_level="high",
+    )
+    storage.update_conversation("session", conversation)
+
+    stored = storage.get_conversation("session")
+
+    assert stored == conversation
+
+
+def test_message_token_counts_roundtrip(storage):
+    conversation = storage.get_or_create_conversation("session")
+    conversation.messages.extend(turn(1))
+    conversation.messages[0].token_count = 7
+    storage.update_conversation("session", conversation)
+
+    stored = storage.get_conversation("session")
+
+    assert [m.token_count for m in stored.messages] == [7, None]
+
+
+def test_incremental_updates(storage):
+    conversation = storage.get_or_create_conversation("session")
+    for index in range(5):
+        conversation.messages.extend(turn(index))
+        conversation.collected_data = CollectedData(order_number=index)
+        storage.update_conversation("session", conversation)
+
+    stored = storage.get_conversation("session")
+
+    assert stored.messages == [m for index in range(5) for m in turn(index)]
+    assert stored.collected_data == CollectedData(order_number=4)
+
+
+def test_collected_data_can_be_none(storage):
+    conversation = storage.get_or_create_conversation("session")
+    conversation.collected_data = None
+    storage.update_conversation("session", conversation)
+
+    assert storage.get_conversation("session").collected_data is None
+
+
+def test_summary_roundtrip(open_storage):
+    storage = open_storage()
+    conversation = storage.get_or_create_conversation("session")
+    conversation.messages.extend(turn(1))
+    storage.update_conversation("session", conversation)
+    conversation.summary = ConversationSummary(text="Summary", message_count=2)
+    storage.update_conversation("session", conversation)
+    conversation.messages.extend(turn(2))
+    conversation.history_summary = ConversationSummary(text="Folded", message_count=2)
+    storage.update_conversation("session", conversation)
+    close(storage)
+
+    stored = open_storage().get_conversation("session")
+
+    assert stored.summary == ConversationSummary(text="Summary", message_count=2)
+    assert stored.history_summary == ConversationSummary(
+        text="Folded", message_count=2
+    )
+    assert stored.messages == turn(1) + turn(2)
+
+
+def test_summary_can_be_cleared(storage):
+    conversation = storage.get_or_create_conversation("session")
+    conversation.summary = ConversationSummary(text="Summary", message_count=0)
+    storage.update_conversation("session", conversation)
+    conversation.summary = None
+    storage.update_conversation("session", conversation)
+
+    assert storage.get_conversation("session").summary is None
+
+
+def test_save_summary_keeps_the_version(storage):
+    conversation = storage.get_or_create_conversation("session")
+    conversation.messages.extend(turn(1))
+    storage.update_conversation("session", conversation)
+    before = storage.get_conversation("session")
+
+    summary = ConversationSummary(text="Summary", message_count=2)
+    assert save_summary(storage, "session", summary)
+    # Older summaries and missing conversations are ignored
+    save_summary(storage, "session", ConversationSummary(text="Old", message_count=0))
+    save_summary(storage, "missing", summary)
+
+    stored = storage.get_conversation("session")
+    assert stored == before.model_copy(update={"summary": summary})
+    assert storage.get_conversation("missing") is None
+
+
+def test_rewritten_history(storage):
+    conversation = storage.get_or_create_conversation("session")
+    conversation.messages.extend(turn(1) + turn(2))
+    storage.update_conversation("session", conversation)
+
+    conversation.messages = turn(3)
+    storage.update_conversation("session", conversation)
+
+    assert storage.get_conversation("session").messages == turn(3)
+
+
+def test_sessions_are_isolated(storage):
+    for session_id in ["a", "b"]:
+        conversation = storage.get_or_create_conversation(session_id)
+        conversation.messages.extend(turn(ord(session_id)))
+        storage.update_conversation(session_id, conversation)
+
+    assert storage.get_conversation("a").messages == turn(ord("a"))
+    assert storage.get_conversation("b").messages == turn(ord("b"))
+
+
+def test_bulk_read(storage):
+    for session_id in ["a", "b", "c"]:
+        conversation = storage.get_or_create_conversation(session_id)
+        conversation.messages.extend(turn(ord(session_id)))
+        storage.update_conversation(session_id, conversation)
+    # A cached backend serves "a" from the cache and reads the rest in bulk
+    storage.get_conversation("a")
+
+    conversations = get_conversations(storage, ["c", "missing", "a", "c"])
+
+    assert list(conversations) == ["c", "a"]
+    assert conversations["a"] == storage.get_conversation("a")
+    assert conversations["c"].messages == turn(ord("c"))
+
+
+def test_update_returns_changing_version(storage):
+    if isinstance(storage, WriteBehindStorage):
+        pytest.skip("queued writes have no stored version yet")
+    conversation = storage.get_or_create_conversation("session")
+    first = storage.update_conversation("session", conversation)
+    conversation.messages.extend(turn(1))
+    second = storage.update_conversation("session", conversation)
+
+    assert first is not None and second is not None
+    assert first != second
+
+
+def test_write_conversations_checks_expected_versions(storage):
+    if not hasattr(storage, "write_conversations"):
+        pytest.skip("no batched writes")
+    stored = storage.get_or_create_conversation("stored")
+    storage.update_conversation("stored", stored)
+    new = storage.get_or_create_conversation("new")
+    new.messages.extend(turn(1))
+    new.version = 3
+    stale = stored.model_copy(update={"messages": turn(2), "version": 5})
+
+    versions = storage.write_conversations([(new, 0), (stale, 0)])
+
+    assert list(versions) == ["new"]
+    assert storage.get_conversation("new").version == 3
+    assert storage.get_conversation("new").messages == turn(1)
+    assert storage.get_conversation("stored").messages == []
+
+
+def test_data_survives_reopen(open_storage):
+    storage = open_storage()
+    conversation = storage.get_or_create_conversation("session")
+    conversation.messages.extend(turn(1))
+    storage.update_conversation("session", conversation)
+    close(storage)
+
+    reopened = open_storage()
+
+    assert reopened.get_conversation("session").messages == turn(1)
+
+
+def test_update_increments_version(storage):
+    conversation = storage.get_or_create_conversation("session")
+    assert conversation.version == 0
+
+    storage.update_conversation("session", conversation)
+    storage.update_conversation("session", conversation)
+
+    assert conversation.version == 2
+    assert storage.get_conversation("session").version == 2
+
+
+def test_stale_update_is_rejected(storage):
+    first = storage.get_or_create_conversation("session")
+    second = storage.get_or_create_conversation("session")
+    first.messages.extend(turn(1))
+    storage.update_conversation("session", first)
+
+    second.messages.extend(turn(2))
+    with pytest.raises(ConversationConflictError):
+        storage.update_conversation("session", second)
+
+    assert second.version == 0
+    assert storage.get_conversation("session").messages == turn(1)
+
+
+def test_concurrent_writers_never_lose_a_turn(storage):
+    storage.update_conversation(
+        "session", storage.get_or_create_conversation("session")
+    )
+
+    def add_turn(index: int) -> None:
+        while True:
+            conversation = storage.get_conversation("session")
+            conversation.messages.extend(turn(index))
+            try:
+                storage.update_conversation("session", conversation)
+                return
+            except ConversationConflictError:
+                continue
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(add_turn, range(40)))
+
+    stored = storage.get_conversation("session")
+    assert stored.version == 41
+    assert sorted(m.content for m in stored.messages) == sorted(
+        m.content for index in range(40) for m in turn(index)
+    )
+
+
+def add_turn_in_process(backend: str, path, session_id: str) -> None:
+    storage = BACKENDS[backend](path)
+    try:
+        conversation = storage.get_conversation(session_id)
+        conversation.messages.extend(turn(2))
+        storage.update_conversation(session_id, conversation)
+    finally:
+        close(storage)
+
+
+# Backends stored in files that another process can open; the others add
+# an in-process layer on top of one of them
+MULTI_PROCESS_BACKENDS = ["json", "binary", "sharded-binary", "sqlite", "log"]
+
+
+@pytest.mark.parametrize("backend", MULTI_PROCESS_BACKENDS)
+def test_versions_are_checked_across_processes(backend, tmp_path):
+    storage = BACKENDS[backend](tmp_path)
+    try:
+        conversation = storage.get_or_create_conversation("session")
+        conversation.messages.extend(turn(1))
+        storage.update_conversation("session", conversation)
+
+        process = multiprocessing.get_context("fork").Process(
+            target=add_turn_in_process, args=(backend, tmp_path, "session")
+        )
+        process.start()
+        process.join()
+
+        conversation.messages.extend(turn(3))
+        if backend == "log":
+            # Versions are only checked in-process: a second process cannot
+            # open the log at all
+            assert process.exitcode != 0
+            storage.update_conversation("session", conversation)
+        else:
+            assert process.exitcode == 0
+            with pytest.raises(ConversationConflictError):
+                storage.update_conversation("session", conversation)
+            assert storage.get_conversation("session").messages == turn(1) + turn(2)
+    finally:
+        close(storage)
+
+
+def store(storage, session_id: str, **collected_data) -> Conversation:
+    conversation = storage.get_or_create_conversation(session_id)
+    conversation.messages.extend(turn(1))
+    conversation.collected_data = CollectedData(**collected_data)
+    storage.update_conversation(session_id, conversation)
+    return conversation
+
+
+def query_page(storage, **filters) -> ConversationPage:
+    if hasattr(storage, "flush"):
+        storage.flush()
+    return query_conversations(storage, ConversationQuery(**filters))
+
+
+def query(storage, **filters) -> list[str]:
+    return [item.session_id for item in query_page(storage, **filters).items]
+
+
+@pytest.fixture
+def queryable_storage(storage):
+    try:
+        query(storage)
+    except NotImplementedError:
+        pytest.skip("no conversation index")
+    return storage
+
+
+def test_query_filters_newest_first(queryable_storage):
+    storage = queryable_storage
+    store(storage, "a", order_number=1, urgency_level="high")
+    store(storage, "b", problem_category="broken item", urgency_level="low")
+    middle = datetime.now(timezone.utc)
+    store(storage, "c", order_number=1, urgency_level="high")
+
+    assert query(storage) == ["c", "b", "a"]
+    assert query(storage, order_number=1) == ["c", "a"]
+    assert query(storage, urgency_level="high") == ["c", "a"]
+    assert query(storage, problem_category="broken item") == ["b"]
+    assert query(storage, order_number=1, urgency_level="low") == []
+    assert query(storage, updated_after=middle) == ["c"]
+    assert query(storage, updated_before=middle) == ["b", "a"]
+
+
+def test_query_reflects_the_latest_version(queryable_storage):
+    storage = queryable_storage
+    conversation = store(storage, "session", urgency_level="low")
+
+    conversation.collected_data.urgency_level = UrgencyLevel.HIGH
+    conversation.messages.extend(turn(2))
+    storage.update_conversation("session", conversation)
+
+    assert query(storage, urgency_level="low") == []
+    [item] = query_page(storage, urgency_level="high").items
+    assert item.session_id == "session"
+    assert item.message_count == 4
+
+
+def test_query_pages_with_cursor(queryable_storage):
+    storage = queryable_storage
+    for index in range(5):
+        store(storage, f"s{index}", order_number=index % 2)
+
+    session_ids, cursor = [], None
+    while True:
+        page = query_page(storage, limit=2, cursor=cursor)
+        session_ids += [item.session_id for item in page.items]
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert session_ids == ["s4", "s3", "s2", "s1", "s0"]
+    with pytest.raises(InvalidCursorError):
+        query(storage, cursor="not a cursor")
+
+
+def test_sqlite_adds_missing_columns(tmp_path):
+    path = str(tmp_path / "db.sqlite3")
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        "CREATE TABLE conversations (session_id TEXT PRIMARY KEY, version INTEGER, "
+        "message_count INTEGER, has_collected_data INTEGER, order_number INTEGER, "
+        "problem_category TEXT, problem_description TEXT, urgency_level TEXT, "
+        "created_at TEXT, updated_at TEXT);"
+        "CREATE TABLE messages (session_id TEXT, position INTEGER, role TEXT, "
+        "content TEXT, PRIMARY KEY (session_id, position));"
+    )
+    connection.close()
+
+    storage = SQLiteStorage(db_path=path)
+    conversation = storage.get_or_create_conversation("session")
+    conversation.messages.extend(turn(1))
+    conversation.summary = ConversationSummary(text="Summary", message_count=2)
+    storage.update_conversation("session", conversation)
+
+    assert storage.get_conversation("session") == conversation
+    storage.close()
@@ -0,0 +1,73 @@
+import asyncio
+from unittest.mock import patch
+
+import httpx
+
+from llm.transport import create_http_client, timeout
+from openai_client import AsyncOpenAIClient
+
+
+class TestCreateHttpClient:
+    def test_pool_and_timeouts(self):
+        client = create_http_client(
+            max_connections=10,
+            max_keepalive_connections=5,
+            keepalive_expiry=30,
+            connect_timeout=1,
+            read_timeout=20,
+        )
+        pool = client._transport._pool
+
+        assert pool._max_connections == 10
+        assert pool._max_keepalive_connections == 5
+        assert pool._keepalive_expiry == 30
+        assert client.timeout == httpx.Timeout(20, connect=1)
+
+    def test_http2_needs_h2(self):
+        with patch("llm.transport.http2_available", return_value=False):
+            client = create_http_client(http2=True)
+        assert not client._transport._pool._http2
+
+
+class TestClientTransport:
+    def setup_method(self):
+        self.requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            if request.url.path.endswith("/moderations"):
+                return httpx.Response(
+                    200,
+                    json={
+                        "id": "modr-1",
+                        "model": "omni-moderation-latest",
+                        "results": [
+                            {"flagged": False, "categories": {}, "category_scores": {}}
+                        ],
+                    },
+                )
+            return httpx.Response(404)
+
+        self.client = AsyncOpenAIClient(
+            api_key="test",
+            base_url="http://upstream/v1",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            moderation_timeout=timeout(connect=1, read=2),
+        )
+
+    def test_moderation_uses_its_own_timeouts(self):
+        assert asyncio.run(self.client.is_offensive_content("hi")) is False
+
+        assert self.requests[0].extensions["timeout"] == {
+            "connect": 1,
+            "read": 2,
+            "write": 2,
+            "pool": 2,
+        }
+
+    def test_warm_up_reaches_the_upstream(self):
+        assert asyncio.run(self.client.warm_up(3)) == 3
+
+        assert len(self.requests) == 3
+        assert all(request.method == "HEAD" for request in self.requests)
+        assert str(self.requests[0].url) == "http://upstream/v1/"
@@ -1,6 +1,7 @@
 from unittest.mock import patch
 
-from chat.utils import CollectedData, OpenAIResponse, parse_response
+from chat.utils import (CollectedData, CollectedDataStreamParser,
+                        OpenAIResponse, parse_response)
 
 
 def test_parse_response():
@@ -45,3 +46,62 @@ def test_parse_response_invalid_collected_data_json(m_logger):
         "Invalid JSON in <COLLECTED_DATA>: invalid json"
         in m_logger.error.call_args[0][0]
     )
+
+
+def _feed_all(parser, chunks):
+    released = "".join(parser.feed(chunk) for chunk in chunks)
+    return released + parser.finish()
+
+
+def test_stream_parser_holds_back_split_collected_data_block():
+    collected_data = CollectedData(order_number=1234, urgency_level="high")
+    response_content = (
+        "Thanks, I have your order."
+        + "<COLLECTED_DATA>"
+        + collected_data.model_dump_json()
+        + "</COLLECTED_DATA>"
+    )
+    # Split into 3-character chunks so both tags straddle chunk boundaries
+    chunks = [response_content[i : i + 3] for i in range(0, len(response_content), 3)]
+    parser = CollectedDataStreamParser()
+
+    released = _feed_all(parser, chunks)
+
+    assert released == "Thanks, I have your order."
+    response = parser.to_response()
+    assert response.reply == "Thanks, I have your order."
+    assert response.collected_data == collected_data
+
+
+def test_stream_parser_releases_text_before_block_completes():
+    parser = CollectedDataStreamParser()
+
+    assert parser.feed("Hello! <COLL") == "Hello! "
+    assert parser.feed('ECTED_DATA>{"order_number": 7}') == ""
+    assert parser.feed("</COLLECTED_DATA> Bye") == " Bye"
+    assert parser.finish() == ""
+    assert parser.to_response().collected_data == CollectedData(order_number=7)
+
+
+def test_stream_parser_releases_incomplete_tag_prefix_at_end():
+    parser = CollectedDataStreamParser()
+
+    released = _feed_all(parser, ["Use a <COL", "D pack"])
+
+    assert released == "Use a <COLD pack"
+    assert parser.to_response().reply == "Use a <COLD pack"
+
+
+@patch("chat.utils.logger")
+def test_stream_parser_unterminated_block(m_logger):
+    parser = CollectedDataStreamParser()
+
+    released = _feed_all(parser, ["Sure.", '<COLLECTED_DATA>{"order_nu'])
+
+    assert released == "Sure."
+    response = parser.to_response()
+    assert response.reply == "Sure."
+    assert response.collected_data == CollectedData()
+    m_logger.warning.assert_any_call(
+        "Unterminated <COLLECTED_DATA> block in streamed response."
+    )
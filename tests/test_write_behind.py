@@ -0,0 +1,149 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from storage import (ConversationConflictError, Message, MessageRole,
+                     SQLiteStorage, WriteBehindStorage)
+from storage.write_behind import (coalesced_writes, flush_errors,
+                                  write_conflicts)
+
+
+def add_turn(conversation, content: str) -> None:
+    conversation.messages.extend(
+        [
+            Message(role=MessageRole.USER, content=content),
+            Message(role=MessageRole.ASSISTANT, content=f"Reply to {content}"),
+        ]
+    )
+
+
+class TestWriteBehindStorage:
+    def setup_method(self):
+        self.write_allowed = threading.Event()
+        self.write_allowed.set()
+        self.writing = threading.Event()
+        self.batches = []
+
+    @pytest.fixture(autouse=True)
+    def open_storage(self, tmp_path):
+        self.backend = SQLiteStorage(db_path=str(tmp_path / "db.sqlite3"))
+        write_conversations = self.backend.write_conversations
+
+        def gated_write(writes):
+            self.writing.set()
+            self.write_allowed.wait()
+            self.batches.append([c.session_id for c, _ in writes])
+            return write_conversations(writes)
+
+        self.backend.write_conversations = gated_write
+        self.storage = WriteBehindStorage(
+            self.backend, max_pending=4, flush_interval=0.01
+        )
+        yield
+        self.write_allowed.set()
+        self.storage.close()
+        self.backend.close()
+
+    def write(self, session_id: str, content: str = "Hello"):
+        conversation = self.storage.get_or_create_conversation(session_id)
+        add_turn(conversation, content)
+        self.storage.update_conversation(session_id, conversation)
+        return conversation
+
+    def test_queued_writes_are_read_back(self):
+        self.write_allowed.clear()
+
+        self.write("session")
+
+        assert self.backend.get_conversation("session") is None
+        assert self.storage.get_conversation("session").messages[0].content == "Hello"
+        self.write_allowed.set()
+        assert self.storage.flush(timeout=5)
+        assert self.backend.get_conversation("session").version == 1
+
+    def test_pending_versions_are_coalesced(self):
+        self.write_allowed.clear()
+        self.write("a")
+        # Wait until the writer holds "a", so the next updates queue behind it
+        assert self.writing.wait(timeout=5)
+        coalesced = coalesced_writes.value
+
+        for content in ("Second", "Third", "Fourth"):
+            self.write("a", content)
+        self.write("b")
+        self.write_allowed.set()
+        assert self.storage.flush(timeout=5)
+
+        assert coalesced_writes.value == coalesced + 2
+        assert self.batches == [["a"], ["a", "b"]]
+        stored = self.backend.get_conversation("a")
+        assert stored.version == 4
+        assert len(stored.messages) == 8
+
+    def test_stale_update_is_rejected_while_queued(self):
+        self.write_allowed.clear()
+        stale = self.storage.get_or_create_conversation("session")
+        self.write("session")
+
+        add_turn(stale, "Late")
+        with pytest.raises(ConversationConflictError):
+            self.storage.update_conversation("session", stale)
+
+    def test_full_queue_blocks_updates(self):
+        self.write_allowed.clear()
+        for index in range(5):
+            # The first write is taken by the writer, four more fill the queue
+            self.write(f"s{index}")
+            assert self.writing.wait(timeout=5)
+
+        blocked = threading.Thread(target=self.write, args=("s5",))
+        blocked.start()
+        blocked.join(timeout=0.1)
+        assert blocked.is_alive()
+
+        self.write_allowed.set()
+        blocked.join(timeout=5)
+        assert not blocked.is_alive()
+
+    def test_close_flushes_the_queue(self):
+        for index in range(10):
+            self.write(f"s{index}")
+
+        self.storage.close()
+
+        for index in range(10):
+            assert self.backend.get_conversation(f"s{index}").version == 1
+
+    def test_failed_batch_is_retried(self):
+        errors = flush_errors.value
+        write_conversations = self.backend.write_conversations
+        failures = iter([OSError("disk full")])
+
+        def flaky_write(writes):
+            for error in failures:
+                raise error
+            return write_conversations(writes)
+
+        with patch.object(self.backend, "write_conversations", flaky_write):
+            self.write("session")
+            assert self.storage.flush(timeout=5)
+
+        assert flush_errors.value == errors + 1
+        assert self.backend.get_conversation("session").version == 1
+
+    def test_conflict_with_another_writer_is_dropped(self):
+        conflicts = write_conflicts.value
+        self.write_allowed.clear()
+        self.write("session")
+        # Another worker stores the conversation before the batch is written
+        other = self.backend.get_or_create_conversation("session")
+        add_turn(other, "Other worker")
+        self.backend.update_conversation("session", other)
+
+        self.write_allowed.set()
+        assert self.storage.flush(timeout=5)
+
+        assert write_conflicts.value == conflicts + 1
+        stored = self.backend.get_conversation("session")
+        assert stored.messages[0].content == "Other worker"